@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+from src.db_client import DB_Client
+import src.common as common
+
+CONFIG = common.CONFIG["db_client"]
+ROW_COUNTS = [1000, 10000, 100000]
+INTENTS_PER_CONTEXT = 50
+LOOKUPS = 500
+SLOWEST = 5
+
+def populate(db_client:DB_Client, rows:int):
+    """fills every table with rows rows"""
+    for context in range(rows // INTENTS_PER_CONTEXT):
+        db_client.insert_intents_json({f"intent_{i}": {"matches": [f"match {i}"], "responses": [f"response {i}"], \
+            "link": "initial", "type": "response"} for i in range(INTENTS_PER_CONTEXT)}, f"context_{context}")
+
+    with db_client.conn:
+        db_client.cur.executemany("INSERT INTO users (name) VALUES (?)", [(f"user_{i}",) for i in range(rows)])
+        db_client.cur.executemany("INSERT INTO global_vars (key, val, uid) VALUES (?, ?, ?)", \
+            [(f"var_{i % 10}", f"value {i}", str(i // 10)) for i in range(rows)])
+        db_client.cur.executemany("INSERT INTO skills (skill_name, class) VALUES (?, ?)", \
+            [(f"skill_{i}", "Skill") for i in range(rows)])
+
+def time_lookups(lookup, args:list)->float:
+    """returns the mean latency of the lookups in microseconds"""
+    start = time.perf_counter()
+    for lookup_args in args:
+        lookup(*lookup_args)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+if __name__ == "__main__":
+    print(f"{'rows':>8} {'get_intent':>12} {'get_intents':>12} {'get_global_var':>15} {'get_uid_by_name':>16} " \
+        f"{'get_skill':>10}  (microseconds per lookup)")
+
+    CONFIG["statement_timing"] = True
+    for rows in ROW_COUNTS:
+        with tempfile.TemporaryDirectory() as tempdir:
+            CONFIG["db_name"] = os.path.join(tempdir, "benchmark.db")
+            db_client = DB_Client()
+            db_client.close()
+            db_client.__init__() # connects to this benchmark's database
+            populate(db_client, rows)
+
+            contexts = rows // INTENTS_PER_CONTEXT
+            step = max(1, rows // LOOKUPS)
+            latencies = [
+                time_lookups(db_client.get_intent, [(f"intent_{i % INTENTS_PER_CONTEXT}", \
+                    f"context_{i % contexts}") for i in range(0, rows, step)]),
+                time_lookups(db_client.get_intents, [(f"context_{i % contexts}",) for i in range(0, rows, step)]),
+                time_lookups(db_client.get_global_var, [(f"var_{i % 10}", i // 10) for i in range(0, rows, step)]),
+                time_lookups(db_client.get_uid_by_name, [(f"user_{i}",) for i in range(0, rows, step)]),
+                time_lookups(db_client.get_skill, [(f"skill_{i}",) for i in range(0, rows, step)]),
+            ]
+            print(f"{rows:>8} {latencies[0]:>12.1f} {latencies[1]:>12.1f} {latencies[2]:>15.1f} " \
+                f"{latencies[3]:>16.1f} {latencies[4]:>10.1f}")
+            statement_stats = db_client.stats()
+            db_client.close()
+
+    # the statements are told apart by their ends, the INTENT_COLUMNS queries share their start
+    print(f"\nslowest statements at {ROW_COUNTS[-1]} rows (p99 in microseconds)")
+    for statement, stats in sorted(statement_stats.items(), key=lambda item: -item[1]["p99"])[:SLOWEST]:
+        print(f"{stats['p99'] * 1e6:>10.1f}  {' '.join(statement.split())[-80:]}")
@@ -1,5 +1,6 @@
 # standard imports
 from datetime import datetime
+import logging
 
 # third party imports
 
@@ -14,6 +15,9 @@ def log(text):
         f.write(text)
 
 if __name__ == "__main__":
+    # the log goes to a file, so that it does not interleave with the chat
+    logging.basicConfig(filename=CONFIG["log_file"], level=CONFIG["log_level"], \
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     bot = ConvoFlowMan()
 
     with open("intro.txt", "r") as f:
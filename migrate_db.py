@@ -0,0 +1,25 @@
+import sqlite3
+import sys
+from src.db_client import DB_Client, SCHEMA_VERSION
+import src.common as common
+
+CONFIG = common.CONFIG["db_client"]
+
+if __name__ == "__main__":
+    db_name = sys.argv[1] if len(sys.argv) > 1 else CONFIG["db_name"]
+    CONFIG["db_name"] = db_name
+
+    conn = sqlite3.connect(db_name)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        print(f"{db_name} is up to date (version {version}).")
+        sys.exit()
+
+    backup = sqlite3.connect(db_name + ".bak")
+    conn.backup(backup)
+    backup.close()
+    conn.close()
+    print(f"Backed up {db_name} to {db_name}.bak")
+
+    DB_Client() # migrates the database
+    print(f"Migrated {db_name} from version {version} to {SCHEMA_VERSION}")
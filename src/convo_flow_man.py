@@ -5,7 +5,6 @@ from typing import List, Dict
 import ast
 
 # third party imports
-from tqdm import tqdm
 
 # local imports
 from src.core_intent_matcher.modelAPI import ModelAPI
@@ -150,6 +149,4 @@ class ConvoFlowMan:
         return response
 
     def learn_intents(self, topics:List[Dict]):
-        for topic in tqdm(topics, desc="learning intents"):
-            self.model_api.learn_intents(\
-                topic["intents"], topic["context"])
+        self.model_api.learn_topics(topics)
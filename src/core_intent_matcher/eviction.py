@@ -0,0 +1,313 @@
+# standard imports
+from collections import namedtuple, OrderedDict
+from itertools import chain
+
+# third party imports
+
+# local imports
+
+# this module contains the eviction policies of the ModelPool's queue of
+# cached models. Every policy keeps the same interface, and all of its
+# operations except keys() take constant time.
+
+QueueItem = namedtuple('QueueItem', ['key', 'val'])
+
+class LRUQueue:
+    """holds items with their recency taken into account. The least
+    recently used item is popped out during explicit pop_worst() or
+    when the queue surpasses its capacity. The items are kept in a hash
+    map ordered by a linked list (OrderedDict), most recent last.
+    """
+
+    def __init__(self, init_queue=[], capacity=None):
+        """instantiates the queue
+
+        :param init_queue: initial queue represented as a list of
+        (key, value) pairs, defaults to []. The order of the items
+        determines their relevancy, i.e. the first item is most relevant.
+        :param capacity: limits number of items that can be
+        set, the queue will kick out the least relevant item
+        if the queue is beyond capacity, defaults to None
+        """
+        self.capacity = capacity
+        self.items = OrderedDict()
+        for key, val in reversed(init_queue):
+            self.insert(key, val)
+
+    def setitem(self, key, value)->QueueItem:
+        """sets a key-value pair. A new key is inserted as the
+        most relevant item, after making room for it if the queue
+        is at capacity.
+
+        :param key: sets key of key-value pair
+        :param value: sets value of the key-value pair
+        :return: the item that has been popped to make room
+        for the new key, if any
+        """
+        if key in self:
+            self.update(key, value)
+            return None
+
+        popped_item = None
+        if self.capacity and len(self) >= self.capacity:
+            popped_item = self.pop_worst()
+        self.insert(key, value)
+
+        return popped_item
+
+    def getitem(self, key)->QueueItem:
+        """gets the key-value item of the corresponding key and
+        marks it as used, which raises its relevancy
+
+        :param key: identifying key corresponding to desired value
+        :raises KeyError: if the key is not in the queue
+        :return: QueueItem object which contains the key and value
+        :rtype: QueueItem
+        """
+        self.items.move_to_end(key)
+        return QueueItem(key, self.items[key])
+
+    def __getitem__(self, key)->QueueItem:
+        """purely gets the key-value item of the corresponding key,
+        without altering its relevancy
+
+        :param key: key that corresponds to the desired value
+        :raises KeyError: if the key is not in the queue
+        :return: QueueItem object which contains the key and value
+        :rtype: QueueItem
+        """
+        return QueueItem(key, self.items[key])
+
+    def pop_worst(self)->QueueItem:
+        """pops the least relevant item in queue
+
+        :return: least relevant queue item
+        """
+        return QueueItem(*self.items.popitem(last=False))
+
+    def pop(self, key)->QueueItem:
+        """pops an item in the queue given the key
+
+        :param key: identifying key associated with item
+        :return: popped item, its value is None if the key
+        is not in the queue
+        :rtype: QueueItem
+        """
+        return QueueItem(key, self.items.pop(key, None))
+
+    def peek_best(self)->QueueItem:
+        """peeks at the most relevant item in queue
+
+        :return: most relevant item in queue, None if the queue is empty
+        """
+        if not self.items:
+            return None
+        key = next(reversed(self.items))
+        return QueueItem(key, self.items[key])
+
+    def __len__(self)->int:
+        return len(self.items)
+
+    def __contains__(self, key)->bool:
+        return key in self.items
+
+    def keys(self)->list:
+        """returns all keys, the most relevant first
+
+        :return: all keys in the queue
+        :rtype: list
+        """
+        return list(reversed(self.items))
+
+    def worst_keys(self):
+        """iterates over the keys, the least relevant first. The queue
+        must not be changed during the iteration.
+
+        :return: iterator over the keys
+        """
+        return iter(self.items)
+
+    def insert(self, key, value):
+        self.items[key] = value
+
+    def update(self, key, value):
+        self.items[key] = value
+
+class FrequencyBucket:
+    """node of LFUQueue's linked list of frequencies. It holds the keys
+    used freq times, least recently used first.
+    """
+
+    def __init__(self, freq:int, prev=None, next=None):
+        self.freq = freq
+        self.keys = OrderedDict()
+        self.prev = prev
+        self.next = next
+
+class LFUQueue(LRUQueue):
+    """holds items with their use frequency taken into account. The
+    least frequently used item is popped out, the least recently used
+    one among equally frequent items. Every item sits in the bucket of
+    its frequency, and the buckets form a linked list ordered by
+    frequency, so that using an item moves it to the next bucket.
+    """
+
+    def __init__(self, init_queue=[], capacity=None):
+        self.buckets = {} # key -> FrequencyBucket holding the key
+        self.head = FrequencyBucket(0) # sentinel, head.next is the least frequent bucket
+        self.head.prev = self.head.next = self.head
+        super().__init__(init_queue, capacity)
+
+    def getitem(self, key)->QueueItem:
+        value = self.items[key]
+        bucket = self.buckets[key]
+        if bucket.next is self.head or bucket.next.freq != bucket.freq + 1:
+            self.link_bucket(FrequencyBucket(bucket.freq + 1), bucket)
+        self.move(key, bucket, bucket.next)
+
+        return QueueItem(key, value)
+
+    def pop_worst(self)->QueueItem:
+        key = next(iter(self.head.next.keys))
+        return self.pop(key)
+
+    def pop(self, key)->QueueItem:
+        if key not in self.items:
+            return QueueItem(key, None)
+
+        self.move(key, self.buckets.pop(key), None)
+        return QueueItem(key, self.items.pop(key))
+
+    def peek_best(self)->QueueItem:
+        if not self.items:
+            return None
+        key = next(reversed(self.head.prev.keys))
+        return QueueItem(key, self.items[key])
+
+    def keys(self)->list:
+        keys = []
+        bucket = self.head.prev
+        while bucket is not self.head:
+            keys.extend(reversed(bucket.keys))
+            bucket = bucket.prev
+        return keys
+
+    def worst_keys(self):
+        bucket = self.head.next
+        while bucket is not self.head:
+            yield from bucket.keys
+            bucket = bucket.next
+
+    def insert(self, key, value):
+        self.items[key] = value
+        if self.head.next.freq != 1:
+            self.link_bucket(FrequencyBucket(1), self.head)
+        self.move(key, None, self.head.next)
+
+    def link_bucket(self, bucket:FrequencyBucket, prev:FrequencyBucket):
+        bucket.prev, bucket.next = prev, prev.next
+        prev.next.prev = bucket
+        prev.next = bucket
+
+    def move(self, key, source:FrequencyBucket, target:FrequencyBucket):
+        """moves a key between buckets, unlinking the source bucket
+        if it is left empty
+
+        :param source: bucket holding the key, None for a new key
+        :param target: bucket to move the key to, None to drop the key
+        """
+        if source is not None:
+            del source.keys[key]
+            if not source.keys:
+                source.prev.next, source.next.prev = source.next, source.prev
+        if target is not None:
+            target.keys[key] = None
+            self.buckets[key] = target
+
+class SLRUQueue(LRUQueue):
+    """segmented LRU queue. New items enter a probationary segment and
+    are promoted to a protected segment when they are used again, so
+    that models used only once cannot flush out the models in regular
+    use. The protected segment holds at most protected_ratio of the
+    capacity, its least recently used items are demoted back to the
+    probationary segment, which is where items are popped out from.
+    """
+
+    def __init__(self, init_queue=[], capacity=None, protected_ratio=0.8):
+        """instantiates the queue
+
+        :param protected_ratio: share of the capacity reserved for the
+        protected segment, defaults to 0.8
+        """
+        self.protected = OrderedDict()
+        self.protected_capacity = int(capacity * protected_ratio) if capacity else None
+        super().__init__(init_queue, capacity)
+
+    def getitem(self, key)->QueueItem:
+        if key in self.protected:
+            self.protected.move_to_end(key)
+            return QueueItem(key, self.protected[key])
+
+        value = self.items.pop(key)
+        self.protected[key] = value
+        if self.protected_capacity is not None and len(self.protected) > self.protected_capacity:
+            demoted_key, demoted_value = self.protected.popitem(last=False)
+            self.items[demoted_key] = demoted_value
+
+        return QueueItem(key, value)
+
+    def __getitem__(self, key)->QueueItem:
+        if key in self.protected:
+            return QueueItem(key, self.protected[key])
+        return super().__getitem__(key)
+
+    def pop_worst(self)->QueueItem:
+        if self.items:
+            return super().pop_worst()
+        return QueueItem(*self.protected.popitem(last=False))
+
+    def pop(self, key)->QueueItem:
+        if key in self.protected:
+            return QueueItem(key, self.protected.pop(key))
+        return super().pop(key)
+
+    def peek_best(self)->QueueItem:
+        if self.protected:
+            key = next(reversed(self.protected))
+            return QueueItem(key, self.protected[key])
+        return super().peek_best()
+
+    def __len__(self)->int:
+        return len(self.items) + len(self.protected)
+
+    def __contains__(self, key)->bool:
+        return key in self.items or key in self.protected
+
+    def keys(self)->list:
+        return list(reversed(self.protected)) + list(reversed(self.items))
+
+    def worst_keys(self):
+        return chain(self.items, self.protected)
+
+    def update(self, key, value):
+        if key in self.protected:
+            self.protected[key] = value
+        else:
+            self.items[key] = value
+
+POLICIES = {"lru": LRUQueue, "lfu": LFUQueue, "slru": SLRUQueue}
+
+def make_queue(policy:str, init_queue=[], capacity=None)->LRUQueue:
+    """builds the queue of an eviction policy
+
+    :param policy: 'lru', 'lfu' or 'slru'
+    :type policy: str
+    :param init_queue: initial (key, value) pairs, most relevant first
+    :param capacity: maximum number of items, defaults to None
+    :raises ValueError: if the policy is unknown
+    :return: the queue
+    :rtype: LRUQueue
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown eviction policy '{policy}'.")
+    return POLICIES[policy](init_queue, capacity)
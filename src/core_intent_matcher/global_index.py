@@ -0,0 +1,286 @@
+# standard imports
+from itertools import groupby
+
+# third party imports
+import numpy as np
+from scipy import sparse
+
+# local imports
+from src.core_intent_matcher.model import Model, make_retriever, CONFIG
+from src.core_intent_matcher.retrieval import TopKRetriever
+
+class GlobalModel(Model):
+    """single classifier model holding the intents of every context: one
+    vocabulary, one idf and one tf-idf matrix. The rows are kept grouped by
+    context, so the intents of a context are a contiguous slice of the
+    matrix and switching context costs neither I/O nor copying. The idf is
+    shared by all contexts.
+
+    The model is only updated through partial_fit() and forget(), which
+    keep track of the context of every row.
+    """
+
+    def __init__(self):
+        """instantiates the GlobalModel class
+        """
+        self.row_contexts = []
+        self.contexts = []
+        self.ranges = {}
+        self.context_retrievers = {}
+        super().__init__()
+
+    def add_context(self, context:str):
+        """registers a context, which has no intents yet. Registering
+        a new context bumps the model version.
+
+        :param context: name of the context
+        :type context: str
+        """
+        if context not in self.contexts:
+            self.contexts.append(context)
+            self.version += 1
+
+    def copy(self):
+        model = super().copy()
+        model.row_contexts = list(self.row_contexts)
+        model.contexts = list(self.contexts)
+        model.ranges = dict(self.ranges)
+        model.context_retrievers = dict(self.context_retrievers)
+        return model
+
+    def has_context(self, context:str)->bool:
+        return context in self.contexts
+
+    def context(self, context:str):
+        """returns the view of a context, which behaves like the Model
+        of that context
+
+        :param context: name of the context
+        :type context: str
+        :raises KeyError: if the context is not registered
+        :return: view of the context
+        :rtype: ContextModel
+        """
+        if not self.has_context(context):
+            raise KeyError(context)
+        return ContextModel(self, context)
+
+    def intents(self, context:str)->list:
+        """returns the intentIDs of a context
+
+        :param context: name of the context
+        :type context: str
+        :return: intentIDs of the context
+        :rtype: list
+        """
+        start, end = self.ranges.get(context, (0, 0))
+        return self.y_all[start:end]
+
+    def partial_fit(self, x_and_y:list, context:str=None):
+        """adds intents or matches incrementally, see Model.partial_fit().
+        New intentIDs are added to the given context.
+
+        :param x_and_y: rows/tuples of (intentID, matches)
+        :type x_and_y: list
+        :param context: context of the new intents, defaults to None
+        :type context: str
+        :raises ValueError: if new intents are given without a context
+        """
+        known = set(self.y_all)
+        new = [intentID for intentID in dict.fromkeys(intentID for intentID, _ in x_and_y) if intentID not in known]
+        if new and context is None:
+            raise ValueError("the context of new intents must be given.")
+
+        if context is not None:
+            self.add_context(context)
+        self.row_contexts.extend([context] * len(new))
+        super().partial_fit(x_and_y)
+
+    def forget(self, intentIDs:list):
+        """removes intents incrementally, see Model.forget()
+
+        :param intentIDs: intentIDs of the intents to remove
+        :type intentIDs: list
+        """
+        rows = sorted({self.y_all.index(intentID) for intentID in intentIDs if intentID in self.y_all})
+        for row in reversed(rows):
+            del self.row_contexts[row]
+        super().forget(intentIDs)
+
+    def forget_context(self, context:str):
+        """removes a context and all of its intents
+
+        :param context: name of the context
+        :type context: str
+        """
+        self.forget(self.intents(context))
+        if context in self.contexts:
+            self.contexts.remove(context)
+
+    def update_retriever(self):
+        """regroups the rows by context, then rebuilds the retriever and
+        bumps the model version. Intents added since the last update are
+        moved next to the other intents of their context.
+        """
+        order = sorted(range(len(self.y_all)), key=self.row_contexts.__getitem__)
+        if order != list(range(len(order))):
+            self.tfidf_vectorizer.reorder_rows(order)
+            self.y_all = [self.y_all[i] for i in order]
+            self.row_contexts = [self.row_contexts[i] for i in order]
+            if self.x_all is not None:
+                self.x_all = [self.x_all[i] for i in order]
+
+        super().update_retriever()
+
+    def build_retriever(self, matrix, normalized=False):
+        """builds the shared tf-idf matrix and the row range of every
+        context. The retrievers of the contexts are built lazily.
+
+        :param matrix: tf-idf matrix, rows grouped by context
+        :param normalized: whether the rows are already l2 normalized
+        """
+        self.retriever = TopKRetriever(matrix, self.y_all, normalized)
+        self.tfidf_matrix = self.retriever.matrix
+
+        self.ranges = {}
+        start = 0
+        for context, rows in groupby(self.row_contexts):
+            end = start + len(list(rows))
+            self.ranges[context] = (start, end)
+            start = end
+        self.context_retrievers = {}
+
+    def context_retriever(self, context:str)->TopKRetriever:
+        """returns the retriever of a context, built over a view of the
+        context's rows of the shared tf-idf matrix
+
+        :param context: name of the context
+        :type context: str
+        :return: retriever of the context
+        :rtype: TopKRetriever
+        """
+        try:
+            return self.context_retrievers[context]
+        except KeyError:
+            pass
+
+        start, end = self.ranges.get(context, (0, 0))
+        matrix = self.tfidf_matrix
+        first, last = matrix.indptr[start], matrix.indptr[end]
+        rows = sparse.csr_matrix((matrix.data[first:last], matrix.indices[first:last], \
+            matrix.indptr[start:end + 1] - first), shape=(end - start, matrix.shape[1]))
+
+        retriever = self.context_retrievers[context] = make_retriever(rows, self.y_all[start:end], normalized=True)
+        return retriever
+
+    def nbytes(self)->int:
+        # the retrievers of the contexts share the data of the tf-idf matrix
+        shared = sum(retriever.matrix.data.nbytes + retriever.matrix.indices.nbytes \
+            for retriever in self.context_retrievers.values())
+        return super().nbytes() + sum(retriever.nbytes() for retriever in self.context_retrievers.values()) - shared
+
+    def predict(self, user_input:str, context:str):
+        """predicts the intent of an input among the intents of a context
+
+        :param user_input: input to predict on
+        :type user_input: str
+        :param context: context to predict in
+        :type context: str
+        :return: possible intents in the format of Model.predict()
+        """
+        return self.predict_batch([user_input], context)[0]
+
+    def predict_batch(self, user_inputs:list, context:str):
+        """predicts the intents of many inputs among the intents of a context
+
+        :param user_inputs: inputs to predict on
+        :type user_inputs: list
+        :param context: context to predict in
+        :type context: str
+        :return: possible intents per input, in the format of Model.predict()
+        """
+        user_inputs_tfidf = self.tfidf_vectorizer.transform(user_inputs)
+        return self.context_retriever(context).top_k(user_inputs_tfidf, CONFIG["possible_intents"], CONFIG["batch_size"])
+
+    def to_arrays(self)->tuple:
+        arrays, meta = super().to_arrays()
+        arrays["row_contexts"] = np.asarray(self.row_contexts, dtype=str)
+        arrays["contexts"] = np.asarray(self.contexts, dtype=str)
+
+        return arrays, meta
+
+    def from_arrays(self, arrays:dict, meta:dict):
+        self.row_contexts = arrays["row_contexts"].tolist()
+        self.contexts = arrays["contexts"].tolist()
+        super().from_arrays(arrays, meta)
+
+class ContextModel:
+    """view of one context of a GlobalModel, offering the interface of Model
+    that ModelAPI and ModelDataManager use
+    """
+
+    def __init__(self, index:GlobalModel, context:str):
+        """instantiates the ContextModel class
+
+        :param index: global model holding the context
+        :type index: GlobalModel
+        :param context: name of the context
+        :type context: str
+        """
+        self.index = index
+        self.context = context
+        self.x_and_y = []
+
+    @property
+    def version(self)->int:
+        return self.index.version
+
+    def copy(self):
+        """returns a view of the same context in a copy of the global
+        model, see Model.copy()
+
+        :return: view of the context in the copy
+        :rtype: ContextModel
+        """
+        view = ContextModel(self.index.copy(), self.context)
+        view.x_and_y = list(self.x_and_y)
+        return view
+
+    @property
+    def dirty(self)->bool:
+        return self.index.dirty
+
+    @property
+    def y_all(self)->list:
+        return self.index.intents(self.context)
+
+    def predict(self, user_input:str):
+        return self.index.predict(user_input, self.context)
+
+    def predict_batch(self, user_inputs:list):
+        return self.index.predict_batch(user_inputs, self.context)
+
+    def partial_fit(self, x_and_y:list):
+        self.index.partial_fit(x_and_y, self.context)
+
+    def forget(self, intentIDs:list):
+        self.index.forget(intentIDs)
+
+    def prepare_data(self, x_and_y:list, override=False):
+        """buffers the intents that train_and_test() will train the
+        context on
+
+        :param x_and_y: rows/tuples of (intentID, matches)
+        :type x_and_y: list
+        :param override: discards the previously buffered intents if True
+        """
+        if override:
+            self.x_and_y = []
+        self.x_and_y.extend(x_and_y)
+
+    def train_and_test(self):
+        """replaces the intents of the context with the buffered ones
+        """
+        self.index.forget(self.index.intents(self.context))
+        self.index.partial_fit(self.x_and_y, self.context)
+        self.x_and_y = []
@@ -0,0 +1,78 @@
+# standard imports
+from bisect import bisect_left
+import threading
+
+# third party imports
+
+# local imports
+
+# upper bounds of the histogram buckets in seconds, from 0.1ms to 10s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class LatencyHistogram:
+    """thread-safe histogram of latencies with fixed bucket bounds, so
+    that recording a latency takes constant time and memory. Percentiles
+    are estimated as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, buckets:tuple=BUCKETS):
+        """instantiates the LatencyHistogram class
+
+        :param buckets: ascending upper bounds of the buckets in seconds,
+        defaults to BUCKETS. Latencies beyond the last bound are counted
+        in an overflow bucket.
+        :type buckets: tuple
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds:float):
+        """records a latency
+
+        :param seconds: the latency in seconds
+        :type seconds: float
+        """
+        with self.lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, q:float)->float:
+        """estimates a percentile of the recorded latencies
+
+        :param q: the percentile, between 0 and 100
+        :type q: float
+        :return: upper bound of the bucket holding the percentile, the
+        max latency for the overflow bucket, 0.0 if nothing was recorded
+        :rtype: float
+        """
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = q / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def stats(self)->dict:
+        """returns the count, mean, max and estimated percentiles of the
+        latencies along with the bucket counts
+
+        :return: count, mean, p50, p90, p99 and max in seconds, and the
+        count of every bucket keyed by its upper bound ('inf' for the
+        overflow bucket)
+        :rtype: dict
+        """
+        percentiles = {f"p{q}": self.percentile(q) for q in (50, 90, 99)}
+        with self.lock:
+            buckets = dict(zip([*map(str, self.buckets), "inf"], self.counts))
+            return {"count": self.count, "mean": self.total / self.count if self.count else 0.0, \
+                **percentiles, "max": self.max, "buckets": buckets}
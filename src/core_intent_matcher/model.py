@@ -1,13 +1,14 @@
 # standard imports
 import os
 import ast
+import copy
+import sys
+import threading
+from collections import OrderedDict
 # third party imports
-from nltk.corpus import stopwords
 from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.feature_extraction.text import TfidfTransformer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.linear_model import LogisticRegression
 from sklearn.neural_network import MLPClassifier
 from sklearn.metrics import f1_score, confusion_matrix
@@ -16,14 +17,149 @@ import numpy as np
 from nltk.stem.porter import PorterStemmer
 # local imports
 import src.common as common
+from src.core_intent_matcher.retrieval import TopKRetriever, InvertedIndexRetriever
+from src.core_intent_matcher.tfidf import IncrementalTfidf, HashingTfidf
+import src.core_intent_matcher.model_format as model_format
 
 CONFIG = common.CONFIG["classifier"]
 
+class StemCache:
+    """bounded token to stem memo. The least recently used tokens
+    are dropped once the cache is beyond capacity. It is shared
+    by every model, so it is guarded by a lock.
+    """
+
+    def __init__(self, stemmer:PorterStemmer, capacity:int):
+        """instantiates the StemCache class
+
+        :param stemmer: stemmer to memoize
+        :type stemmer: PorterStemmer
+        :param capacity: maximum number of tokens to remember
+        :type capacity: int
+        """
+        self.stemmer = stemmer
+        self.capacity = capacity
+        self.stems = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def stem(self, token:str)->str:
+        """stems a token, using the memoized stem if there is one
+
+        :param token: token to stem
+        :type token: str
+        :return: stem of the token
+        :rtype: str
+        """
+        with self.lock:
+            try:
+                stem = self.stems[token]
+                self.stems.move_to_end(token)
+                self.hits += 1
+            except KeyError:
+                stem = self.stems[token] = self.stemmer.stem(token)
+                self.misses += 1
+                self.changed = True
+                if len(self.stems) > self.capacity:
+                    self.stems.popitem(last=False)
+
+        return stem
+
+    def stats(self)->dict:
+        """returns the size and hit/miss counters of the cache
+
+        :return: size, capacity, hits, misses and hit rate of the cache
+        :rtype: dict
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.stems), "capacity": self.capacity, "hits": self.hits, \
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def snapshot(self)->dict:
+        """copies the memoized stems for saving them, after which the
+        cache counts as unchanged
+
+        :return: token to stem mapping
+        :rtype: dict
+        """
+        with self.lock:
+            self.changed = False
+            return dict(self.stems)
+
+    def dump(self, filepath:str, stems:dict=None):
+        """saves the memoized stems to a file. The file is written under
+        a temporary name and then renamed over the old one.
+
+        :param filepath: file to save the stems to
+        :type filepath: str
+        :param stems: snapshot() of the stems to save, defaults to None
+        in which case a snapshot is taken now
+        :type stems: dict
+        """
+        joblib.dump(self.snapshot() if stems is None else stems, filepath + ".tmp")
+        os.replace(filepath + ".tmp", filepath)
+
+    def load(self, filepath:str):
+        """adds the stems saved in a file to the cache
+
+        :param filepath: file that the stems were saved to
+        :type filepath: str
+        """
+        stems = joblib.load(filepath)
+        with self.lock:
+            for token, stem in stems.items():
+                self.stems[token] = stem
+            while len(self.stems) > self.capacity:
+                self.stems.popitem(last=False)
+
 stemmer = PorterStemmer()
+stem_cache = StemCache(stemmer, CONFIG["stem_cache_size"])
 analyzer = CountVectorizer().build_analyzer()
 
 def stemming_analyzer(doc):
-    return (stemmer.stem(w) for w in analyzer(doc))
+    return (stem_cache.stem(w) for w in analyzer(doc))
+
+def make_featurizer(features:str=None, n_features:int=None, alternate_sign:bool=None)->IncrementalTfidf:
+    """builds the featurizer selected by classifier.features: 'vocabulary'
+    learns a vocabulary per model, 'hashing' hashes terms into
+    classifier.n_features columns
+
+    :param features: overrides classifier.features, defaults to None
+    :type features: str
+    :param n_features: overrides classifier.n_features, defaults to None
+    :type n_features: int
+    :param alternate_sign: whether hashed counts are signed. Defaults to
+    None, in which case they are signed unless classifier.retriever is
+    'inverted_index', which needs non-negative weights
+    :type alternate_sign: bool
+    :return: the featurizer
+    :rtype: IncrementalTfidf
+    """
+    if (features or CONFIG["features"]) == "hashing":
+        if alternate_sign is None:
+            alternate_sign = CONFIG["retriever"] != "inverted_index"
+        return HashingTfidf(stemming_analyzer, n_features or CONFIG["n_features"], alternate_sign)
+    return IncrementalTfidf(stemming_analyzer)
+
+def make_retriever(matrix, labels:list, normalized=False)->TopKRetriever:
+    """builds the retrieval engine selected by classifier.retriever:
+    'brute_force' scores every row, 'inverted_index' only the rows that
+    share terms with the query. Matrices with negative weights, i.e. of
+    models hashed with signed counts, are always scored by brute force.
+
+    :param matrix: one tf-idf row per label
+    :param labels: labels (intentIDs) corresponding to the matrix rows
+    :type labels: list
+    :param normalized: whether the rows are already l2 normalized
+    :return: the retrieval engine
+    :rtype: TopKRetriever
+    """
+    if CONFIG["retriever"] == "inverted_index" and not (matrix.data < 0).any():
+        return InvertedIndexRetriever(matrix, labels, normalized, CONFIG["max_score"])
+    return TopKRetriever(matrix, labels, normalized)
 
 class Model:
 
@@ -33,6 +169,10 @@ class Model:
 
         self.x_all = []
         self.y_all = []
+        self.version = 0
+        self.saved_version = None
+        self.tfidf_vectorizer = make_featurizer()
+        self.build_retriever(self.tfidf_vectorizer.tfidf_matrix())
 
     
     def prepare_data(self, x_and_y:list, override=False):
@@ -43,10 +183,15 @@ class Model:
         :param intents: rows/tuples of intents from database as a list,
         the tuples must contain the following: (intentID, matches).
         The intentID must be the same as in the database.
+        :param override: discards the previously prepared data if True
+        :raises ValueError: if the model was loaded from the compact format
+        and override is False, as its training text is not kept
         """
         if override:
             self.x_all = []
             self.y_all = []
+        elif self.x_all is None:
+            raise ValueError("the training text of a loaded model is not kept, prepare the data with override=True.")
 
 
         for intentID, matches in x_and_y:
@@ -64,12 +209,116 @@ class Model:
         must be performed after prepare_data() has
         been invoked.
 
-        :param filepath: saves the model to the specified 
-        filepath as a .joblib file
+        :raises ValueError: if the model was loaded from the compact
+        format, which does not keep the training text. prepare_data()
+        must be invoked with override=True first.
+        """
+        if self.x_all is None:
+            raise ValueError("the training text of a loaded model is not kept, prepare the data with override=True.")
+
+        self.tfidf_vectorizer = make_featurizer()
+        self.tfidf_vectorizer.fit_transform(self.x_all)
+        self.update_retriever()
+
+    def partial_fit(self, x_and_y:list):
+        """adds intents or matches to a trained model incrementally.
+        Only the new matches are analyzed: new intentIDs become new rows,
+        known intentIDs have their row extended and only the idf of the
+        affected terms changes.
+
+        :param x_and_y: rows/tuples of (intentID, matches), like in
+        prepare_data()
+        :type x_and_y: list
+        """
+        rows = {intentID: i for i, intentID in enumerate(self.y_all)}
+        extended_docs = {}
+        new_docs = {}
+        for intentID, matches in x_and_y:
+            docs = extended_docs if intentID in rows else new_docs
+            doc = ' '.join(matches)
+            docs[intentID] = docs[intentID] + " " + doc if intentID in docs else doc
+
+        if self.x_all is None:
+            self.y_all.extend(new_docs)
+        else:
+            self.prepare_data(x_and_y)
+        if extended_docs:
+            self.tfidf_vectorizer.extend_rows([rows[intentID] for intentID in extended_docs], list(extended_docs.values()))
+        if new_docs:
+            self.tfidf_vectorizer.add_rows(list(new_docs.values()))
+        self.update_retriever()
+
+    def forget(self, intentIDs:list):
+        """removes intents from a trained model incrementally
+
+        :param intentIDs: intentIDs of the intents to remove
+        :type intentIDs: list
+        """
+        rows = sorted({self.y_all.index(intentID) for intentID in intentIDs if intentID in self.y_all})
+        for row in reversed(rows):
+            if self.x_all is not None:
+                del self.x_all[row]
+            del self.y_all[row]
+
+        self.tfidf_vectorizer.remove_rows(rows)
+        self.update_retriever()
+
+    def update_retriever(self):
+        """rebuilds the retriever from the featurizer's current tf-idf matrix
+        and bumps the model version
+        """
+        self.build_retriever(self.tfidf_vectorizer.tfidf_matrix())
+        self.version += 1
+
+    def build_retriever(self, matrix, normalized=False):
+        """builds the retriever over a tf-idf matrix whose rows
+        correspond to y_all
+
+        :param matrix: tf-idf matrix, one row per intent
+        :param normalized: whether the rows are already l2 normalized
+        """
+        self.retriever = make_retriever(matrix, self.y_all, normalized)
+        self.tfidf_matrix = self.retriever.matrix
+
+    def nbytes(self)->int:
+        """estimates the memory held by the model: its featurizer,
+        retriever and training data. Memory mapped arrays are counted
+        as if they were resident.
+
+        :return: size in bytes
+        :rtype: int
+        """
+        data = sys.getsizeof(self.y_all) + sum(map(sys.getsizeof, self.y_all))
+        if self.x_all is not None:
+            data += sys.getsizeof(self.x_all) + sum(map(sys.getsizeof, self.x_all))
+        return self.tfidf_vectorizer.nbytes() + self.retriever.nbytes() + data
+
+    def copy(self):
+        """returns a copy of the model that can be updated while this
+        one keeps serving. The copy shares the matrices and arrays, which
+        updates replace rather than alter, so copying only takes time in
+        the number of intents and terms.
+
+        :return: the copy
+        :rtype: Model
         """
+        model = copy.copy(self)
+        model.y_all = list(self.y_all)
+        model.x_all = None if self.x_all is None else list(self.x_all)
+        model.tfidf_vectorizer = self.tfidf_vectorizer.copy()
+        return model
+
+    def mapped_nbytes(self)->int:
+        """estimates the part of nbytes() that is memory mapped from the
+        model's files rather than private to the process
 
-        self.tfidf_vectorizer = TfidfVectorizer(stop_words=stopwords.words('english'), analyzer=stemming_analyzer)
-        self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.x_all)
+        :return: size in bytes
+        :rtype: int
+        """
+        featurizer = self.tfidf_vectorizer
+        arrays = [self.tfidf_matrix.data, self.tfidf_matrix.indices, self.tfidf_matrix.indptr, \
+            featurizer.counts.data, featurizer.counts.indices, featurizer.counts.indptr, featurizer.df, featurizer.idf_]
+        return sum(array.nbytes for array in arrays if model_format.is_mapped(array))
 
     def predict(self, user_input:str):
         """use the saved classifier model to
@@ -77,16 +326,127 @@ class Model:
 
         :param user_input: input on which the classifier
         will use to predict the label
-        :return: a tuple containing the predicted label,
-        confidence level and other possible labels in stated order.
+        :return: a list of the most similar intents as (intentID, similarity)
+        tuples, the predicted intent first. At most
+        classifier.possible_intents intents are returned.
         """
 
-        user_input = [user_input]
-        user_input_tfidf = self.tfidf_vectorizer.transform(user_input)
-        similarities = cosine_similarity(user_input_tfidf, self.tfidf_matrix)
-        possible_idx = list(similarities.argsort()[0])
-        similarities_sorted = list(np.sort(similarities)[0])
-        idx_n_sims = list(zip(possible_idx, similarities_sorted))
-        possible_intents = [(self.y_all[idx], sim) for idx, sim in idx_n_sims][::-1]
+        return self.predict_batch([user_input])[0]
+
+    def predict_batch(self, user_inputs:list):
+        """predict the labels of many inputs at once. The inputs are
+        transformed with a single vectorizer call and scored with one
+        sparse matrix product per classifier.batch_size inputs.
+
+        :param user_inputs: inputs on which the classifier
+        will use to predict the labels
+        :return: one list of possible intents per input, in the same
+        format and order as returned by predict()
+        """
+
+        user_inputs_tfidf = self.tfidf_vectorizer.transform(user_inputs)
+        return self.retriever.top_k(user_inputs_tfidf, CONFIG["possible_intents"], CONFIG["batch_size"])
+
+    def save(self, dirpath:str):
+        """saves the model in the compact format of model_format: CSR
+        arrays of the tf-idf matrix and term counts, the vocabulary, the
+        document frequencies, idf and intentIDs. The training text
+        is not saved.
+
+        :param dirpath: directory to save the model into
+        :type dirpath: str
+        """
+        model_format.save_arrays(dirpath, *self.to_arrays())
+        self.saved_version = self.version
+
+    @classmethod
+    def load(cls, dirpath:str, mmap=True, read_only=False):
+        """loads a model saved by save(). The arrays are memory mapped
+        copy-on-write, so loading does not read the matrices and
+        updating the model does not alter the files.
+
+        :param dirpath: directory the model was saved into
+        :type dirpath: str
+        :param mmap: memory maps the arrays if True, defaults to True
+        :param read_only: maps the arrays read-only, so that processes
+        loading the same model share its memory. The model cannot be
+        updated then. Defaults to False
+        :return: the loaded model
+        :rtype: Model
+        """
+        model = cls()
+        model.from_arrays(*model_format.load_arrays(dirpath, mmap, read_only))
+        model.saved_version = model.version
+
+        return model
+
+    @property
+    def dirty(self)->bool:
+        """whether the model changed since it was last saved or loaded
+
+        :return: True if the model has unsaved changes
+        :rtype: bool
+        """
+        return self.version != self.saved_version
+
+    def to_arrays(self)->tuple:
+        """splits the model into the arrays and metadata that save() stores.
+        Hashing featurizers have no vocabulary and only the nonzero document
+        frequencies are stored, their idf is recomputed on load. The arrays
+        are a snapshot: later updates of the model do not alter them.
+
+        :return: arrays keyed by name and the metadata
+        :rtype: Tuple[dict, dict]
+        """
+        featurizer = self.tfidf_vectorizer
+        arrays = {
+            "intent_ids": np.asarray(self.y_all, dtype=np.int64),
+            **model_format.csr_to_arrays("tfidf", self.tfidf_matrix, np.float32),
+            **model_format.csr_to_arrays("counts", featurizer.counts.tocsr(), np.int32),
+        }
+        if isinstance(featurizer, HashingTfidf):
+            features = "hashing"
+            alternate_sign = featurizer.alternate_sign
+            arrays["df_cols"] = np.flatnonzero(featurizer.df).astype(np.int32)
+            arrays["df"] = np.asarray(featurizer.df[arrays["df_cols"]], dtype=np.int32)
+        else:
+            features = "vocabulary"
+            alternate_sign = None
+            terms = [None] * len(featurizer.vocabulary_)
+            for term, col in featurizer.vocabulary_.items():
+                terms[col] = term
+            arrays["vocabulary"] = np.asarray(terms, dtype=str)
+            arrays["df"] = np.array(featurizer.df, dtype=np.int32)
+            arrays["idf"] = np.array(featurizer.idf_, dtype=np.float64)
+        meta = {"version": self.version, "n_intents": len(self.y_all), "n_terms": featurizer.counts.shape[1], \
+            "features": features, "alternate_sign": alternate_sign}
+
+        return arrays, meta
+
+    def from_arrays(self, arrays:dict, meta:dict):
+        """restores the model from the arrays and metadata of to_arrays()
+
+        :param arrays: arrays keyed by name
+        :type arrays: dict
+        :param meta: metadata of the model
+        :type meta: dict
+        """
+        shape = (meta["n_intents"], meta["n_terms"])
+
+        self.x_all = None
+        self.y_all = arrays["intent_ids"].tolist()
+        self.version = meta["version"]
+
+        # hashed models saved before alternate_sign was recorded have signed counts
+        featurizer = make_featurizer(meta.get("features", "vocabulary"), meta["n_terms"], meta.get("alternate_sign", True))
+        featurizer.counts = model_format.csr_from_arrays("counts", arrays, shape)
+        if isinstance(featurizer, HashingTfidf):
+            featurizer.df[arrays["df_cols"]] = arrays["df"]
+            featurizer._update_idf()
+        else:
+            featurizer.vocabulary_ = {term: col for col, term in enumerate(arrays["vocabulary"].tolist())}
+            featurizer.df = arrays["df"]
+            featurizer.idf_ = arrays["idf"]
+        self.tfidf_vectorizer = featurizer
 
-        return possible_intents
\ No newline at end of file
+        self.build_retriever(model_format.csr_from_arrays("tfidf", arrays, shape), normalized=True)
@@ -1,37 +1,152 @@
 # standard imports
 import json
-from typing import List
+import time
+from typing import List, Tuple, Iterable
 # third party imports
 
 # local imports
 from src.db_client import DB_Client
-from src.core_intent_matcher.model_pool import ModelPool
+from src.core_intent_matcher.model_pool import ModelPool, ModelNotFoundError
 from src.core_intent_matcher.model_data_man import ModelDataManager
+from src.core_intent_matcher.prediction_cache import PredictionCache
 import src.common as common
 
+CONFIG = common.CONFIG["model"]
+
 class ModelAPI:
     """an interface to the subsystem that handles all
     classifier models of the chatbot.
+
+    When the model pool serves shared models, predictions pick up the
+    models retrained by the training process via refresh(), at most
+    every model.refresh_interval seconds.
     """
     def __init__(self):
         self.model_pool = ModelPool()
         self.data_man = ModelDataManager()
         self.db_client = DB_Client()
+        self.prediction_cache = PredictionCache()
+        self.refreshed_at = time.monotonic()
 
     def predict(self, user_input:str, context:str)->common.Prediction:
-        with self.model_pool.GetModel(context, True) as model:
-            possible_intents = model.predict(user_input)
-            predicted_intent = possible_intents[0][0]
-            confidence = possible_intents[0][1]
-            intent_row = self.db_client.get_intent_by_idx(predicted_intent)
-        
+        """predicts the intent of an input in a context. The models of
+        the contexts that the context links to are prefetched, the
+        predicted intent's next context first. The prediction is
+        cached under the version of the model that made it.
+
+        :param user_input: input to predict on
+        :type user_input: str
+        :param context: context to predict in
+        :type context: str
+        :return: the prediction
+        :rtype: common.Prediction
+        """
+        self.refresh_if_due()
+        prediction = self.prediction_cache.get(user_input, context)
+        if prediction is None:
+            with self.model_pool.GetModel(context, True) as model:
+                possible_intents = model.predict(user_input)
+                version = model.version
+                intent_row = self.db_client.get_intent_by_idx(possible_intents[0][0])
+
+            prediction = self.to_prediction(intent_row, possible_intents)
+            self.prediction_cache.put(user_input, context, prediction, version)
+
+        self.model_pool.prefetch([prediction.next_context, *self.data_man.links(context)])
+        return prediction
+
+    def predict_many(self, queries:Iterable[Tuple[str,str]])->List[common.Prediction]:
+        """predicts the intents of many (user_input, context) pairs. Cached
+        predictions are reused, the other inputs are grouped by context
+        so that every context model is fetched once and scored in a
+        single batch, and the predicted intent rows are resolved with
+        one bulk query. The new predictions are cached like predict()'s.
+
+        :param queries: (user_input, context) pairs
+        :type queries: Iterable[Tuple[str,str]]
+        :return: predictions in the same order as the queries
+        :rtype: List[common.Prediction]
+        """
+        self.refresh_if_due()
+        predictions = []
+        by_context = {}
+        for i, (user_input, context) in enumerate(queries):
+            predictions.append(self.prediction_cache.get(user_input, context))
+            if predictions[-1] is None:
+                positions, user_inputs = by_context.setdefault(context, ([], []))
+                positions.append(i)
+                user_inputs.append(user_input)
+
+        results = {}
+        for context, (positions, user_inputs) in by_context.items():
+            with self.model_pool.GetModel(context, True) as model:
+                version = model.version
+                for i, user_input, possible_intents in zip(positions, user_inputs, model.predict_batch(user_inputs)):
+                    results[i] = (user_input, context, version, possible_intents)
+        if not results:
+            return predictions
+
+        intent_rows = self.db_client.get_intents_by_idx(\
+            [possible_intents[0][0] for _, _, _, possible_intents in results.values()])
+        for i, (user_input, context, version, possible_intents) in results.items():
+            predictions[i] = self.to_prediction(intent_rows[possible_intents[0][0]], possible_intents)
+            self.prediction_cache.put(user_input, context, predictions[i], version)
+        return predictions
+
+    @staticmethod
+    def to_prediction(intent_row:tuple, possible_intents:list)->common.Prediction:
+        confidence = possible_intents[0][1]
         return common.Prediction(intent_row[0], intent_row[3], intent_row[5], intent_row[6], confidence, possible_intents)
 
-    def learn_intents(self, intents:dict, context:str):
-        self.data_man.add_intents(intents, context)
+    def refresh(self):
+        """picks up the models retrained by the training process when
+        the model pool serves shared models, and drops the cached
+        predictions of the changed contexts
+        """
+        for model_name in self.model_pool.refresh():
+            try:
+                version = self.model_version(model_name)
+            except ModelNotFoundError: # removed by the training process
+                version = None
+            self.data_man.invalidate(model_name, version)
+
+    def refresh_if_due(self):
+        if self.model_pool.shared and time.monotonic() - self.refreshed_at >= CONFIG["refresh_interval"]:
+            self.refreshed_at = time.monotonic()
+            self.refresh()
+
+    def model_version(self, context:str)->int:
+        """returns the version of a context's model, which increases
+        with every change of the model, including rollbacks
+
+        :param context: context of the model
+        :type context: str
+        :return: the version
+        :rtype: int
+        """
+        return self.model_pool[context].version
+
+    def rollback(self, context:str)->int:
+        """reinstates the previous version of a context's model. With a
+        global index, every context is rolled back.
+
+        :param context: context of the model
+        :type context: str
+        :return: the new version of the model
+        :rtype: int
+        """
+        version = self.model_pool.rollback(context)
+        self.data_man.invalidate(context, version)
+        return version
+
+    def learn_intents(self, intents:dict, context:str, replace=False):
+        self.data_man.add_intents(intents, context, replace)
+
+    def learn_topics(self, topics:List[dict], replace=False):
+        self.data_man.add_topics(topics, replace)
 
     def forget_intent(self, intent:str, context:str):
         self.data_man.remove_intent(intent, context)
 
-    def add_intent_matches(self, intentID:int, matches:List[str]):
-        self.data_man.add_intent_matches(intentID, matches)
\ No newline at end of file
+    def add_intent_matches(self, intentID:int, matches:List[str])->bool:
+        return self.data_man.add_intent_matches(intentID, matches)
\ No newline at end of file
@@ -1,25 +1,56 @@
 # standard imports
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict
+import multiprocessing
+import os
 
 # third party imports
+from tqdm import tqdm
 
 # local imports
 import src.common as common
 from src.core_intent_matcher.model_pool import ModelPool, ModelNotFoundError
 from src.db_client import DB_Client
 from src.core_intent_matcher.model import Model
+from src.core_intent_matcher.prediction_cache import PredictionCache
+
+CONFIG = common.CONFIG["classifier"]
+
+def train_model(x_and_y:list)->Model:
+    """trains a new model from scratch. Runs in the worker processes
+    of ModelDataManager.add_topics().
+
+    :param x_and_y: rows/tuples of (intentID, matches)
+    :type x_and_y: list
+    :return: the trained model
+    :rtype: Model
+    """
+    model = Model()
+    model.prepare_data(x_and_y)
+    model.train_and_test()
+    return model
 
 @common.singleton
 class ModelDataManager:
     """syncs the handling of model training data and database CRUD operations.
-    It uses the ModelPool and database client as part of its implementation.
+    It uses the ModelPool and database client as part of its implementation,
+    and invalidates the cached predictions of every context it retrains.
+    It also knows the conversation graph, i.e. the contexts that the
+    intents of every context link to.
+
+    When the model pool serves shared models, the training process owns
+    the database and the models: the methods that learn or forget
+    intents raise ModelPoolReadOnlyError before writing anything, apart
+    from add_intent_matches(), which skips the change.
     """
 
     def __init__(self):
         self.model_pool = ModelPool()
         self.db_client = DB_Client()
+        self.prediction_cache = PredictionCache()
+        self.context_links = {}
             
-    def add_intents(self, intents_json:dict, context:str):
+    def add_intents(self, intents_json:dict, context:str, replace=False):
         """add intents from a json dictionary
 
         :param intents_json: dictionary of intents, with intents
@@ -27,51 +58,114 @@ class ModelDataManager:
         :type intents_json: dict
         :param context: context under which to insert the intent
         :type context: str
+        :param replace: replaces the intents that the context already
+        has, for re-ingesting a changed context, defaults to False
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
         """
-        intent_ids = []
-        matches_list = []
-
-        for intent, intent_attr in intents_json.items():
-            intent_id = self.db_client.insert_intent(intent, intent_attr["matches"], \
-                intent_attr["responses"], context, intent_attr["link"], intent_attr["type"])
-            intent_ids.append(intent_id)
-            
-            matches_list.append(intent_attr["matches"])
-        
-        prepared_data = list(zip(intent_ids, matches_list))
+        self.model_pool.check_writable()
+        prepared_data = self.insert_intents(intents_json, context, replace)
 
         try:
             self.model_pool[context]
         except ModelNotFoundError:
             self.add_context(context)
 
-        with self.model_pool.GetModel(context) as model:
-            model.prepare_data(prepared_data)
-            model.train_and_test()
+        with self.model_pool.GetModel(context, write=True) as model:
+            if replace:
+                model.prepare_data(prepared_data, True)
+                model.train_and_test()
+            elif CONFIG["incremental"]:
+                model.partial_fit(prepared_data)
+            else:
+                self.retrain(model, context)
+        self.invalidate(context, model.version)
 
     
+    def add_topics(self, topics:List[Dict], replace=False):
+        """adds the intents of many contexts, like add_intents() does for
+        each topic. The intents are written to the database by this
+        process only, then the new contexts are trained concurrently
+        in a pool of classifier.bootstrap_workers processes (0 for one
+        per core) and their models are added to the model pool. Contexts
+        that already have a model, and every context in global index
+        mode, are learned with add_intents() instead. The workers are
+        spawned rather than forked, as a fork would copy the locks held
+        by the threads of the model pool, e.g. its persister's, into
+        workers where no thread will ever release them.
+
+        :param topics: topics as in the root intents file, with the
+        'context' and 'intents' of each topic
+        :type topics: List[Dict]
+        :param replace: replaces the intents that the contexts already
+        have, defaults to False
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
+        """
+        self.model_pool.check_writable()
+        prepared_data = {}
+        for topic in topics:
+            context = topic["context"]
+            if self.model_pool.global_index or context in self.model_pool.model_states:
+                self.add_intents(topic["intents"], context, replace)
+            else:
+                prepared_data.setdefault(context, []).extend(self.insert_intents(topic["intents"], context, replace))
+
+        if not prepared_data:
+            return
+
+        workers = min(CONFIG["bootstrap_workers"] or os.cpu_count(), len(prepared_data))
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(train_model, x_and_y): context for context, x_and_y in prepared_data.items()}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="learning intents"):
+                context = futures[future]
+                model = future.result()
+                self.model_pool.add_model(context, model)
+                self.invalidate(context, model.version)
+
+    def insert_intents(self, intents_json:dict, context:str, replace=False)->list:
+        """inserts intents from a json dictionary into the database
+        in a single transaction
+
+        :param intents_json: dictionary of intents, with intents
+        as keys and its attributes as values
+        :type intents_json: dict
+        :param context: context under which to insert the intents
+        :type context: str
+        :param replace: deletes the intents that the context already
+        has first if True, defaults to False
+        :return: (intentID, matches) of the inserted intents, as
+        taken by Model.prepare_data()
+        :rtype: list
+        """
+        intent_ids = self.db_client.insert_intents_json(intents_json, context, replace)
+        return [(intent_id, intent_attr["matches"]) for intent_id, intent_attr in zip(intent_ids, intents_json.values())]
+
     def remove_intent(self, intent:str, context:str):
         """remove an intent from a context. Removes
-        the intent from the model as well as the database.
+        the intent from the model as well as the database,
+        including every row that shares its name.
 
         :param intent: identifying name of the intent
         :type intent: str
         :param context: context/model name under which to
         insert intent
         :type context: str
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
         """
+        self.model_pool.check_writable()
+        intentIDs = self.db_client.get_intent_ids(intent, context)
         rows_left = self.db_client.drop_intent(intent, context)
 
         if rows_left > 0:
-            intents = self.db_client.get_intents(context)
-            prepared_data = [(intent[0], intent[2]) for intent in intents]
-
-            with self.model_pool.GetModel(context) as model:
-                model.prepare_data(prepared_data)
-                model.train_and_test()
+            with self.model_pool.GetModel(context, write=True) as model:
+                if CONFIG["incremental"]:
+                    model.forget(intentIDs)
+                else:
+                    self.retrain(model, context)
+            self.invalidate(context, model.version)
 
         elif rows_left == 0:
             self.model_pool.pop_model(context)
+            self.invalidate(context)
 
     def add_context(self, context:str):
         """adds a model into the model pool as the one that
@@ -89,17 +183,86 @@ class ModelDataManager:
 
         :param context: identifying name of context to remove
         :type context: str
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
         """
         self.model_pool.pop_model(context)
         self.db_client.drop_context(context)
+        self.invalidate(context)
 
-    def add_intent_matches(self, intentID:int, matches:List[str]):
-        self.db_client.update_intent_matches(intentID, matches)
-        context = self.db_client.get_intent_by_idx(intentID)[4]
-        intents = self.db_client.get_intents(context)
+    def add_intent_matches(self, intentID:int, matches:List[str])->bool:
+        """replaces the matches of an intent. If the new matches extend
+        the old ones, only the added matches are learned by the model,
+        otherwise (or outside of incremental mode) the model of the
+        intent's context is retrained. Nothing is changed when the pool
+        serves shared models, so that a conversation can go on.
+
+        :param intentID: identifying number of the intent
+        :type intentID: int
+        :param matches: new list of matches of the intent
+        :type matches: List[str]
+        :return: False if the change was skipped because the pool only
+        serves shared models, True otherwise
+        :rtype: bool
+        """
+        if self.model_pool.shared:
+            return False
+
+        intent_row = self.db_client.get_intent_by_idx(intentID)
+        old_matches, context = intent_row[2], intent_row[4]
+        extends = matches[:len(old_matches)] == old_matches
+        if extends:
+            self.db_client.append_intent_matches(intentID, matches[len(old_matches):])
+        else:
+            self.db_client.update_intent_matches(intentID, matches)
+
+        with self.model_pool.GetModel(context, write=True) as model:
+            if CONFIG["incremental"] and extends:
+                model.partial_fit([(intentID, matches[len(old_matches):])])
+            else:
+                self.retrain(model, context)
+        self.invalidate(context, model.version)
+        return True
+
+    def invalidate(self, context:str, version:int=None):
+        """invalidates the cached predictions of a retrained context. With
+        a global index the idf is shared, so every context is invalidated.
+
+        :param context: context that was retrained
+        :type context: str
+        :param version: new version of the context's model, defaults to None
+        :type version: int
+        """
+        self.context_links.pop(context, None)
+        if self.model_pool.global_index:
+            self.prediction_cache.clear(version)
+        else:
+            self.prediction_cache.invalidate(context, version)
+
+    def links(self, context:str)->list:
+        """returns the contexts that the intents of a context link to.
+        The links are read from the database once per retrain.
+
+        :param context: name of the context
+        :type context: str
+        :return: linked contexts
+        :rtype: list
+        """
+        try:
+            return self.context_links[context]
+        except KeyError:
+            links = self.context_links[context] = self.db_client.get_links(context)
+            return links
+
+    def retrain(self, model:Model, context:str):
+        """retrains a model from scratch on all the intents of its
+        context in the database
 
+        :param model: classifier model of the context
+        :type model: Model
+        :param context: context of the model
+        :type context: str
+        """
+        intents = self.db_client.get_intents(context)
         prepared_data = [(intent[0], intent[2]) for intent in intents]
-        
-        with self.model_pool.GetModel(context) as model:
-            model.prepare_data(prepared_data, True)
-            model.train_and_test()
+        model.prepare_data(prepared_data, True)
+        model.train_and_test()
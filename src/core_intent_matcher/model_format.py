@@ -0,0 +1,160 @@
+# standard imports
+import json
+import mmap as mmap_module
+import os
+import shutil
+import uuid
+
+# third party imports
+import numpy as np
+from scipy import sparse
+
+# local imports
+
+# this module contains the compact on-disk format of classifier models.
+# A model is a directory of .npy arrays plus a meta.json file, so that
+# it can be loaded with memory mapping and without unpickling anything.
+# Every save writes the arrays into a new subdirectory, which meta.json
+# then points to, so that processes sharing the files never see a mix
+# of old and new arrays. Format version 1 kept the arrays next to
+# meta.json and is still loaded.
+
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, FORMAT_VERSION)
+META_FILE = "meta.json"
+ARRAYS_PREFIX = "arrays-"
+
+class ModelFormatError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+def save_arrays(dirpath:str, arrays:dict, meta:dict):
+    """saves arrays and metadata into a model directory. The arrays are
+    written into a new subdirectory, then meta.json is written under a
+    temporary name and renamed over the old one, which publishes the new
+    arrays at once. The older subdirectories are removed afterwards,
+    models memory mapped from them stay intact.
+
+    :param dirpath: model directory, created if it does not exist
+    :type dirpath: str
+    :param arrays: arrays to save, keyed by file name (without suffix)
+    :type arrays: dict
+    :param meta: json serializable metadata of the model
+    :type meta: dict
+    """
+    arrays_dir = f"{ARRAYS_PREFIX}{meta.get('version', 0)}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.join(dirpath, arrays_dir))
+
+    for name, array in arrays.items():
+        np.save(os.path.join(dirpath, arrays_dir, name + ".npy"), array)
+
+    filepath = os.path.join(dirpath, META_FILE)
+    with open(filepath + ".tmp", "w") as f:
+        json.dump({"format_version": FORMAT_VERSION, "arrays": arrays_dir, **meta}, f)
+    os.replace(filepath + ".tmp", filepath)
+
+    for filename in os.listdir(dirpath):
+        filepath = os.path.join(dirpath, filename)
+        if filename.startswith(ARRAYS_PREFIX) and filename != arrays_dir:
+            shutil.rmtree(filepath, ignore_errors=True) # fails on Windows while still mapped
+        elif filename.endswith(".npy"): # left by format version 1
+            os.remove(filepath)
+
+def load_meta(dirpath:str)->dict:
+    """loads the metadata of a model directory
+
+    :param dirpath: model directory
+    :type dirpath: str
+    :raises ModelFormatError: if the directory was written in an
+    unsupported format version
+    :return: the metadata
+    :rtype: dict
+    """
+    with open(os.path.join(dirpath, META_FILE)) as f:
+        meta = json.load(f)
+
+    if meta.get("format_version") not in SUPPORTED_VERSIONS:
+        raise ModelFormatError(f"model '{dirpath}' has unsupported format version {meta.get('format_version')}.")
+
+    return meta
+
+def load_arrays(dirpath:str, mmap=True, read_only=False)->tuple:
+    """loads the arrays and metadata of a model directory. If the
+    model is saved again meanwhile, e.g. by another process, the
+    new arrays are loaded.
+
+    :param dirpath: model directory
+    :type dirpath: str
+    :param mmap: memory maps the arrays instead of reading them into
+    memory, defaults to True
+    :param read_only: maps the arrays read-only, so that their pages
+    stay shared by every process mapping them, instead of
+    copy-on-write. Defaults to False
+    :raises ModelFormatError: if the directory was written in an
+    unsupported format version
+    :return: arrays keyed by file name and the metadata
+    :rtype: Tuple[dict, dict]
+    """
+    mmap_mode = ("r" if read_only else "c") if mmap else None
+
+    while True:
+        meta = load_meta(dirpath)
+        arrays_dir = os.path.join(dirpath, meta.get("arrays", ""))
+        try:
+            arrays = {filename[:-4]: np.load(os.path.join(arrays_dir, filename), mmap_mode=mmap_mode) \
+                for filename in os.listdir(arrays_dir) if filename.endswith(".npy")}
+        except FileNotFoundError:
+            if load_meta(dirpath) == meta: # not removed by a newer save
+                raise
+            continue
+
+        # a newer save may have removed some of the arrays while they were listed
+        if load_meta(dirpath) == meta:
+            return arrays, meta
+
+def is_mapped(array:np.ndarray)->bool:
+    """checks whether an array is a view of a memory mapped file
+
+    :param array: the array
+    :type array: np.ndarray
+    :return: True if the array's memory is a file mapping
+    :rtype: bool
+    """
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap_module.mmap)):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+def csr_to_arrays(prefix:str, matrix:sparse.csr_matrix, dtype)->dict:
+    """splits a CSR matrix into its indptr, indices and data arrays
+
+    :param prefix: prefix of the array names
+    :type prefix: str
+    :param matrix: matrix to split
+    :type matrix: sparse.csr_matrix
+    :param dtype: dtype to store the data array as
+    :return: arrays keyed by name
+    :rtype: dict
+    """
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    return {
+        prefix + "_indptr": matrix.indptr.astype(index_dtype, copy=False),
+        prefix + "_indices": matrix.indices.astype(index_dtype, copy=False),
+        prefix + "_data": matrix.data.astype(dtype, copy=False),
+    }
+
+def csr_from_arrays(prefix:str, arrays:dict, shape:tuple)->sparse.csr_matrix:
+    """reassembles a CSR matrix split by csr_to_arrays() without copying
+
+    :param prefix: prefix of the array names
+    :type prefix: str
+    :param arrays: arrays keyed by name
+    :type arrays: dict
+    :param shape: shape of the matrix
+    :type shape: tuple
+    :return: the reassembled matrix
+    :rtype: sparse.csr_matrix
+    """
+    return sparse.csr_matrix((arrays[prefix + "_data"], arrays[prefix + "_indices"], arrays[prefix + "_indptr"]), \
+        shape=tuple(shape))
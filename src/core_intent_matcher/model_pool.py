@@ -1,149 +1,33 @@
 # standard imports
-from collections import namedtuple
+from collections import deque
+from concurrent.futures import Future
 from enum import Enum, auto
-from msilib.schema import Class
+from functools import partial
 from queue import Queue
+import atexit
+import logging
 import os
+import shutil
+import threading
+import time
 
 # third party imports
 import joblib
 
 # local imports
-from src.core_intent_matcher.model import Model
+from src.core_intent_matcher.model import Model, stem_cache
+from src.core_intent_matcher.global_index import GlobalModel, ContextModel
+from src.core_intent_matcher.eviction import QueueItem, LRUQueue, make_queue
+from src.core_intent_matcher.persister import Persister
+from src.core_intent_matcher.metrics import LatencyHistogram
+import src.core_intent_matcher.model_format as model_format
 import src.common as common
 
 CONFIG = common.CONFIG['model']
+GLOBAL_INDEX = "global_index" # name of the model holding every context in global index mode
+LEGACY_SUFFIX = ".joblib" # suffix of the models pickled whole before the compact format
 
-QueueItem = namedtuple('QueueItem', ['key', 'val']) 
-
-class PriorityQueue:
-    """used for holding items with priority/relevancy taken into
-    account. The most used item is least likely to be popped out
-    during explicit pop operation or when queue surpasses its capacity.
-    """
-
-    def __init__(self, init_queue=[], capacity=None):
-        """initiates priority queue instance
-
-        :param init_queue: initial queue represented as a list, defaults to [].
-        The order of the items in the initial queue determine their relevancy, i.e.
-        first item is most relevant.
-        :param capacity: limits number of items that can be
-        set, the queue will kick out less relevant item
-        if queue is beyond capacity, defaults to None
-        """
-
-        self.queue = [QueueItem(item[0], item[1]) for item in init_queue]
-        self.capacity = capacity
-
-    def setitem(self, key, value)->QueueItem:
-        """set a key-value pair for the priority queue.
-        The new pair will be set at the middle of the queue
-        in terms of relevancy.
-
-        :param key: sets key of key-value pair
-        :param value: sets value of the key-value pair
-        :return: return the item that has been popped if
-        the queue was beyond capacity
-        """
-        popped_item = None
-
-        if key in self.keys():
-            item_idx = self.keys().index(key)
-            self.queue[item_idx] = QueueItem(key, value)
-        else:
-            self.queue.insert(len(self) // 2, QueueItem(key, value))
-
-            if self.capacity and len(self) > self.capacity:
-                popped_item = self.pop_worst()
-
-        return popped_item
-
-    def getitem(self, key:str)->QueueItem:
-        """gets the key-pair item of the corresponding key.
-        The priority queue will shift the fetched item up
-        a rank as a side effect.
-
-        :param key: identifying key corresponding to desired value
-        :return: Queueitem object which contains the key and value
-        that corresponds to specified key
-        :rtype: QueueItem
-        """
-        value = None
-        for i, item in enumerate(self.queue):
-            if key == item.key:
-                value = item.val
-                if i: # increase item relevancy
-                    self.queue[i - 1], self.queue[i] = \
-                        self.queue[i], self.queue[i - 1]
-        if value is None:
-            raise KeyError
-        return QueueItem(key, value)
-
-    def __getitem__(self, key:str):
-        """purely gets the key-pair item of the corresponding key.
-        The priority queue will NOT shift the fetched item up
-        a rank as a side effect.
-
-        :param key: key that corresponds to the desired value
-        :return: value that corresponds to the specified key
-        """
-        value = None
-        for i, item in enumerate(self.queue):
-            if key == item.key:
-                value = item.val
-        if value is None:
-            raise KeyError
-        return QueueItem(key, value)
-
-    def pop_worst(self)->QueueItem:
-        """pops the least relevant item in queue
-
-        :return: least relevant queue item
-        """
-        return self.queue.pop()
-
-    def pop(self, key:str)->QueueItem:
-        """pops an item in the queue given the key
-
-        :param key: identifying key associated with item
-        :type key: str
-        :return: item of priority queue
-        :rtype: QueueItem
-        """
-        value = None
-        for i, item in enumerate(self.queue):
-            if key == item.key:
-                value = self.queue.pop(i)
-        return QueueItem(key, value)
-        
-
-    def peek_best(self)->QueueItem:
-        """peeks at the most relevant item in queue
-
-        :return: most relevant item in queue
-        """
-        result = None
-        try:
-            result = self.queue[0]
-        except IndexError:
-            pass
-        return result
-
-    def __len__(self)->int:
-        """returns length of the queue
-
-        :return: queue length
-        """
-        return len(self.queue)
-
-    def keys(self)->list:
-        """returns all keys in PriorityQueue instance
-
-        :return: all keys in the queue
-        :rtype: list
-        """
-        return [item.key for item in self.queue]
+logger = logging.getLogger(__name__)
 
 class ModelNotFoundError(Exception):
     def __init__(self, message):
@@ -165,6 +49,10 @@ class PriorityQueueAlreadyExistsError(Exception):
     def __init__(self, message):
         super().__init__(message)
 
+class ModelPoolReadOnlyError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
 # class PriorityQueueDoesntExistError(Exception):
 #     def __init__(self, message):
 #         super().__init__(message)
@@ -180,7 +68,50 @@ class ModelPool:
     shuffling classifier models in between three states:
     currently selected, queued and stored. The queued state
     indicates that the model is cached in memory, whereas stored
-    means that it is stored on disk.
+    means that it is stored on disk. Changes to cached models are
+    written back to disk when they are evicted, on flush() and at
+    exit, so models that were only read are never stored again.
+    Models are written by a background Persister (write-behind). A
+    model only counts as saved once its write succeeded: a model whose
+    write failed is kept in memory, served in place of its stored
+    version and written again on the next flush().
+
+    Stored models are only registered at startup and loaded on first
+    use, apart from model.warm_models, which are prefetched. Models
+    pickled by earlier versions are converted to the compact format
+    at startup.
+
+    The cached models are limited both in number, by
+    model.priority_queue_cap, and in estimated size, by
+    model.memory_budget bytes. The least relevant models are evicted
+    when either limit is exceeded, except for model.pinned_models.
+
+    The pool is thread-safe. Models are never changed in place: a
+    writer updates a copy of the model (copy-on-write) and commit()
+    swaps the copy in, so readers are never blocked by a retrain and
+    never see a model half updated. Writers of a model take turns on
+    its lock. The model.kept_versions previous versions of every cached
+    model are kept for rollback(). Concurrent loads of the same model
+    from disk are merged into one.
+
+    Models that the conversation is likely to move to next can be
+    prefetched, i.e. loaded and cached by model.prefetch_threads
+    background threads before they are asked for.
+
+    With model.shared, the pool only serves the models that another
+    process trains and stores: every worker process maps the model
+    arrays read-only from the same files, so their memory is shared
+    rather than copied into each worker, and only private memory counts
+    against the memory budget. refresh() picks up the stored changes,
+    ModelAPI calls it every model.refresh_interval seconds.
+
+    If model.index is 'global', all contexts share the single
+    GlobalModel named GLOBAL_INDEX and models are accessed by
+    context name as views of it (ContextModel).
+
+    stats() reports the lookups per state of the model found, the disk
+    loads, stores and evictions and the latency histograms of loads and
+    stores. They are also logged every model.stats_log_interval seconds.
     """
 
     MODEL_DIR = "models"
@@ -188,10 +119,47 @@ class ModelPool:
     def __init__(self, init_queue=None):
         """instantiate the ModelStateManager class
 
-        :param init_queue: for populating the priority queue.
-        :type init_queue: PriorityQueue
+        :param init_queue: for populating the priority queue. Defaults
+        to None, in which case the queue follows model.eviction_policy.
+        The models of an initial queue are not counted against the
+        memory budget until they change.
+        :type init_queue: LRUQueue
         """
+        self.lock = threading.RLock()
+        self.model_locks = {}
+        self.history = {} # model name -> previous versions, the latest last
+        self.loading = {} # model name -> Future of the model being loaded
+        self.store_lock = threading.Lock() # guards the store bookkeeping below, taken by the persister
+        self.storing = {} # model name -> version of the latest store submitted but not done
+        self.stored_versions = {} # model name -> version of the latest successful store
+        self.unsaved = {} # model name -> latest model whose store failed
         self.model_states = {}
+        self.capacity = CONFIG["priority_queue_cap"]
+        self.memory_budget = CONFIG["memory_budget"]
+        self.pinned = set(CONFIG["pinned_models"])
+        self.model_bytes = {} # estimated size of every measured cached model
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.evictions = 0
+        self.lookups = {state: 0 for state in ModelState} # lookups by the state the model was found in
+        self.loads = 0
+        self.stores = 0
+        self.load_latency = LatencyHistogram()
+        self.store_latency = LatencyHistogram()
+        self.prefetching = set() # models waiting for or being prefetched
+        self.prefetched = set() # prefetched models that have not been used yet
+        self.prefetches = 0
+        self.prefetch_hits = 0
+        self.prefetch_wasted = 0
+        self.prefetch_errors = 0
+        self.prefetch_queue = Queue()
+        for _ in range(CONFIG["prefetch_threads"]):
+            threading.Thread(target=self.prefetch_worker, daemon=True).start()
+        self.persister = Persister(CONFIG["persister_threads"], CONFIG["persister_queue_cap"])
+        self.global_index = CONFIG["index"] == "global"
+        self.shared = CONFIG["shared"]
+        if CONFIG["stats_log_interval"]:
+            threading.Thread(target=self.stats_logger, args=(CONFIG["stats_log_interval"],), daemon=True).start()
         if hasattr(self, 'queue'):
             if init_queue:
                 raise PriorityQueueAlreadyExistsError("queue has already been initialized!")
@@ -201,25 +169,82 @@ class ModelPool:
                 self.set_queue(init_queue)
             else:
                 self.register_all_stored()
-                self.set_queue(PriorityQueue())
-                self.queue_all_stored()
+                self.set_queue(self.new_queue())
+                self.prefetch(CONFIG["warm_models"])
+                atexit.register(self.flush)
 
     def register_all_stored(self):
-        models_list = os.listdir(CONFIG['storage_dir'])
-        models_list = list(map(lambda x: x.replace(".joblib", ""), models_list))
-
-        for model_name in models_list:
-            self.model_states[model_name] = ModelState.STORED
-
+        """registers the models in the storage directory as STORED
+        without loading them, so that startup does not depend on the
+        number of models. Models that are already registered keep
+        their state.
+        """
+        os.makedirs(CONFIG['storage_dir'], exist_ok=True)
+        if os.path.exists(self.stem_cache_filename()):
+            stem_cache.load(self.stem_cache_filename())
+        if not self.shared: # the training process owns the files
+            self.convert_legacy_models()
+
+        with self.lock:
+            for model_name in self.stored_model_names():
+                self.model_states.setdefault(model_name, ModelState.STORED)
+
+    def convert_legacy_models(self):
+        """converts the models that earlier versions pickled whole with
+        joblib into the compact format. The pickles hold the training
+        text, so the models are retrained from it, then the pickles are
+        removed. A pickle that cannot be converted is left in place.
+        """
+        for filename in os.listdir(CONFIG['storage_dir']):
+            if not filename.endswith(LEGACY_SUFFIX):
+                continue
+            model_name = filename[:-len(LEGACY_SUFFIX)]
+            path = CONFIG["storage_dir"] + "/" + filename
+
+            if not os.path.exists(self.model_filename(model_name)):
+                try:
+                    legacy = joblib.load(path)
+                    model = Model()
+                    model.prepare_data([(intentID, [matches]) for matches, intentID in zip(legacy.x_all, legacy.y_all)])
+                    model.train_and_test()
+                    model.save(self.model_filename(model_name))
+                except Exception:
+                    logger.exception("could not convert the model %s, it is left in place", path)
+                    continue
+            os.remove(path)
+            logger.info("converted the model %s to the compact format", path)
 
     def queue_all_stored(self):
-        models_list = os.listdir(CONFIG['storage_dir'])
-        models_list = list(map(lambda x: x.replace(".joblib", ""), models_list))
+        """loads and caches every STORED model, as far as the limits
+        of the pool allow
+        """
+        for model_name in self.stored_model_names():
+            if self.model_states.get(model_name) == ModelState.STORED:
+                self.queue_model(model_name)
 
-        for model_name in models_list:
-            self.queue_model(model_name)
+    def stored_model_names(self)->list:
+        """lists the names of the models stored in the storage directory
 
-    def set_queue(self, init_queue:PriorityQueue):
+        :return: names of the stored models
+        :rtype: list
+        """
+        suffix = CONFIG["file_suffix"]
+        return [filename[:-len(suffix)] for filename in os.listdir(CONFIG['storage_dir']) \
+            if filename.endswith(suffix)]
+
+    def new_queue(self)->LRUQueue:
+        """builds an empty queue of model.eviction_policy, sized by
+        model.priority_queue_cap, which e.g. the protected segment of
+        SLRU is a share of. The queue never pops models itself: the
+        pool inserts them with insert() and evicts in measure(), so that
+        pinned models stay and changed models are stored.
+
+        :return: the queue
+        :rtype: LRUQueue
+        """
+        return make_queue(CONFIG["eviction_policy"], capacity=CONFIG["priority_queue_cap"])
+
+    def set_queue(self, init_queue:LRUQueue):
         self.queue = init_queue
         
         queued_states = {model_name: ModelState.QUEUED \
@@ -245,22 +270,23 @@ class ModelPool:
         parameter
         :rtype: Classifier
         """
-        model = None
-        state = None
+        if self.global_index and model_name != GLOBAL_INDEX:
+            return self.context_model(model_name)
 
-        try:
-            state = self.model_states[model_name]
-        except KeyError:
-            raise ModelNotFoundError(f"model '{model_name}' not found.")
-
-        if state == ModelState.CURRENT:
-            model = self.cur_model.val
-        elif state == ModelState.QUEUED:
-            model = self.queue[model_name].val
-        elif state == ModelState.STORED:
-            model = self.load_model(model_name)
+        with self.lock:
+            try:
+                state = self.model_states[model_name]
+            except KeyError:
+                raise ModelNotFoundError(f"model '{model_name}' not found.")
+            self.lookups[state] += 1
 
-        return model
+            if state == ModelState.CURRENT:
+                return self.cur_model.val
+            elif state == ModelState.QUEUED:
+                self.count_prefetch_hit(model_name)
+                return self.queue[model_name].val
+
+        return self.load_model(model_name)
 
     def select_model(self, model_name:str)->Model:
         """puts model as CURRENT state, returns model
@@ -274,53 +300,365 @@ class ModelPool:
         :return: classifier model that has been put in CURRENT state
         :rtype: Classifier
         """
-        state = None
-        model = None
-        try:
-            state = self.model_states[model_name]
-        except KeyError:
-            raise ModelNotFoundError(f"model '{model_name}' not found.")
-
-        if state == ModelState.STORED:
-            self.queue_model(model_name)
-            self.cur_model = self.queue.getitem(model_name)
-        elif state == ModelState.QUEUED:
-            self.cur_model = self.queue.getitem(model_name)
-            
-        if self.cur_model.val:
-            model = self.cur_model.val
-
-        return model
-
-    def queue_model(self, model_name):
+        if self.global_index and model_name != GLOBAL_INDEX:
+            return self.context_model(model_name, True)
+
+        with self.lock:
+            try:
+                state = self.model_states[model_name]
+            except KeyError:
+                raise ModelNotFoundError(f"model '{model_name}' not found.")
+            self.lookups[state] += 1
+
+            if state == ModelState.CURRENT:
+                return self.cur_model.val
+            elif state == ModelState.QUEUED:
+                self.count_prefetch_hit(model_name)
+                self.cur_model = self.queue.getitem(model_name)
+                return self.cur_model.val
+
+        while True:
+            model = self.load_model(model_name) # without holding the lock
+            with self.lock:
+                # unless another thread queued it meanwhile, or queued a
+                # newer version that has been evicted since
+                if model_name not in self.queue:
+                    if self.is_stale(model_name, model):
+                        continue
+                    self.queue_model(model_name, model)
+                self.cur_model = self.queue.getitem(model_name)
+                return self.cur_model.val
+
+    def queue_model(self, model_name, model:Model=None):
         """transfers the model from just being stored on the disk
         to being cached and queued on the priority queue. It
         puts the model from STORED to QUEUED state.
 
         :param model_name: identifier name associated with the model
         :type model_name: str
+        :param model: the model if it was already loaded, defaults to None
+        :type model: Classifier
         :raises ModelNotFoundError: if the model could not be found as
         STORED, QUEUED or CURRENT
         :raises ModelAlreadyQueuedError: if the model is already found
         to be QUEUED or CURRENT
         """
+        with self.lock:
+            try:
+                state = self.model_states[model_name]
+            except KeyError:
+                raise ModelNotFoundError(f"model '{model_name}' not found.")
+
+            if state == ModelState.QUEUED or state == ModelState.CURRENT:
+                raise ModelAlreadyQueuedError(f"model '{model_name}' already queued.")
+
+            if model is None:
+                model = self.load_model(model_name)
+            self.queue.insert(model_name, model)
+            self.model_states[model_name] = ModelState.QUEUED
+            self.measure(model_name, model)
+
+    def measure(self, model_name:str, model:Model):
+        """updates the estimated size of a cached model, then evicts
+        models until the pool is within its limits again. The measured
+        model itself is not evicted.
 
-        state = None
-        try:
-            state = self.model_states[model_name]
-        except KeyError:
-            raise ModelNotFoundError(f"model '{model_name}' not found.")
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :param model: the cached model
+        :type model: Classifier
+        """
+        if isinstance(model, ContextModel):
+            model_name, model = GLOBAL_INDEX, model.index
+        nbytes = model.nbytes() - (model.mapped_nbytes() if self.shared else 0)
+
+        with self.lock:
+            self.bytes += nbytes - self.model_bytes.get(model_name, 0)
+            self.model_bytes[model_name] = nbytes
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+
+            while (self.capacity and len(self.queue) > self.capacity) or \
+                (self.memory_budget and self.bytes > self.memory_budget):
+                worst = next((key for key in self.queue.worst_keys() \
+                    if key != model_name and key not in self.pinned), None)
+                if worst is None:
+                    break
+                self.evict(worst)
+
+    def evict(self, model_name:str):
+        """puts a cached model into STORED state, storing it first if
+        it changed. Its previous versions are dropped.
 
-        if state == ModelState.QUEUED or state == ModelState.CURRENT:
-            raise ModelAlreadyQueuedError(f"model '{model_name}' already queued.")
-            
-        model = self.load_model(model_name)
-        popped_model = self.queue.setitem(model_name, model)
-        if popped_model:
-            self.store_model(*popped_model)
-            self.model_states[popped_model.key] = ModelState.STORED
+        :param model_name: identifying name of the model
+        :type model_name: str
+        """
+        model = self.queue.pop(model_name).val
+        self.model_states[model_name] = ModelState.STORED
+        self.bytes -= self.model_bytes.pop(model_name, 0)
+        self.evictions += 1
+        self.history.pop(model_name, None)
+        self.count_prefetch_waste(model_name)
+        if model.dirty:
+            self.store_model(model_name, model)
+
+    def stats(self)->dict:
+        """returns the number and estimated size of the cached models
+        and the counters and latencies of the pool
+
+        :return: cached models, current and peak bytes, memory budget,
+        evictions, prefetch counters, lookups per state of the model
+        found, hit rate (lookups of cached models), loads, stores, models
+        whose store failed, the stats of the load and store
+        LatencyHistograms in seconds and the stats of the persister
+        :rtype: dict
+        """
+        with self.store_lock:
+            unsaved = len(self.unsaved)
+        with self.lock:
+            lookups = sum(self.lookups.values())
+            hits = lookups - self.lookups[ModelState.STORED]
+            return {"models": len(self.queue), "bytes": self.bytes, "peak_bytes": self.peak_bytes, \
+                "memory_budget": self.memory_budget, "evictions": self.evictions, "prefetches": self.prefetches, \
+                "prefetch_hits": self.prefetch_hits, "prefetch_wasted": self.prefetch_wasted, \
+                "prefetch_errors": self.prefetch_errors, \
+                "lookups": {state.name.lower(): count for state, count in self.lookups.items()}, \
+                "hit_rate": hits / lookups if lookups else 0.0, "loads": self.loads, "stores": self.stores, \
+                "unsaved": unsaved, "load_latency": self.load_latency.stats(), "store_latency": self.store_latency.stats(), \
+                "persister": self.persister.stats()}
+
+    def log_stats(self):
+        """logs a summary of stats() at INFO level
+        """
+        stats = self.stats()
+        lookups, loads, stores = stats["lookups"], stats["load_latency"], stats["store_latency"]
+        logger.info("model pool: %d models, %d bytes, hit rate %.3f (current %d, queued %d, stored %d), " \
+            "%d loads (p50 %.4fs, p99 %.4fs), %d stores (p50 %.4fs, p99 %.4fs), %d unsaved, %d evictions, " \
+            "%d writes queued", stats["models"], stats["bytes"], stats["hit_rate"], lookups["current"], \
+            lookups["queued"], lookups["stored"], stats["loads"], loads["p50"], loads["p99"], stats["stores"], \
+            stores["p50"], stores["p99"], stats["unsaved"], stats["evictions"], stats["persister"]["queue_depth"])
+
+    def stats_logger(self, interval:float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.log_stats()
+            except Exception:
+                logger.exception("could not log the model pool stats")
+
+    def prefetch(self, model_names:list):
+        """loads STORED models in the background and caches them, so
+        that the first use of the models does not wait for the disk.
+        Names of models that are not STORED, e.g. cached ones or
+        names that are not models at all, are ignored. Prefetching
+        never evicts, models that do not fit are dropped.
+
+        :param model_names: names of the models, the likeliest first
+        :type model_names: list
+        """
+        if not CONFIG["prefetch_threads"]:
+            return
+
+        for model_name in model_names:
+            if self.global_index:
+                model_name = GLOBAL_INDEX
+            with self.lock:
+                if self.model_states.get(model_name) != ModelState.STORED \
+                    or model_name in self.loading or model_name in self.prefetching:
+                    continue
+                self.prefetching.add(model_name)
+            self.prefetch_queue.put(model_name)
+
+    def prefetch_worker(self):
+        while True:
+            model_name = self.prefetch_queue.get()
+            try:
+                with self.lock:
+                    stored = self.model_states.get(model_name) == ModelState.STORED
+                if stored:
+                    model = self.load_model(model_name)
+                    with self.lock:
+                        # unless the model was queued by its user or removed meanwhile
+                        if self.model_states.get(model_name) == ModelState.STORED and self.fits(model) \
+                            and not self.is_stale(model_name, model):
+                            self.queue_model(model_name, model)
+                            self.prefetched.add(model_name)
+                            self.prefetches += 1
+            except Exception: # the model is loaded again when it is used
+                logger.debug("could not prefetch the model %s", model_name, exc_info=True)
+                with self.lock:
+                    self.prefetch_errors += 1
+            finally:
+                with self.lock:
+                    self.prefetching.discard(model_name)
+                self.prefetch_queue.task_done()
+
+    def fits(self, model:Model)->bool:
+        """checks whether a model can be cached without evicting
+
+        :param model: model to cache
+        :type model: Classifier
+        :return: True if it fits within both limits of the pool
+        :rtype: bool
+        """
+        return not (self.capacity and len(self.queue) >= self.capacity) and \
+            not (self.memory_budget and self.bytes + model.nbytes() > self.memory_budget)
 
-        self.model_states[model_name] = ModelState.QUEUED
+    def check_writable(self):
+        if self.shared:
+            raise ModelPoolReadOnlyError("the model pool only serves shared models, they are trained by another process.")
+
+    def refresh(self)->list:
+        """picks up the models that the training process stored, when
+        the pool serves shared models. New models are registered, removed
+        ones are dropped and cached models whose stored version changed
+        are reloaded.
+
+        :return: names of the models that were reloaded or removed
+        :rtype: list
+        """
+        if not self.shared:
+            return []
+
+        changed = []
+        with self.lock:
+            stored = set(self.stored_model_names())
+            for model_name in stored - self.model_states.keys():
+                self.model_states[model_name] = ModelState.STORED
+            for model_name in [model_name for model_name in self.model_states if model_name not in stored]:
+                self.queue.pop(model_name)
+                del self.model_states[model_name]
+                self.bytes -= self.model_bytes.pop(model_name, 0)
+                self.count_prefetch_waste(model_name)
+                changed.append(model_name)
+            if self.cur_model is not None and self.cur_model.key not in self.queue:
+                self.cur_model = self.queue.peek_best()
+            cached = [(model_name, self.queue[model_name].val) for model_name in self.queue.keys()]
+
+        for model_name, model in cached:
+            try:
+                if model_format.load_meta(self.model_filename(model_name))["version"] == model.version:
+                    continue
+            except FileNotFoundError:
+                continue
+            model = self.load_model(model_name)
+            with self.lock:
+                if model_name in self.queue:
+                    self.queue.update(model_name, model)
+                    if self.cur_model is not None and self.cur_model.key == model_name:
+                        self.cur_model = QueueItem(model_name, model)
+                    self.measure(model_name, model)
+                    changed.append(model_name)
+
+        return changed
+
+    def count_prefetch_hit(self, model_name:str):
+        if model_name in self.prefetched:
+            self.prefetched.discard(model_name)
+            self.prefetch_hits += 1
+
+    def count_prefetch_waste(self, model_name:str):
+        if model_name in self.prefetched:
+            self.prefetched.discard(model_name)
+            self.prefetch_wasted += 1
+
+    def model_lock(self, model_name:str)->threading.Lock:
+        """gets the lock that the writers of a model take turns on. In
+        global index mode, all contexts share the lock of the global index.
+
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :return: the model's lock
+        :rtype: threading.Lock
+        """
+        if self.global_index:
+            model_name = GLOBAL_INDEX
+        with self.lock:
+            try:
+                return self.model_locks[model_name]
+            except KeyError:
+                lock = self.model_locks[model_name] = threading.Lock()
+                return lock
+
+    def commit(self, model_name:str, model:Model, previous:Model=None):
+        """installs a new version of a model, built on a copy of the
+        current one. A cached model is swapped by a single reference
+        assignment and its current version is kept for rollback(). A
+        STORED model gets cached, so that loads of its old version
+        that are still running are not cached instead. The caller must
+        hold the model's lock.
+
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :param model: the new version of the model
+        :type model: Classifier
+        :param previous: the version that the new one was copied from,
+        kept for rollback() if the model was evicted meanwhile, defaults
+        to None
+        :type previous: Classifier
+        """
+        if isinstance(model, ContextModel):
+            model_name, model = GLOBAL_INDEX, model.index
+        if isinstance(previous, ContextModel):
+            previous = previous.index
+
+        with self.lock:
+            if self.model_states.get(model_name) == ModelState.STORED:
+                self.queue_model(model_name, model)
+            else:
+                previous = self.queue[model_name].val
+                self.swap(model_name, model)
+
+            if previous is not None:
+                self.history.setdefault(model_name, deque(maxlen=CONFIG["kept_versions"])).append(previous)
+
+    def swap(self, model_name:str, model:Model):
+        # the pool lock must be held
+        self.queue.update(model_name, model)
+        if self.cur_model is not None and self.cur_model.key == model_name:
+            self.cur_model = QueueItem(model_name, model)
+        self.measure(model_name, model)
+
+    def rollback(self, model_name:str)->int:
+        """reinstates the previous version of a cached model. The
+        reinstated model gets a new version number, so that versions
+        keep increasing, and it is stored like any other change.
+
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :raises ModelNotFoundError: if no previous version of the model
+        is kept
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
+        :return: the new version of the model
+        :rtype: int
+        """
+        self.check_writable()
+        if self.global_index:
+            model_name = GLOBAL_INDEX
+
+        with self.model_lock(model_name), self.lock:
+            if not self.history.get(model_name):
+                raise ModelNotFoundError(f"no previous version of model '{model_name}' is kept.")
+
+            model = self.history[model_name].pop().copy()
+            model.version = self.queue[model_name].val.version + 1
+            self.swap(model_name, model)
+            return model.version
+
+    def versions(self, model_name:str)->list:
+        """returns the version numbers of a model, the current version
+        first and then the kept previous versions, latest first
+
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :raises ModelNotFoundError: if the model could not be found
+        :return: version numbers
+        :rtype: list
+        """
+        current = self[model_name].version
+        if self.global_index:
+            model_name = GLOBAL_INDEX
+        with self.lock:
+            return [current] + [model.version for model in reversed(self.history.get(model_name, ()))]
 
     def add_model(self, model_name:str, model:Model):
         """adds a new classifier model to the ModelStateManager class
@@ -331,41 +669,218 @@ class ModelPool:
         :type model: Classifier
         :raises ModelNameExistsError: if another model already exists with the 
         same identifier name
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
         """
-        if model_name in self.queue.keys():
-            raise ModelNameExistsError(f"model '{model_name}' already exists.")
-            
-        self.store_model(model_name, model)
-        self.model_states[model_name] = ModelState.STORED
+        self.check_writable()
+        if self.global_index and model_name != GLOBAL_INDEX:
+            with self.model_lock(GLOBAL_INDEX):
+                with self.lock:
+                    if GLOBAL_INDEX not in self.model_states:
+                        self.add_model(GLOBAL_INDEX, GlobalModel())
+                index = self[GLOBAL_INDEX]
+                if index.has_context(model_name):
+                    raise ModelNameExistsError(f"model '{model_name}' already exists.")
+                index = index.copy()
+                index.add_context(model_name)
+                self.commit(GLOBAL_INDEX, index)
+            return
+
+        with self.lock:
+            if model_name in self.queue:
+                raise ModelNameExistsError(f"model '{model_name}' already exists.")
+
+            self.model_states[model_name] = ModelState.STORED
+            self.store_model(model_name, model)
 
 
     def load_model(self, model_name:str)->Model:
-        """wrapper method for joblib.load with
+        """wrapper method for Model.load with
         ability to use the filename() method to
         format the model_name into the correct filepath
-        to load model from
+        to load model from. The model's arrays are
+        memory mapped rather than read. Waits for pending
+        writes of the model first. Threads loading the same
+        model at once share a single load. A model whose last
+        store failed is returned from memory instead.
 
         :param model_name: identifier name associated with the model
         :type model_name: str
         :return: the classifier model loaded from storage
         :rtype: Classifier
         """
-        return joblib.load(self.model_filename(model_name))
+        while True:
+            with self.lock:
+                future = self.loading.get(model_name)
+                loader = future is None
+                if loader:
+                    future = self.loading[model_name] = Future()
+
+            if loader:
+                try:
+                    filename = self.model_filename(model_name)
+                    self.persister.wait(filename)
+                    with self.store_lock:
+                        unsaved = self.unsaved.get(model_name)
+                    if unsaved is not None:
+                        future.set_result(unsaved)
+                    else:
+                        start = time.perf_counter()
+                        future.set_result((GlobalModel if model_name == GLOBAL_INDEX else Model).load(filename, \
+                            read_only=self.shared))
+                        self.load_latency.observe(time.perf_counter() - start)
+                        with self.lock:
+                            self.loads += 1
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                finally:
+                    with self.lock:
+                        del self.loading[model_name]
+
+            model = future.result()
+            with self.lock:
+                # a shared load may have started before the latest store
+                if not self.is_stale(model_name, model):
+                    return model
+
+    def is_stale(self, model_name:str, model:Model)->bool:
+        """checks whether a loaded model is older than the version last
+        stored, or being stored, by this pool. The pool lock must be held.
+
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :param model: the loaded model
+        :type model: Classifier
+        :return: True if a newer version has been stored
+        :rtype: bool
+        """
+        with self.store_lock:
+            return model.version < max(self.stored_versions.get(model_name, model.version), \
+                self.storing.get(model_name, model.version))
+
+    def context_model(self, context:str, select=False)->ContextModel:
+        """gets the view of a context of the global index
+
+        :param context: name of the context
+        :type context: str
+        :param select: selects the global index as CURRENT model
+        if True, defaults to False
+        :raises ModelNotFoundError: if the global index or the
+        context does not exist
+        :return: view of the context
+        :rtype: ContextModel
+        """
+        try:
+            index = self.select_model(GLOBAL_INDEX) if select else self[GLOBAL_INDEX]
+            return index.context(context)
+        except (ModelNotFoundError, KeyError):
+            raise ModelNotFoundError(f"model '{context}' not found.")
 
     def store_model(self, model_name:str, model:Model):
-        """stores the model and puts it as STORED state
+        """stores the model and puts it as STORED state. The stem
+        cache shared by all models is stored alongside it if it has
+        learned new tokens. Only snapshots of the model and stem cache
+        are taken here, the persister writes them in the background.
+        The model stays dirty until the write succeeded.
 
         :param model_name: identifying name of the model object
         :type model_name: str
         :param model: classifier model to store
         :type model: Classifier
         """
-        joblib.dump(model, self.model_filename(model_name))
+        if isinstance(model, ContextModel):
+            model_name, model = GLOBAL_INDEX, model.index
+        filename = self.model_filename(model_name)
+        arrays, meta = model.to_arrays()
+        with self.store_lock:
+            self.storing[model_name] = meta["version"]
+        self.persister.submit(filename, partial(self.save_arrays, model_name, model, filename, arrays, meta))
+        with self.lock:
+            self.stores += 1
+
+        self.store_stem_cache()
+
+    def save_arrays(self, model_name:str, model:Model, filename:str, arrays:dict, meta:dict):
+        """writes a snapshot of a model, run by the persister. Only a
+        successful write marks the version as stored. If it fails, the
+        model is kept in unsaved, so that its changes are not lost when
+        it is evicted, and the error is passed on to the persister.
+        Takes the store lock only, never the pool lock, which a thread
+        submitting a write may be holding.
+        """
+        start = time.perf_counter()
+        try:
+            model_format.save_arrays(filename, arrays, meta)
+        except Exception:
+            with self.store_lock:
+                self.stored(model_name, meta["version"])
+                if self.unsaved.get(model_name, model).version <= model.version:
+                    self.unsaved[model_name] = model
+            raise
+        self.store_latency.observe(time.perf_counter() - start)
+
+        with self.store_lock:
+            self.stored(model_name, meta["version"])
+            model.saved_version = meta["version"]
+            self.stored_versions[model_name] = max(self.stored_versions.get(model_name, 0), meta["version"])
+            if model_name in self.unsaved and self.unsaved[model_name].version <= meta["version"]:
+                del self.unsaved[model_name]
+
+    def stored(self, model_name:str, version:int):
+        # the store lock must be held, a later store may have been submitted meanwhile
+        if self.storing.get(model_name) == version:
+            del self.storing[model_name]
+
+    def store_stem_cache(self):
+        """stores the stem cache shared by all models if it has
+        learned new tokens
+        """
+        if stem_cache.changed and not self.shared: # the training process owns the file
+            filename = self.stem_cache_filename()
+            self.persister.submit(filename, partial(stem_cache.dump, filename, stem_cache.snapshot()))
+
+    def is_cached(self, model_name:str)->bool:
+        """checks whether a model is held in memory, i.e. QUEUED or
+        CURRENT. The changes to cached models are stored on eviction
+        and flush().
+
+        :param model_name: identifying name of the model
+        :type model_name: str
+        :return: True if the model is cached
+        :rtype: bool
+        """
+        if self.global_index:
+            model_name = GLOBAL_INDEX
+        with self.lock:
+            return self.model_states.get(model_name) in (ModelState.QUEUED, ModelState.CURRENT)
+
+    def flush(self):
+        """stores every cached model that changed since it was last
+        stored and retries the models whose store failed, along with
+        the stem cache, and waits until everything has been written
+        """
+        with self.store_lock:
+            unsaved = dict(self.unsaved)
+        with self.lock:
+            for model_name in self.queue.keys():
+                model = self.queue[model_name].val
+                if model.dirty:
+                    unsaved.pop(model_name, None)
+                    self.store_model(model_name, model)
+            for model_name, model in unsaved.items():
+                if model_name in self.model_states:
+                    self.store_model(model_name, model)
+
+        self.store_stem_cache()
+        self.persister.flush()
 
     def del_model(self, model_name):
-        """deletes the model file
+        """deletes the model directory, cancelling its pending writes
         """
-        os.remove(self.model_filename(model_name))
+        filename = self.model_filename(model_name)
+        self.persister.discard(filename)
+        if os.path.exists(filename): # its first write may have been cancelled
+            shutil.rmtree(filename)
 
     def pop_model(self, model_name:str)->Model:
         """pops a model out of the model pool
@@ -373,51 +888,107 @@ class ModelPool:
         :param model_name: identifying name of the model
         :type model_name: str
         :raises ModelNotFoundError: is raised if model is not found in pool
+        :raises ModelPoolReadOnlyError: if the pool only serves shared models
         :return: classifier model that has been popped
         :rtype: Classifier
         """
+        self.check_writable()
+        if self.global_index and model_name != GLOBAL_INDEX:
+            with self.model_lock(GLOBAL_INDEX):
+                model = self.context_model(model_name)
+                index = model.index.copy()
+                index.forget_context(model_name)
+                self.commit(GLOBAL_INDEX, index)
+            return model
+
         model = None
         state = None
 
-        try:
-            state = self.model_states[model_name]
-        except KeyError:
-            raise ModelNotFoundError(f"model '{model_name}' not found.")
-
-        if state == ModelState.CURRENT:
-            model = self.queue.pop(model_name)
-            self.cur_model = self.queue.peek_best()
-            self.del_model(model_name)
-        elif state == ModelState.QUEUED:
-            model = self.queue.pop(model_name)
-            self.del_model(model_name)
-        elif state == ModelState.STORED:
-            self.del_model(model_name)
-
-        del self.model_states[model_name]
+        with self.model_lock(model_name), self.lock:
+            try:
+                state = self.model_states[model_name]
+            except KeyError:
+                raise ModelNotFoundError(f"model '{model_name}' not found.")
+
+            if state == ModelState.CURRENT:
+                model = self.queue.pop(model_name)
+                self.cur_model = self.queue.peek_best()
+                self.del_model(model_name)
+            elif state == ModelState.QUEUED:
+                model = self.queue.pop(model_name)
+                self.del_model(model_name)
+            elif state == ModelState.STORED:
+                self.del_model(model_name)
+
+            del self.model_states[model_name]
+            self.bytes -= self.model_bytes.pop(model_name, 0)
+            self.history.pop(model_name, None)
+            with self.store_lock:
+                self.storing.pop(model_name, None)
+                self.stored_versions.pop(model_name, None)
+                self.unsaved.pop(model_name, None)
+            self.count_prefetch_waste(model_name)
 
         return model
 
     class GetModel:
-        """the ModelPool's context manager. It serves
-        to automatically store models after use and
-        emulates the 'release' of the models in the code,
-        just like in an Object Pool pattern.
+        """the ModelPool's context manager, which emulates
+        the 'release' of the models in the code, just like
+        in an Object Pool pattern. With change_priority, the
+        model is selected, i.e. a STORED model is loaded
+        into the pool and becomes the CURRENT one. Otherwise
+        it is only looked up, and a STORED model is read
+        from disk without being kept in the pool.
+
+        Code that changes the model must set write. It is
+        then given a copy of the model, which replaces the
+        live model in the pool on exit, unless the block
+        raised an exception or did not change it. The
+        model's lock is held until exit, so that writers
+        take turns. Readers take no lock and keep using the
+        version they were given.
+
+        Nothing is written on exit: a changed model is
+        dirty, and is only written when it is evicted or
+        the pool is flushed, by the Persister in the
+        background.
         """
-        def __init__(self, model_name:str, change_priority=False):
+        def __init__(self, model_name:str, change_priority=False, write=False):
             self.pool = ModelPool()
             self.model_name = model_name
             self.change_priority = change_priority
-            if self.change_priority:
-                self.model = self.pool.select_model(self.model_name)
-            else:
-                self.model = self.pool[self.model_name]
+            self.write = write
 
         def __enter__(self)->Model:
+            if not self.write:
+                return self.get()
+
+            self.pool.check_writable()
+            self.lock = self.pool.model_lock(self.model_name)
+            self.lock.acquire()
+            try:
+                self.previous = self.get()
+                self.model = self.previous.copy()
+            except:
+                self.lock.release()
+                raise
             return self.model
 
         def __exit__(self, exc_type, exc_value, exc_traceback):
-            self.pool.store_model(self.model_name, self.model)
+            if not self.write:
+                return
+            try:
+                if exc_type is None and self.model.version != self.previous.version:
+                    self.pool.commit(self.model_name, self.model, self.previous)
+            finally:
+                self.lock.release()
+
+        def get(self)->Model:
+            if self.change_priority:
+                self.model = self.pool.select_model(self.model_name)
+            else:
+                self.model = self.pool[self.model_name]
+            return self.model
 
     def model_filename(self, name:str):
         """formats a specified model name into the filepath
@@ -427,4 +998,12 @@ class ModelPool:
         :param name: name of the model
         :return: formatted corresponding filepath of the model
         """
-        return CONFIG["storage_dir"] + "/" + name + CONFIG["file_suffix"]
\ No newline at end of file
+        return CONFIG["storage_dir"] + "/" + name + CONFIG["file_suffix"]
+
+    def stem_cache_filename(self):
+        """formats the filepath that the stem cache shared
+        by all models is stored in.
+
+        :return: filepath of the stem cache
+        """
+        return CONFIG["storage_dir"] + "/" + CONFIG["stem_cache_file"]
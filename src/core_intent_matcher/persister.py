@@ -0,0 +1,146 @@
+# standard imports
+from queue import Queue
+from typing import Callable
+import logging
+import threading
+import time
+import zlib
+
+# third party imports
+
+# local imports
+
+logger = logging.getLogger(__name__)
+
+class Persister:
+    """write-behind persistence. Writes are submitted under a key (the
+    path they write to) and run by background worker threads, so that
+    the caller does not wait for the disk. A write submitted while an
+    older write of the same key is still pending replaces it, and the
+    writes of a key always run on the same worker, one at a time.
+
+    A write that raises is logged at ERROR level and counted, and its
+    worker moves on: the write itself must keep what it could not write,
+    so that it can be submitted again.
+    """
+
+    def __init__(self, threads:int, capacity:int):
+        """instantiates the Persister class and starts its workers
+
+        :param threads: number of worker threads, 0 runs every write
+        synchronously on the submitting thread
+        :type threads: int
+        :param capacity: number of keys each worker can have queued.
+        submit() blocks while the queue of the key's worker is full
+        :type capacity: int
+        """
+        self.lock = threading.Condition()
+        self.pending = {} # key -> latest write not yet started
+        self.writing = set()
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_error = None
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        self.queues = [Queue(capacity) for _ in range(threads)]
+        for queue in self.queues:
+            threading.Thread(target=self.work, args=(queue,), daemon=True).start()
+
+    def submit(self, key:str, write:Callable):
+        """schedules a write. The write must not depend on state that
+        the caller may change afterwards, i.e. it should write a snapshot.
+
+        :param key: identifies what is written, usually its path
+        :type key: str
+        :param write: callable without arguments that performs the write
+        :type write: Callable
+        """
+        if not self.queues:
+            self.run(key, write)
+            return
+
+        with self.lock:
+            if key in self.pending:
+                self.pending[key] = write
+                self.coalesced += 1
+                return
+            self.pending[key] = write
+
+        self.queues[zlib.crc32(key.encode()) % len(self.queues)].put(key)
+
+    def work(self, queue:Queue):
+        while True:
+            key = queue.get()
+            with self.lock:
+                write = self.pending.pop(key, None) # None if discarded or already written
+                if write is not None:
+                    self.writing.add(key)
+                else:
+                    self.lock.notify_all()
+
+            if write is not None:
+                self.run(key, write)
+                with self.lock:
+                    self.writing.discard(key)
+                    self.lock.notify_all()
+            queue.task_done()
+
+    def run(self, key:str, write:Callable):
+        start = time.perf_counter()
+        try:
+            write()
+        except Exception as e:
+            logger.error("write of %s failed", key, exc_info=True)
+            with self.lock:
+                self.errors += 1
+                self.last_error = f"{key}: {e!r}"
+            return
+
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.writes += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def wait(self, key:str):
+        """blocks until the writes of a key are done, so that it can be
+        read back from disk
+
+        :param key: key of the writes
+        :type key: str
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: key not in self.pending and key not in self.writing)
+
+    def discard(self, key:str):
+        """cancels the pending write of a key and waits for a write of
+        the key that already started
+
+        :param key: key of the write
+        :type key: str
+        """
+        with self.lock:
+            self.pending.pop(key, None)
+            self.lock.notify_all() # wakes the threads waiting for the key
+            self.lock.wait_for(lambda: key not in self.writing)
+
+    def flush(self):
+        """blocks until every submitted write is done
+        """
+        for queue in self.queues:
+            queue.join()
+
+    def stats(self)->dict:
+        """returns the queue depth and write counters and latencies
+
+        :return: queue depth, writes, coalesced writes, errors, the last
+        error and the mean and max write latency in seconds
+        :rtype: dict
+        """
+        with self.lock:
+            return {"queue_depth": len(self.pending), "writing": len(self.writing), "writes": self.writes, \
+                "coalesced": self.coalesced, "errors": self.errors, "last_error": self.last_error, \
+                "mean_latency": self.total_latency / self.writes if self.writes else 0.0, \
+                "max_latency": self.max_latency}
@@ -0,0 +1,143 @@
+# standard imports
+from collections import OrderedDict
+import threading
+import time
+
+# third party imports
+
+# local imports
+import src.common as common
+
+CONFIG = common.CONFIG["prediction_cache"]
+
+@common.singleton
+class PredictionCache:
+    """LRU cache of predictions keyed by normalized user input, context
+    and the version of the context's model. Retraining a context bumps its
+    version, so predictions made by the previous model are never returned.
+    Entries also expire after prediction_cache.ttl seconds. The cache
+    is thread-safe.
+
+    A prediction is put along with the version of the model that made
+    it, and dropped if the context was invalidated for a newer version
+    meanwhile, so that a retrain racing a prediction cannot leave the
+    old model's prediction cached.
+    """
+
+    def __init__(self):
+        self.capacity = CONFIG["capacity"]
+        self.ttl = CONFIG["ttl"]
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.cleared_version = 0 # version of the latest clear(), for models shared by all contexts
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(user_input:str)->str:
+        """folds the case and whitespace of user input, which the
+        model's analyzer ignores anyway
+
+        :param user_input: input to normalize
+        :type user_input: str
+        :return: normalized input
+        :rtype: str
+        """
+        return ' '.join(user_input.lower().split())
+
+    def key(self, user_input:str, context:str)->tuple:
+        return (self.normalize(user_input), context, self.versions.get(context, 0))
+
+    def get(self, user_input:str, context:str)->common.Prediction:
+        """looks up a cached prediction
+
+        :param user_input: input that was predicted on
+        :type user_input: str
+        :param context: context that the input was predicted in
+        :type context: str
+        :return: the cached prediction, or None if there is none
+        :rtype: common.Prediction
+        """
+        with self.lock:
+            key = self.key(user_input, context)
+            entry = self.entries.get(key)
+
+            if entry is None or (self.ttl and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_input:str, context:str, prediction:common.Prediction, version:int=None):
+        """caches a prediction
+
+        :param user_input: input that was predicted on
+        :type user_input: str
+        :param context: context that the input was predicted in
+        :type context: str
+        :param prediction: prediction to cache
+        :type prediction: common.Prediction
+        :param version: version of the model that made the prediction.
+        The prediction is not cached if the context has been invalidated
+        for a newer version. Defaults to None, which skips the check
+        :type version: int
+        """
+        with self.lock:
+            if version is not None and version < max(self.versions.get(context, 0), self.cleared_version):
+                return
+            key = self.key(user_input, context)
+            self.entries[key] = (time.monotonic() + self.ttl if self.ttl else None, prediction)
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, context:str, version:int=None):
+        """drops every cached prediction of a context. Called whenever
+        the context's model is retrained.
+
+        :param context: context to invalidate
+        :type context: str
+        :param version: new version of the context's model. Defaults to
+        None, in which case the cached version is incremented. The cached
+        version never decreases, e.g. when a removed context is added
+        back with a new model, so that the predictions of the old model
+        are never cached again
+        :type version: int
+        """
+        with self.lock:
+            current = self.versions.get(context, 0)
+            self.versions[context] = current + 1 if version is None else max(current, version)
+
+            for key in [key for key in self.entries if key[1] == context]:
+                del self.entries[key]
+
+    def clear(self, version:int=None):
+        """drops every cached prediction of every context
+
+        :param version: new version of a model shared by all contexts,
+        defaults to None
+        :type version: int
+        """
+        with self.lock:
+            self.entries.clear()
+            if version is not None:
+                self.cleared_version = max(self.cleared_version, version)
+
+    def stats(self)->dict:
+        """returns the size and hit/miss counters of the cache
+
+        :return: size, capacity, hits, misses, evictions and hit rate
+        :rtype: dict
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses, \
+                "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
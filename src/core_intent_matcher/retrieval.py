@@ -0,0 +1,260 @@
+# standard imports
+
+# third party imports
+import numpy as np
+from scipy import sparse
+
+# local imports
+
+def normalize_rows(matrix:sparse.spmatrix, copy=True)->sparse.csr_matrix:
+    """scales every row of a sparse matrix to unit l2 norm. Empty rows
+    are left as they are.
+
+    :param matrix: matrix to normalize
+    :type matrix: sparse.spmatrix
+    :param copy: normalizes a copy of the matrix if True, otherwise a
+    floating point CSR matrix is normalized in place. Defaults to True
+    :return: the normalized matrix
+    :rtype: sparse.csr_matrix
+    """
+    matrix = sparse.csr_matrix(matrix, copy=copy)
+    if not np.issubdtype(matrix.dtype, np.floating):
+        matrix = matrix.astype(np.float64)
+
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    norms = np.sqrt(np.bincount(rows, weights=matrix.data ** 2, minlength=matrix.shape[0]))
+    norms[norms == 0] = 1
+    matrix.data /= norms[rows].astype(matrix.dtype, copy=False)
+
+    return matrix
+
+def csr_nbytes(matrix:sparse.spmatrix)->int:
+    """returns the size of the buffers of a compressed sparse matrix
+
+    :param matrix: CSR or CSC matrix
+    :type matrix: sparse.spmatrix
+    :return: size in bytes
+    :rtype: int
+    """
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+def top_k_indices(scores:np.ndarray, k:int)->np.ndarray:
+    """selects the indices of the k highest scores in descending
+    order of score. Only the k candidates are sorted, the rest of the
+    scores are partitioned away with argpartition.
+
+    :param scores: 1D array of scores
+    :type scores: np.ndarray
+    :param k: number of indices to select
+    :type k: int
+    :return: indices of the k best scores, best first
+    :rtype: np.ndarray
+    """
+    n = scores.shape[0]
+    if k >= n:
+        candidates = np.arange(n)
+    else:
+        candidates = np.argpartition(scores, n - k)[n - k:]
+
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+class TopKRetriever:
+    """retrieval engine for the intent matcher. It keeps the l2 normalized
+    tf-idf rows of every intent as a CSR matrix, so that the cosine similarity
+    of a query against every intent is a single sparse dot product, and only
+    the top k candidates are ranked.
+    """
+
+    def __init__(self, matrix:sparse.spmatrix, labels:list, normalized=False):
+        """instantiates the retriever. The rows are kept as float32.
+
+        :param matrix: one tf-idf row per label
+        :type matrix: sparse.spmatrix
+        :param labels: labels (intentIDs) corresponding to the matrix rows
+        :type labels: list
+        :param normalized: whether the rows are already l2 normalized,
+        otherwise they are normalized in place. Defaults to False
+        """
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        if not normalized:
+            self.matrix = normalize_rows(self.matrix, copy=False)
+        self.labels = np.asarray(labels)
+
+    def __len__(self)->int:
+        return self.matrix.shape[0]
+
+    def nbytes(self)->int:
+        """estimates the memory held by the retriever
+
+        :return: size in bytes
+        :rtype: int
+        """
+        return csr_nbytes(self.matrix) + self.labels.nbytes
+
+    def scores(self, queries:sparse.spmatrix)->np.ndarray:
+        """cosine similarities between each query and every row
+
+        :param queries: tf-idf vectors of the queries, one per row
+        :type queries: sparse.spmatrix
+        :return: dense array of shape (number of queries, number of rows)
+        :rtype: np.ndarray
+        """
+        queries = normalize_rows(queries)
+        # multiplying the CSR matrix from the left keeps scipy from
+        # converting (copying) the whole matrix on every call
+        return (self.matrix @ queries.T).T.toarray()
+
+    def top_k(self, queries:sparse.spmatrix, k:int, chunk_size:int=None)->list:
+        """ranks the k most similar labels for every query
+
+        :param queries: tf-idf vectors of the queries, one per row
+        :type queries: sparse.spmatrix
+        :param k: number of candidates to return per query
+        :type k: int
+        :param chunk_size: number of queries scored per matrix product, which
+        bounds the size of the dense score matrix. Defaults to None (all at once)
+        :type chunk_size: int
+        :return: one list per query of (label, similarity) tuples, most
+        similar first
+        :rtype: List[List[Tuple[int, float]]]
+        """
+        queries = sparse.csr_matrix(queries)
+        n_queries = queries.shape[0]
+        chunk_size = chunk_size or max(n_queries, 1)
+
+        results = []
+        for start in range(0, n_queries, chunk_size):
+            for scores in self.scores(queries[start:start + chunk_size]):
+                idx = top_k_indices(scores, k)
+                results.append(list(zip(self.labels[idx].tolist(), scores[idx].tolist())))
+
+        return results
+
+class InvertedIndexRetriever(TopKRetriever):
+    """retrieval engine that keeps a posting list per term (the rows that
+    contain the term, with their weights) and only accumulates the scores
+    of the rows that share a term with the query. With max_score enabled,
+    the query terms are processed by decreasing upper bound and once the
+    terms left can no longer lift an unseen row into the top k, they are
+    only applied to the current candidates (MaxScore). Both ways return the
+    same top k as TopKRetriever. The upper bounds and the rows filled in
+    with a similarity of 0 rely on the weights being non-negative.
+    """
+
+    def __init__(self, matrix:sparse.spmatrix, labels:list, normalized=False, max_score=True):
+        """instantiates the retriever and builds the posting lists
+
+        :param matrix: one tf-idf row per label
+        :type matrix: sparse.spmatrix
+        :param labels: labels (intentIDs) corresponding to the matrix rows
+        :type labels: list
+        :param normalized: whether the rows are already l2 normalized,
+        otherwise they are normalized in place. Defaults to False
+        :param max_score: enables MaxScore early termination, defaults to True
+        :raises ValueError: if the matrix has negative weights
+        """
+        super().__init__(matrix, labels, normalized)
+        if (self.matrix.data < 0).any():
+            raise ValueError("the inverted index needs non-negative weights, hash without alternate_sign.")
+        self.max_score = max_score
+        self.postings = self.matrix.tocsc()
+        self.postings.sort_indices()
+        self.max_weights = self.postings.max(axis=0).toarray().ravel() if len(self) else np.zeros(self.matrix.shape[1])
+
+    def nbytes(self)->int:
+        return super().nbytes() + csr_nbytes(self.postings) + self.max_weights.nbytes
+
+    def posting(self, term:int)->tuple:
+        """returns the posting list of a term
+
+        :param term: column of the term
+        :type term: int
+        :return: rows containing the term, in ascending order, and the
+        term's weight in each of them
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        start, end = self.postings.indptr[term], self.postings.indptr[term + 1]
+        return self.postings.indices[start:end], self.postings.data[start:end]
+
+    def candidates(self, terms:np.ndarray, weights:np.ndarray, k:int)->tuple:
+        """accumulates the scores of the rows sharing terms with a query
+
+        :param terms: columns of the query terms
+        :type terms: np.ndarray
+        :param weights: normalized weights of the query terms
+        :type weights: np.ndarray
+        :param k: number of candidates that will be kept
+        :type k: int
+        :return: candidate rows and their exact scores. Every row of the
+        top k with a non-zero score is among the candidates.
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        if not self.max_score:
+            posting_rows = [np.empty(0, dtype=np.int64)]
+            posting_scores = [np.empty(0)]
+            for term, weight in zip(terms, weights):
+                rows, term_weights = self.posting(term)
+                posting_rows.append(rows)
+                posting_scores.append(weight * term_weights)
+
+            rows, inverse = np.unique(np.concatenate(posting_rows), return_inverse=True)
+            return rows, np.bincount(inverse, weights=np.concatenate(posting_scores), minlength=len(rows))
+
+        bounds = weights * self.max_weights[terms]
+        order = np.argsort(-bounds, kind="stable")
+        terms, weights = terms[order], weights[order]
+        remaining = np.cumsum(bounds[order][::-1])[::-1]
+
+        rows = np.empty(0, dtype=np.int64)
+        scores = np.empty(0)
+        for i, (term, weight) in enumerate(zip(terms, weights)):
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k] if 0 < k <= len(scores) else -np.inf
+            if remaining[i] < threshold:
+                # no unseen row can reach the k-th score, so only the candidates left are scored
+                keep = scores + remaining[i] >= threshold
+                rows, scores = rows[keep], scores[keep]
+                for term, weight in zip(terms[i:], weights[i:]):
+                    posting_rows, posting_weights = self.posting(term)
+                    if len(posting_rows):
+                        pos = np.minimum(np.searchsorted(posting_rows, rows), len(posting_rows) - 1)
+                        hit = posting_rows[pos] == rows
+                        scores[hit] += weight * posting_weights[pos[hit]]
+                break
+
+            posting_rows, posting_weights = self.posting(term)
+            rows, inverse = np.unique(np.concatenate([rows, posting_rows]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, weight * posting_weights]), minlength=len(rows))
+
+        return rows, scores
+
+    def top_k(self, queries:sparse.spmatrix, k:int, chunk_size:int=None)->list:
+        """ranks the k most similar labels for every query. Rows that share
+        no term with a query fill up the k results with a similarity of 0.
+
+        :param queries: tf-idf vectors of the queries, one per row
+        :type queries: sparse.spmatrix
+        :param k: number of candidates to return per query
+        :type k: int
+        :param chunk_size: unused, queries are scored one at a time
+        :type chunk_size: int
+        :return: one list per query of (label, similarity) tuples, most
+        similar first
+        :rtype: List[List[Tuple[int, float]]]
+        """
+        queries = normalize_rows(queries)
+        k = min(k, len(self))
+
+        results = []
+        for i in range(queries.shape[0]):
+            start, end = queries.indptr[i], queries.indptr[i + 1]
+            rows, scores = self.candidates(queries.indices[start:end], queries.data[start:end], k)
+            idx = top_k_indices(scores, k)
+            rows, scores = rows[idx], scores[idx]
+
+            if len(rows) < k:
+                fill = np.setdiff1d(np.arange(min(len(self), 2 * k)), rows)[:k - len(rows)]
+                rows, scores = np.concatenate([rows, fill]), np.concatenate([scores, np.zeros(len(fill))])
+
+            results.append(list(zip(self.labels[rows].tolist(), scores.tolist())))
+
+        return results
@@ -0,0 +1,244 @@
+# standard imports
+from collections import Counter
+from typing import Callable, List
+import copy
+import sys
+
+# third party imports
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# local imports
+from src.core_intent_matcher.retrieval import normalize_rows, csr_nbytes
+
+class IncrementalTfidf:
+    """tf-idf featurizer that keeps the raw term counts of every row
+    and the document frequency of every term, so that rows can be added,
+    extended or removed without re-analyzing the rest of the corpus.
+    Its weighting is the same as sklearn's TfidfVectorizer defaults:
+    raw term frequency, smoothed idf and l2 normalized rows.
+
+    Updates replace the count matrix and arrays instead of altering them,
+    so that copies can share them.
+    """
+
+    def __init__(self, analyzer:Callable):
+        """instantiates the featurizer
+
+        :param analyzer: callable that turns a document into its terms
+        :type analyzer: Callable
+        """
+        self.analyzer = analyzer
+        self.reset()
+
+    def reset(self):
+        """discards all rows and terms
+        """
+        self.vocabulary_ = {}
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.df = np.zeros(0, dtype=np.int64)
+        self.idf_ = np.zeros(0)
+
+    def copy(self):
+        """returns a copy of the featurizer that can be updated without
+        altering this one. Only the vocabulary is copied, the arrays are
+        shared.
+
+        :return: the copy
+        :rtype: IncrementalTfidf
+        """
+        featurizer = copy.copy(self)
+        featurizer.vocabulary_ = dict(self.vocabulary_)
+        return featurizer
+
+    def __len__(self)->int:
+        """returns the number of rows (documents) in the featurizer
+
+        :return: number of rows
+        """
+        return self.counts.shape[0]
+
+    def nbytes(self)->int:
+        """estimates the memory held by the featurizer: the term counts,
+        document frequencies, idf and vocabulary
+
+        :return: size in bytes
+        :rtype: int
+        """
+        vocabulary = sys.getsizeof(self.vocabulary_) + sum(map(sys.getsizeof, self.vocabulary_))
+        return csr_nbytes(self.counts) + self.df.nbytes + self.idf_.nbytes + vocabulary
+
+    def count(self, docs:List[str], grow=False)->sparse.csr_matrix:
+        """counts the terms of each document
+
+        :param docs: documents to count the terms of
+        :type docs: List[str]
+        :param grow: adds unseen terms to the vocabulary if True,
+        otherwise unseen terms are ignored. Defaults to False
+        :return: term counts, one row per document
+        :rtype: sparse.csr_matrix
+        """
+        indptr = [0]
+        indices = []
+        values = []
+
+        for doc in docs:
+            for term, freq in Counter(self.analyzer(doc)).items():
+                col = self.vocabulary_.get(term)
+                if col is None:
+                    if not grow:
+                        continue
+                    col = self.vocabulary_[term] = len(self.vocabulary_)
+                indices.append(col)
+                values.append(freq)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix((np.asarray(values, dtype=np.int64), np.asarray(indices, dtype=np.int64), indptr), \
+            shape=(len(docs), len(self.vocabulary_)))
+
+    def fit_transform(self, docs:List[str])->sparse.csr_matrix:
+        """discards all rows and learns the given documents instead
+
+        :param docs: one document per row
+        :type docs: List[str]
+        :return: the tf-idf matrix of the documents
+        :rtype: sparse.csr_matrix
+        """
+        self.reset()
+        self.add_rows(docs)
+
+        return self.tfidf_matrix()
+
+    def transform(self, docs:List[str])->sparse.csr_matrix:
+        """featurizes documents with the learned vocabulary and idf
+
+        :param docs: documents to featurize
+        :type docs: List[str]
+        :return: tf-idf vectors of the documents, one per row
+        :rtype: sparse.csr_matrix
+        """
+        return normalize_rows(self.count(docs).multiply(self.idf_), copy=False)
+
+    def add_rows(self, docs:List[str]):
+        """appends new rows to the featurizer
+
+        :param docs: one document per new row
+        :type docs: List[str]
+        """
+        new_counts = self.count(docs, grow=True)
+        self._resize_vocabulary()
+
+        self.counts = sparse.vstack([self.counts, new_counts], format='csr')
+        self.df = self.df + np.bincount(new_counts.indices, minlength=len(self.df))
+        self._update_idf()
+
+    def extend_rows(self, rows:List[int], docs:List[str]):
+        """adds the terms of documents to existing rows. Only the extended
+        rows are analyzed and only their terms' document frequencies change.
+
+        :param rows: indices of the rows to extend
+        :type rows: List[int]
+        :param docs: documents to add, one per row index
+        :type docs: List[str]
+        """
+        delta = self.count(docs, grow=True)
+        self._resize_vocabulary()
+
+        delta_full = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, np.arange(len(rows)))), \
+            shape=(len(self), len(rows))) @ delta
+
+        unique_rows = np.unique(rows)
+        old_nonzero = np.bincount(self.counts[unique_rows].indices, minlength=len(self.df))
+        self.counts = (self.counts + delta_full).tocsr()
+        new_nonzero = np.bincount(self.counts[unique_rows].indices, minlength=len(self.df))
+
+        self.df = self.df + new_nonzero - old_nonzero
+        self._update_idf()
+
+    def remove_rows(self, rows:List[int]):
+        """removes rows from the featurizer. The remaining rows keep
+        their order.
+
+        :param rows: indices of the rows to remove
+        :type rows: List[int]
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+
+        self.df = self.df - np.bincount(self.counts[~keep].indices, minlength=len(self.df))
+        self.counts = self.counts[keep]
+        self._update_idf()
+
+    def reorder_rows(self, order:List[int]):
+        """permutes the rows of the featurizer
+
+        :param order: row indices in their new order
+        :type order: List[int]
+        """
+        self.counts = self.counts[order]
+
+    def tfidf_matrix(self)->sparse.csr_matrix:
+        """weights the term counts of every row by idf
+
+        :return: l2 normalized tf-idf matrix, one row per document
+        :rtype: sparse.csr_matrix
+        """
+        return normalize_rows(self.counts.multiply(self.idf_), copy=False)
+
+    def _resize_vocabulary(self):
+        n_terms = len(self.vocabulary_)
+        if n_terms > len(self.df):
+            self.counts = sparse.csr_matrix((self.counts.data, self.counts.indices, self.counts.indptr), \
+                shape=(len(self), n_terms))
+            self.df = np.concatenate([self.df, np.zeros(n_terms - len(self.df), dtype=np.int64)])
+
+    def _update_idf(self):
+        # terms left in no row get a zero weight, as if they were never learned
+        self.idf_ = np.where(self.df > 0, np.log((1 + len(self)) / (1 + self.df)) + 1, 0)
+
+class HashingTfidf(IncrementalTfidf):
+    """IncrementalTfidf over a fixed number of hashed features instead of
+    a learned vocabulary. Terms are mapped to columns by a signed hash, so
+    featurizing needs no vocabulary lookups and there is no vocabulary to
+    store. The document frequency and idf are dense arrays of n_features.
+    Terms that collide share a column, which blurs their idf.
+    """
+
+    def __init__(self, analyzer:Callable, n_features:int, alternate_sign=True):
+        """instantiates the featurizer
+
+        :param analyzer: callable that turns a document into its terms
+        :type analyzer: Callable
+        :param n_features: number of columns that terms are hashed into
+        :type n_features: int
+        :param alternate_sign: signs the counts by the hash, so that
+        colliding terms tend to cancel out. Defaults to True. The weights
+        are only non-negative without it, which InvertedIndexRetriever needs
+        """
+        self.hasher = HashingVectorizer(analyzer=analyzer, n_features=n_features, alternate_sign=alternate_sign, \
+            norm=None)
+        self.n_features = n_features
+        self.alternate_sign = alternate_sign
+        super().__init__(analyzer)
+
+    def reset(self):
+        super().reset()
+        self.counts = sparse.csr_matrix((0, self.n_features), dtype=np.int64)
+        self.df = np.zeros(self.n_features, dtype=np.int64)
+        self.idf_ = np.zeros(self.n_features)
+
+    def count(self, docs:List[str], grow=False)->sparse.csr_matrix:
+        """counts the terms of each document into their hashed columns.
+        With alternate_sign the counts are signed, so that colliding terms
+        tend to cancel out rather than add up.
+
+        :param docs: documents to count the terms of
+        :type docs: List[str]
+        :param grow: ignored, every term has a column
+        :return: term counts, one row per document
+        :rtype: sparse.csr_matrix
+        """
+        counts = self.hasher.transform(docs).astype(np.int64)
+        counts.eliminate_zeros()
+        return counts
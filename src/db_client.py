@@ -1,44 +1,221 @@
 # standard imports
 import sqlite3
 import ast
+import json
+import threading
+import time
 # third party imports
 
 # local imports
 import src.common as common
-
-def literal_eval_row(row:tuple):
-    return *row[:2], ast.literal_eval(row[2]), ast.literal_eval(row[3]), *row[4:]
+from src.core_intent_matcher.metrics import LatencyHistogram
 
 CONFIG = common.CONFIG["db_client"]
+SCHEMA_VERSION = 2 # kept in PRAGMA user_version, 0 for databases that store lists as strings
+TABLES = ("skills", "intent_matches", "intent_responses", "intents", "users", "global_vars")
+TEXT_TABLES = ("intent_matches", "intent_responses")
+
+# the statements bind every value as a parameter, so that their text is
+# constant and each connection compiles them once into its statement cache
+# the matches and responses of an intent are aggregated into JSON arrays,
+# so that a single statement fetches whole intents
+# json_group_array() makes no promise about the order it aggregates in,
+# so the texts come with their positions and are sorted by fetch_intents()
+INTENT_COLUMNS = "intentID, intent, \
+    (SELECT json_group_array(json_array(position, text)) FROM intent_matches \
+        WHERE intent_matches.intentID=intents.intentID), \
+    (SELECT json_group_array(json_array(position, text)) FROM intent_responses \
+        WHERE intent_responses.intentID=intents.intentID), \
+    context, link, intent_type"
+SELECT_INTENTS_BY_CONTEXT = f"SELECT {INTENT_COLUMNS} FROM intents WHERE context=?"
+SELECT_INTENT_BY_NAME = f"SELECT {INTENT_COLUMNS} FROM intents WHERE intent=? AND context=? LIMIT 1"
+SELECT_INTENT_BY_ID = f"SELECT {INTENT_COLUMNS} FROM intents WHERE intentID=?"
+SELECT_INTENTS_BY_IDS = f"SELECT {INTENT_COLUMNS} FROM intents WHERE intentID IN (SELECT value FROM json_each(?))"
+SELECT_INTENT_IDS_BY_NAME = "SELECT intentID FROM intents WHERE intent=? AND context=?"
+SELECT_LINKS = "SELECT DISTINCT link FROM intents WHERE context=?"
+SELECT_LAST_ID = "SELECT last_insert_rowid()"
+COUNT_INTENTS = "SELECT COUNT(intentID) FROM intents WHERE context=?"
+INSERT_INTENT = "INSERT INTO intents (intent, context, link, intent_type) VALUES (?, ?, ?, ?)"
+DELETE_INTENT = "DELETE FROM intents WHERE intent=? AND context=?"
+DELETE_CONTEXT = "DELETE FROM intents WHERE context=?"
+INSERT_TEXT = {table: f"INSERT INTO {table} (intentID, position, text) VALUES (?, ?, ?)" for table in TEXT_TABLES}
+DELETE_TEXTS = {table: f"DELETE FROM {table} WHERE intentID=?" for table in TEXT_TABLES}
+APPEND_MATCH = "INSERT INTO intent_matches (intentID, position, text) VALUES (?, \
+    (SELECT COALESCE(MAX(position), -1) + 1 FROM intent_matches WHERE intentID=?), ?)"
+INSERT_SKILL = "INSERT INTO skills (skill_name, class) VALUES (?, ?) ON CONFLICT(skill_name) DO NOTHING"
+SELECT_SKILL = "SELECT class FROM skills WHERE skill_name=?"
+DELETE_SKILL = "DELETE FROM skills WHERE skillID=?"
+UPSERT_GLOBAL_VAR = "INSERT INTO global_vars (key, val, uid) VALUES (?, ?, ?) \
+    ON CONFLICT(key, uid) DO UPDATE SET val=excluded.val"
+SELECT_GLOBAL_VAR = "SELECT val FROM global_vars WHERE key=? AND uid=?"
+DELETE_GLOBAL_VAR = "DELETE FROM global_vars WHERE key=? AND uid=?"
+INSERT_USER = "INSERT INTO users (name) VALUES (?)"
+UPDATE_USER = "UPDATE users SET name=? WHERE uid=?"
+DELETE_USER = "DELETE FROM users WHERE uid=?"
+SELECT_USER_NAME = "SELECT name FROM users WHERE uid=?"
+SELECT_USER_UID = "SELECT uid FROM users WHERE name=?"
+
+def sorted_texts(column:str)->list:
+    """decodes the (position, text) pairs that INTENT_COLUMNS aggregates
+    for an intent
+
+    :param column: json array of [position, text] pairs
+    :type column: str
+    :return: texts, ordered by their position
+    :rtype: list
+    """
+    return [text for _, text in sorted(json.loads(column))]
 
 @common.singleton
 class DB_Client:
     """ a class for abstracting database queries
         that are common for storing data for the bag
         of words model 
+
+    Every thread gets its own connection and cursor (conn and cur), so
+    that the client can be shared by the threads serving chats. The
+    database runs in WAL journal mode, in which readers do not block
+    the writer and the writer does not block readers. Writers wait up to
+    db_client.busy_timeout seconds for each other.
+
+    The matches and responses of the intents are kept in the child tables
+    intent_matches and intent_responses, one row per text. Rows of
+    intents are returned as tuples of
+    (intentID, intent, matches, responses, context, link, intent_type).
+
+    Queries run through execute(), executemany(), query() and query_one()
+    with one of the constant statements above. With
+    db_client.statement_timing, the latency of every statement is
+    recorded, see stats().
     """
 
     def __init__(self):
         """create instance of DB_Client. 
-        It creates a connection to the database and
-        the database if it does not exist.
-
-        :param db_name: name of the database to connect to or create
+        It creates the database if it does not exist.
+        Connections are opened by the threads on first use.
         """
-        def connect_db():
-            self.conn = sqlite3.connect(CONFIG["db_name"])
-            self.cur = self.conn.cursor()
-
-        if hasattr(self, "conn"):
-            if not self.is_conn():
-                connect_db()
-        else:
-            connect_db()
+        self.db_name = CONFIG["db_name"]
+        self.local = threading.local()
+        self.timing = CONFIG["statement_timing"]
+        self.latencies = {} # statement -> LatencyHistogram
+        self.lock = threading.Lock()
 
         self.create_global_vars_table()
         self.create_intents_table()
         self.create_skills_table()
         self.create_users_table()
+        self.migrate()
+        self.create_indexes()
+
+    def connect(self)->sqlite3.Connection:
+        """opens the connection of the calling thread and tunes it with
+        the pragmas of the db_client config
+
+        :return: the connection
+        :rtype: sqlite3.Connection
+        """
+        conn = sqlite3.connect(self.db_name, timeout=CONFIG["busy_timeout"], \
+            cached_statements=CONFIG["cached_statements"])
+        conn.execute(f"PRAGMA journal_mode={CONFIG['journal_mode']}")
+        conn.execute(f"PRAGMA synchronous={CONFIG['synchronous']}")
+        conn.execute(f"PRAGMA cache_size={CONFIG['cache_size']}")
+        conn.execute(f"PRAGMA mmap_size={CONFIG['mmap_size']}")
+        conn.execute("PRAGMA foreign_keys=ON") # deleting intents deletes their matches and responses
+        self.local.conn, self.local.cur = conn, conn.cursor()
+        return conn
+
+    @property
+    def conn(self)->sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        return self.connect() if conn is None else conn
+
+    @property
+    def cur(self)->sqlite3.Cursor:
+        if getattr(self.local, "cur", None) is None:
+            self.connect()
+        return self.local.cur
+
+    def close(self):
+        """closes the connection of the calling thread. The thread
+        reconnects on its next query.
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            del self.local.conn, self.local.cur
+
+    def execute(self, statement:str, params=())->sqlite3.Cursor:
+        """runs a statement on the calling thread's cursor
+
+        :param statement: one of the statements of this module
+        :type statement: str
+        :param params: values bound to the statement's parameters
+        :return: the cursor, for its rowcount and lastrowid
+        :rtype: sqlite3.Cursor
+        """
+        start = time.perf_counter()
+        cur = self.cur.execute(statement, params)
+        self.observe(statement, start)
+        return cur
+
+    def executemany(self, statement:str, rows)->sqlite3.Cursor:
+        """runs a statement once per row of parameters, see execute()
+
+        :param statement: one of the statements of this module
+        :type statement: str
+        :param rows: iterable of the values bound to the parameters
+        :return: the cursor
+        :rtype: sqlite3.Cursor
+        """
+        start = time.perf_counter()
+        cur = self.cur.executemany(statement, rows)
+        self.observe(statement, start)
+        return cur
+
+    def query(self, statement:str, params=())->list:
+        """runs a query and fetches all of its rows, see execute()
+
+        :return: the rows
+        :rtype: list
+        """
+        start = time.perf_counter()
+        rows = self.cur.execute(statement, params).fetchall()
+        self.observe(statement, start)
+        return rows
+
+    def query_one(self, statement:str, params=())->tuple:
+        """runs a query and fetches its first row, see execute()
+
+        :return: the first row, None if there is none
+        :rtype: tuple
+        """
+        start = time.perf_counter()
+        row = self.cur.execute(statement, params).fetchone()
+        self.observe(statement, start)
+        return row
+
+    def observe(self, statement:str, start:float):
+        if not self.timing:
+            return
+        latency = time.perf_counter() - start
+        histogram = self.latencies.get(statement)
+        if histogram is None:
+            with self.lock:
+                histogram = self.latencies.setdefault(statement, LatencyHistogram())
+        histogram.observe(latency)
+
+    def stats(self)->dict:
+        """returns the latency of every statement run so far, including
+        the time to fetch the rows of queries
+
+        :return: count, mean, percentiles and max in seconds of every
+        statement, keyed by the statement
+        :rtype: dict
+        """
+        with self.lock:
+            latencies = dict(self.latencies)
+        return {statement: {key: value for key, value in histogram.stats().items() if key != "buckets"} \
+            for statement, histogram in latencies.items()}
 
     def is_conn(self):
         result = False
@@ -60,20 +237,112 @@ class DB_Client:
         self.cur.execute("CREATE TABLE IF NOT EXISTS intents( \
                 intentID INTEGER PRIMARY KEY AUTOINCREMENT, \
                 intent TEXT, \
-                matches TEXT, \
-                responses TEXT, \
                 context TEXT, \
                 link TEXT, \
                 intent_type TEXT \
             )"
         )
+        self.create_intent_texts_tables()
+
+    def create_intent_texts_tables(self):
+        """creates the tables of the matches and responses of the
+        intents, which hold every text of an intent at its position
+        in the intent's list
+        """
+        for table in TEXT_TABLES:
+            self.cur.execute(f"CREATE TABLE IF NOT EXISTS {table}( \
+                    intentID INTEGER NOT NULL REFERENCES intents(intentID) ON DELETE CASCADE, \
+                    position INTEGER NOT NULL, \
+                    text TEXT, \
+                    PRIMARY KEY (intentID, position) \
+                ) WITHOUT ROWID"
+            )
+
+    def migrate(self):
+        """migrates the database to SCHEMA_VERSION in a single
+        transaction. Databases of version 0 store the matches and
+        responses of the intents as strings of python lists in the
+        intents table, they are moved to the intent_matches and
+        intent_responses tables. Databases before version 2 may hold
+        duplicate global variables and skills, which the unique indexes
+        of create_indexes() rule out. Only the latest value of a global
+        variable and the first mapping of a skill, which get_skill()
+        returned, are kept. The schema is read inside the transaction,
+        so that of several processes opening the database at once, only
+        the first one migrates it.
+        """
+        self.cur.execute("BEGIN IMMEDIATE")
+        try:
+            version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                self.conn.commit()
+                return
+
+            columns = [row[1] for row in self.cur.execute("PRAGMA table_info(intents)")]
+            if version < 2:
+                self.cur.execute("DELETE FROM global_vars WHERE varID NOT IN \
+                    (SELECT MAX(varID) FROM global_vars GROUP BY key, uid)")
+                self.cur.execute("DELETE FROM skills WHERE skillID NOT IN \
+                    (SELECT MIN(skillID) FROM skills GROUP BY skill_name)")
+            if "matches" in columns:
+                rows = self.cur.execute("SELECT intentID, matches, responses FROM intents").fetchall()
+                self.create_intent_texts_tables()
+                self.insert_texts("intent_matches", [(intentID, ast.literal_eval(matches)) \
+                    for intentID, matches, _ in rows])
+                self.insert_texts("intent_responses", [(intentID, ast.literal_eval(responses)) \
+                    for intentID, _, responses in rows])
+                self.cur.execute("ALTER TABLE intents DROP COLUMN matches")
+                self.cur.execute("ALTER TABLE intents DROP COLUMN responses")
+            self.cur.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        except:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def create_indexes(self):
+        """creates the indexes of the lookups by name, context, key
+        and uid. The keys of global variables and the names of skills
+        are unique, so that they can be upserted.
+        """
+        self.cur.execute("CREATE INDEX IF NOT EXISTS intents_context_intent ON intents(context, intent)")
+        self.cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS global_vars_key_uid ON global_vars(key, uid)")
+        self.cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS skills_skill_name ON skills(skill_name)")
+        self.cur.execute("CREATE INDEX IF NOT EXISTS users_name ON users(name)")
+
+    def insert_texts(self, table:str, texts:list):
+        """inserts the matches or responses of intents
+
+        :param table: intent_matches or intent_responses
+        :type table: str
+        :param texts: (intentID, list of texts) of the intents
+        :type texts: list
+        """
+        self.executemany(INSERT_TEXT[table], [(intentID, position, text) \
+            for intentID, intent_texts in texts for position, text in enumerate(intent_texts)])
+
+    def fetch_intents(self, statement:str, params:tuple=())->list:
+        """fetches the rows of the intents that a query selects, along
+        with their matches and responses
+
+        :param statement: query selecting the INTENT_COLUMNS of intents
+        :type statement: str
+        :param params: parameters of the query, defaults to ()
+        :type params: tuple
+        :return: rows of the intents, in the order of the intents table
+        :rtype: list
+        """
+        return [(intentID, intent, sorted_texts(matches), sorted_texts(responses), *row) \
+            for intentID, intent, matches, responses, *row in self.query(statement, params)]
 
     def drop_table(self, table_name:str):
         """drop a specified table
 
         :param table_name: the table's identifying name
         :type table_name: str
+        :raises ValueError: if the table is not one of TABLES
         """
+        if table_name not in TABLES:
+            raise ValueError(f"unknown table '{table_name}'.")
         self.cur.execute(f"DROP TABLE {table_name}")
         self.conn.commit()
     
@@ -89,28 +358,46 @@ class DB_Client:
         :param intent_type: type of intent
         """
 
-        self.cur.execute("INSERT INTO intents (intent, matches, responses, context, link, intent_type) \
-            VALUES (?, ?, ?, ?, ?, ?)", (intent, str(matches), str(responses), context, link, intent_type))
-        self.conn.commit()
-        self.cur.execute("SELECT last_insert_rowid()")
-        return self.cur.fetchone()[0]
+        with self.conn:
+            intentID = self.execute(INSERT_INTENT, (intent, context, link, intent_type)).lastrowid
+            self.insert_texts("intent_matches", [(intentID, matches)])
+            self.insert_texts("intent_responses", [(intentID, responses)])
 
+        return intentID
 
-    def insert_intents_json(self, json_data:dict, context:str):
+
+    def insert_intents_json(self, json_data:dict, context:str, replace=False)->list:
         """inserts intents from json file into database
+        in a single transaction
 
         :param context: name of context to insert intents into
-        :param json_data: json data to insert
+        :param json_data: json data to insert, with intents as keys
+        and their attributes as values
+        :param replace: deletes the intents that the context already
+        has in the same transaction if True, defaults to False
+        :return: intentIDs of the inserted intents, in order
+        :rtype: list
         """
-        row_ids = []
-
-        for intent in json_data:
-            intent_data = json_data[intent]
-
-            row_id = self.insert_intent(intent, intent_data["matches"], intent_data["responses"], \
-                context, intent_data["link"], intent_data["type"])
-            row_ids.append(row_id)
-        return row_ids
+        rows = [(intent, context, intent_data["link"], intent_data["type"]) \
+            for intent, intent_data in json_data.items()]
+        if not rows and not replace:
+            return []
+
+        with self.conn: # commits, or rolls back on error
+            if replace:
+                self.execute(DELETE_CONTEXT, (context,))
+            self.executemany(INSERT_INTENT, rows)
+            # the transaction holds the write lock, and AUTOINCREMENT
+            # assigns the rows consecutive intentIDs
+            last_id = self.query_one(SELECT_LAST_ID)[0]
+            intentIDs = list(range(last_id - len(rows) + 1, last_id + 1)) if rows else []
+
+            self.insert_texts("intent_matches", [(intentID, intent_data["matches"]) \
+                for intentID, intent_data in zip(intentIDs, json_data.values())])
+            self.insert_texts("intent_responses", [(intentID, intent_data["responses"]) \
+                for intentID, intent_data in zip(intentIDs, json_data.values())])
+
+        return intentIDs
 
     def get_intents(self, context:str):
         """returns a list of intents from a specified context.
@@ -121,8 +408,19 @@ class DB_Client:
         :param context: name of context to get intents from
         """
 
-        self.cur.execute(f"SELECT * FROM intents WHERE context='{context}'")
-        return list(map(literal_eval_row, self.cur.fetchall()))
+        return self.fetch_intents(SELECT_INTENTS_BY_CONTEXT, (context,))
+
+    def get_links(self, context:str)->list:
+        """returns the distinct contexts that the intents of a context
+        link to, i.e. the outgoing edges of the context in the
+        conversation graph
+
+        :param context: name of the context
+        :type context: str
+        :return: linked contexts
+        :rtype: list
+        """
+        return [row[0] for row in self.query(SELECT_LINKS, (context,))]
 
     def get_intent(self, intent:str, context:str):
         """returns a specific intent with specific context
@@ -133,11 +431,20 @@ class DB_Client:
         :type context: str
         """
 
-        self.cur.execute(f"SELECT * FROM intents WHERE intent='{intent}' AND context='{context}'")
-        query_result = self.cur.fetchone()
-        
-        return [] if query_result is None\
-            else list(map(literal_eval_row, [query_result]))
+        return self.fetch_intents(SELECT_INTENT_BY_NAME, (intent, context))
+
+    def get_intent_ids(self, intent:str, context:str)->list:
+        """returns the intentIDs of every row of an intent, of which
+        there can be more than one with the same name and context
+
+        :param intent: identifying name of the intent
+        :type intent: str
+        :param context: context in which the intent is based
+        :type context: str
+        :return: intentIDs of the intent's rows
+        :rtype: list
+        """
+        return [row[0] for row in self.query(SELECT_INTENT_IDS_BY_NAME, (intent, context))]
 
     def drop_intent(self, intent:str, context:str)->int:
         """drop an intent from the intents table
@@ -150,52 +457,41 @@ class DB_Client:
         If none were deleted, then -1 is returned
         :rtype: int
         """
-        self.cur.execute(\
-            f"SELECT COUNT(intentID) FROM intents WHERE context='{context}'")
-        count_bef = self.cur.fetchone()[0]
-
-        if count_bef:
-            self.cur.execute(f"DELETE FROM intents WHERE intent='{intent}' AND context='{context}'")
-            self.conn.commit()
-        
-            self.cur.execute(\
-                f"SELECT COUNT(intentID) FROM intents WHERE context='{context}'")
-            count_aft = self.cur.fetchone()[0]
-
-            return count_aft if count_bef > count_aft else -1
-        else:
-            return -1
+        with self.conn:
+            if not self.execute(DELETE_INTENT, (intent, context)).rowcount:
+                return -1
+            return self.query_one(COUNT_INTENTS, (context,))[0]
 
     def drop_context(self, context:str):
-        self.cur.execute(\
-            f"SELECT COUNT(intentID) FROM intents WHERE context='{context}'")
-        count = self.cur.fetchone()[0]
-
-        if count:
-            self.cur.execute(f"DELETE FROM intents WHERE context='{context}'")
-            return 0
-        else:
-            return -1
+        with self.conn:
+            return 0 if self.execute(DELETE_CONTEXT, (context,)).rowcount else -1
 
     def update_intent_matches(self, intentID:int, matches:list):
-        """updates the matches column of the intents table for
-        a specific intent
+        """replaces the matches of a specific intent
 
         :param intentID: identifying number of intent to update
         :type intent: str
         :param matches: new list of user dialogues used to match with intent
         :type matches: list
         """
-        intentID = str(intentID)
-        matches = str(matches)
-        matches = matches.replace("'", "''")
+        with self.conn:
+            self.execute(DELETE_TEXTS["intent_matches"], (intentID,))
+            self.insert_texts("intent_matches", [(intentID, matches)])
 
-        self.cur.execute(f"UPDATE intents SET matches='{matches}' WHERE intentID={intentID}")
-        self.conn.commit()
+    def append_intent_matches(self, intentID:int, matches:list):
+        """appends matches to the matches of a specific intent,
+        without rewriting the ones it already has
+
+        :param intentID: identifying number of intent to update
+        :type intent: str
+        :param matches: user dialogues to add to the intent's matches
+        :type matches: list
+        """
+        with self.conn:
+            self.executemany(APPEND_MATCH, [(intentID, intentID, match) for match in matches])
 
     def update_intent_responses(self, intent:str, context:str, responses:list):
-        """updates the 'context' column of the intents table 
-        for a specific intent
+        """replaces the responses of a specific intent
 
         :param intent: intent to update
         :type intent: str
@@ -204,11 +500,11 @@ class DB_Client:
         :param responses: new list of machine dialogues used to match with intent
         :type responses: list
         """
-        responses = str(responses)
-        responses = responses.replace("'", "''")
-
-        self.cur.execute(f"UPDATE intents SET responses='{responses}' WHERE intent='{intent}' AND context='{context}'")
-        self.conn.commit()
+        with self.conn:
+            intentIDs = self.get_intent_ids(intent, context)
+            for intentID in intentIDs:
+                self.execute(DELETE_TEXTS["intent_responses"], (intentID,))
+            self.insert_texts("intent_responses", [(intentID, responses) for intentID in intentIDs])
 
     def get_intent_by_idx(self, intentID:int)->tuple:
         """fetches a row from the intents table via intentID
@@ -218,9 +514,21 @@ class DB_Client:
         :return: row containing the intentID
         :rtype: tuple
         """
-        self.cur.execute(f"SELECT * FROM intents WHERE intentID={intentID}")
-        row = self.cur.fetchone()
-        return *row[:2], ast.literal_eval(row[2]), ast.literal_eval(row[3]), *row[4:]
+        return self.fetch_intents(SELECT_INTENT_BY_ID, (intentID,))[0]
+
+    def get_intents_by_idx(self, intentIDs:list)->dict:
+        """fetches many rows from the intents table via their intentIDs
+        with as few queries as possible. The intentIDs are bound as
+        one JSON array, so that the query text does not depend on
+        their number.
+
+        :param intentIDs: primary keys of the rows, duplicates are allowed
+        :type intentIDs: list
+        :return: rows keyed by their intentID
+        :rtype: dict
+        """
+        intentIDs = list(set(intentIDs))
+        return {row[0]: row for row in self.fetch_intents(SELECT_INTENTS_BY_IDS, (json.dumps(intentIDs),))}
 
     def create_skills_table(self):
         """create a table for mapping skills with their
@@ -242,19 +550,13 @@ class DB_Client:
         :type skill_name: str
         :param _class: skill's corresponding class
         :type _class: Callable
+        :return: skillID of the mapping, -1 if the skill already has one
+        :rtype: int
         """
-        self.cur.execute(f"SELECT * FROM skills WHERE \
-            skill_name = '{skill_name}'")
+        with self.conn:
+            cur = self.execute(INSERT_SKILL, (skill_name, _class.__name__))
 
-        if self.cur.fetchone() is not None:
-            return -1
-
-        self.cur.execute("INSERT INTO skills (skill_name, class) \
-            VALUES (?, ?)", (skill_name, _class.__name__)
-        )
-        self.conn.commit()
-        self.cur.execute("SELECT last_insert_rowid()")
-        return self.cur.fetchone()[0]
+        return cur.lastrowid if cur.rowcount else -1
 
 
     def get_skill(self, skill_name:str):
@@ -263,8 +565,7 @@ class DB_Client:
         :param skill_name: skill_name
         :type skill_name: str
         """
-        self.cur.execute(f"SELECT class FROM skills WHERE skill_name='{skill_name}'")
-        result = self.cur.fetchone()
+        result = self.query_one(SELECT_SKILL, (skill_name,))
         result = None if result is None else result[0]
         return result
 
@@ -274,9 +575,7 @@ class DB_Client:
         :param skillID: identifying number of the skill
         :type skillID: int
         """
-        skillID = str(skillID)
-        self.cur.execute(f"DELETE FROM skills WHERE \
-            skillID='{skillID}'")
+        self.execute(DELETE_SKILL, (skillID,))
         self.conn.commit()
 
     def create_global_vars_table(self):
@@ -293,7 +592,7 @@ class DB_Client:
 
     def insert_global_var(self, key:str, val:str, uid=0):
         """insert a key-value pair into the global variables
-        table
+        table, replacing the value of the key if it is already set
 
         :param key: key of the global variable
         :type key: str
@@ -302,10 +601,7 @@ class DB_Client:
         :param uid: user id associated with the global variable
         :type uid: int
         """
-        uid = str(uid)
-        self.cur.execute("INSERT INTO global_vars (key, val, uid) \
-            VALUES (?, ?, ?)", (key, val, uid)
-        )
+        self.execute(UPSERT_GLOBAL_VAR, (key, val, str(uid)))
         self.conn.commit()
     
     def get_global_var(self, key:str, uid=0):
@@ -315,15 +611,13 @@ class DB_Client:
         :type key: str
         :param uid: user id associated with the global variable
         """
-        uid = str(uid)
-        self.cur.execute(f"SELECT val FROM global_vars WHERE key='{key}' AND uid='{uid}'"
-        )
-        result = self.cur.fetchone()
+        result = self.query_one(SELECT_GLOBAL_VAR, (key, str(uid)))
         result = None if result is None else result[0]
         return result
 
     def update_global_var(self, key:str, val:str, uid=0):
-        """update a key-value pair from the global variables table
+        """update a key-value pair from the global variables table,
+        inserting it if the key is not set
 
         :param key: key of the global variable
         :type key: str
@@ -332,19 +626,7 @@ class DB_Client:
         :param uid: user id associated with the global variable
         :type uid: int
         """
-        uid=str(uid)
-
-        count_before = self.cur.execute(f"SELECT COUNT(*) FROM global_vars WHERE \
-            key='{key}' AND uid='{uid}'").fetchone()[0]
-
-        if count_before:
-            self.cur.execute(f"UPDATE global_vars SET val='{val}' \
-                WHERE key='{key}' AND uid='{uid}'"
-            )
-            self.conn.commit()
-        else:
-            self.insert_global_var(key, val, uid)
-            self.update_global_var(key, val, uid)
+        self.insert_global_var(key, val, uid)
     
     def drop_global_var(self, key:str, uid:int):
         """drop a key-value pair from the global variables table
@@ -356,9 +638,7 @@ class DB_Client:
         :param uid: user id associated with the the global variable
         :type uid: int
         """
-        uid=str(uid)
-        self.cur.execute(f"DELETE FROM global_vars WHERE \
-            key='{key}' AND uid='{uid}'")
+        self.execute(DELETE_GLOBAL_VAR, (key, str(uid)))
         self.conn.commit()
 
     def create_users_table(self):
@@ -379,12 +659,9 @@ class DB_Client:
         :return: database index of user
         :rtype: int
         """
-        self.cur.execute(f"INSERT INTO users (name) \
-            VALUES ('{name}')"
-        )
+        uid = self.execute(INSERT_USER, (name,)).lastrowid
         self.conn.commit()
-        self.cur.execute("SELECT last_insert_rowid()")
-        return self.cur.fetchone()[0]
+        return uid
 
     def update_user(self, uid:int, name:str):
         """update the users table
@@ -394,10 +671,7 @@ class DB_Client:
         :param name: name of the user
         :type name: str
         """
-        uid = str(uid)
-        self.cur.execute(f"UPDATE users SET name='{name}' \
-            WHERE uid='{uid}'"
-        )
+        self.execute(UPDATE_USER, (name, uid))
         self.conn.commit()
 
     def drop_user(self, uid:int):
@@ -406,9 +680,7 @@ class DB_Client:
         :param uid: uid of the user in the database
         :type uid: int
         """
-        uid = str(uid)
-        self.cur.execute(f"DELETE FROM users WHERE \
-            uid='{uid}'")
+        self.execute(DELETE_USER, (uid,))
         self.conn.commit()
     
     def get_name_by_uid(self, uid:int)->str:
@@ -419,10 +691,7 @@ class DB_Client:
         :return: name of user
         :rtype: str
         """
-        uid = str(uid)
-        self.cur.execute(f"SELECT name FROM users WHERE \
-            uid='{uid}'")
-        result = self.cur.fetchone()
+        result = self.query_one(SELECT_USER_NAME, (uid,))
         result = None if result is None else result[0]
         return result
 
@@ -434,8 +703,6 @@ class DB_Client:
         :return: name of user
         :rtype: str
         """
-        self.cur.execute(f"SELECT uid FROM users WHERE \
-            name='{name}'")
-        result = self.cur.fetchone()
+        result = self.query_one(SELECT_USER_UID, (name,))
         result = None if result is None else int(result[0])
         return result
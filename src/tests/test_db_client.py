@@ -0,0 +1,173 @@
+# standard imports
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+# third party imports
+
+# local imports
+from src.db_client import DB_Client, SCHEMA_VERSION
+import src.db_client as db_client
+
+class TestDBClient(unittest.TestCase):
+
+    THREADS = 8
+    TURNS = 25
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.config = mock.patch.dict(db_client.CONFIG, db_name=os.path.join(self.tempdir.name, "test.db"))
+        self.config.start()
+
+        self.client = DB_Client()
+        self.db_name, self.local = self.client.db_name, self.client.local
+        self.client.__init__()
+
+    def tearDown(self):
+        self.client.close()
+        self.client.db_name, self.client.local = self.db_name, self.local
+        self.config.stop()
+        self.tempdir.cleanup()
+
+    def test_wal_mode(self):
+        self.assertEqual(self.client.cur.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_connection_per_thread(self):
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.client.conn))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(connections[0], self.client.conn)
+
+    def test_concurrent_readers_and_writers(self):
+        errors = []
+
+        def work(thread):
+            try:
+                for turn in range(self.TURNS):
+                    intentID = self.client.insert_intent(f"intent_{thread}_{turn}", ["hi"], ["hello"], \
+                        f"context_{thread}", "initial", "response")
+                    self.assertEqual(self.client.get_intent_by_idx(intentID)[1], f"intent_{thread}_{turn}")
+                    self.assertEqual(len(self.client.get_intents(f"context_{thread}")), turn + 1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.client.close()
+
+        threads = [threading.Thread(target=work, args=(thread,)) for thread in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.client.cur.execute("SELECT COUNT(*) FROM intents").fetchone()[0], \
+            self.THREADS * self.TURNS)
+
+    def test_insert_intents_json(self):
+        intents = {f"intent_{i}": {"matches": [f"match {i}"], "responses": [f"response {i}"], "link": "initial", \
+            "type": "response"} for i in range(5)}
+        self.client.insert_intent("other", ["hi"], ["hello"], "other_context", "initial", "response")
+
+        intentIDs = self.client.insert_intents_json(intents, "bulk")
+        self.assertEqual([self.client.get_intent_by_idx(intentID)[1] for intentID in intentIDs], list(intents))
+        self.assertEqual(self.client.get_intent_by_idx(intentIDs[2])[2], ["match 2"])
+        self.assertEqual(self.client.insert_intents_json({}, "bulk"), [])
+
+        replaced = self.client.insert_intents_json({"intent_0": intents["intent_0"]}, "bulk", replace=True)
+        self.assertEqual([intent[0] for intent in self.client.get_intents("bulk")], replaced)
+        self.assertEqual(len(self.client.get_intents("other_context")), 1)
+
+    def test_append_intent_matches(self):
+        intentID = self.client.insert_intent("greet", ["hi", "hello"], ["hey"], "initial", "initial", "response")
+        self.client.append_intent_matches(intentID, ["good morning", "howdy"])
+        self.assertEqual(self.client.get_intent_by_idx(intentID)[2], ["hi", "hello", "good morning", "howdy"])
+
+        self.client.update_intent_matches(intentID, ["yo"])
+        self.assertEqual(self.client.get_intent_by_idx(intentID)[2], ["yo"])
+
+        self.client.drop_intent("greet", "initial")
+        self.assertEqual(self.client.cur.execute("SELECT COUNT(*) FROM intent_matches").fetchone()[0], 0)
+
+    def test_text_order(self):
+        intentID = self.client.insert_intent("count", [], ["one"], "initial", "initial", "response")
+        matches = [f"match {i}" for i in range(12)]
+        self.client.executemany(db_client.INSERT_TEXT["intent_matches"], \
+            [(intentID, position, text) for position, text in reversed(list(enumerate(matches)))])
+        self.assertEqual(self.client.get_intent_by_idx(intentID)[2], matches)
+        self.assertEqual(self.client.get_intents("initial")[0][2:4], (matches, ["one"]))
+        self.assertEqual(db_client.sorted_texts('[[10, "c"], [2, "b"], [0, "a"]]'), ["a", "b", "c"])
+
+    def test_migrate_legacy_schema(self):
+        db_name = os.path.join(self.tempdir.name, "legacy.db")
+        conn = sqlite3.connect(db_name)
+        conn.execute("CREATE TABLE intents(intentID INTEGER PRIMARY KEY AUTOINCREMENT, intent TEXT, \
+            matches TEXT, responses TEXT, context TEXT, link TEXT, intent_type TEXT)")
+        conn.execute("INSERT INTO intents (intent, matches, responses, context, link, intent_type) \
+            VALUES (?, ?, ?, ?, ?, ?)", ("greet", str(["hi", "it's me"]), str(["hey"]), "initial", "initial", "response"))
+        conn.commit()
+        conn.close()
+
+        self.client.close()
+        with mock.patch.dict(db_client.CONFIG, db_name=db_name):
+            self.client.__init__()
+
+        self.assertEqual(self.client.get_intents("initial"), \
+            [(1, "greet", ["hi", "it's me"], ["hey"], "initial", "initial", "response")])
+        self.assertEqual(self.client.cur.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+
+    def test_upserts(self):
+        self.client.insert_global_var("fav_movie", "jaws", 1)
+        self.client.insert_global_var("fav_movie", "alien", 1)
+        self.client.update_global_var("fav_movie", "heat", 2)
+        self.assertEqual(self.client.get_global_var("fav_movie", 1), "alien")
+        self.assertEqual(self.client.get_global_var("fav_movie", 2), "heat")
+        self.assertEqual(self.client.cur.execute("SELECT COUNT(*) FROM global_vars").fetchone()[0], 2)
+
+        self.assertGreater(self.client.insert_skill("greet", TestDBClient), 0)
+        self.assertEqual(self.client.insert_skill("greet", unittest.TestCase), -1)
+        self.assertEqual(self.client.get_skill("greet"), "TestDBClient")
+
+    def test_indexed_lookups(self):
+        plan = self.client.cur.execute("EXPLAIN QUERY PLAN SELECT intentID FROM intents WHERE context=?", \
+            ("initial",)).fetchall()
+        self.assertIn("intents_context_intent", plan[0][3])
+
+    def test_migrate_duplicates(self):
+        self.client.cur.execute("DROP INDEX global_vars_key_uid")
+        self.client.cur.executemany("INSERT INTO global_vars (key, val, uid) VALUES (?, ?, ?)", \
+            [("current_uid", "1", "0"), ("current_uid", "2", "0")])
+        self.client.cur.execute("PRAGMA user_version=1")
+        self.client.conn.commit()
+        self.client.close()
+
+        self.client.__init__()
+        self.assertEqual(self.client.get_global_var("current_uid"), "2")
+        self.client.update_global_var("current_uid", "3")
+        self.assertEqual(self.client.cur.execute("SELECT COUNT(*) FROM global_vars").fetchone()[0], 1)
+
+    def test_bound_parameters(self):
+        uid = self.client.insert_user("o'brien")
+        self.assertEqual(self.client.get_name_by_uid(uid), "o'brien")
+        self.client.update_user(uid, "d'arcy")
+        self.assertEqual(self.client.get_uid_by_name("d'arcy"), uid)
+
+        self.client.insert_intent("it's", ["hi"], ["hello"], "o'clock", "initial", "response")
+        self.assertEqual(self.client.drop_intent("it's", "o'clock"), 0)
+        self.assertEqual(self.client.drop_intent("it's", "o'clock"), -1)
+        self.assertRaises(ValueError, self.client.drop_table, "intents; --")
+
+    def test_statement_stats(self):
+        self.client.timing = True
+        intentIDs = self.client.insert_intents_json({"greet": {"matches": ["hi"], "responses": ["hey"], \
+            "link": "initial", "type": "response"}}, "initial")
+        for _ in range(3):
+            self.client.get_intents_by_idx(intentIDs)
+
+        stats = self.client.stats()
+        self.assertEqual(stats[db_client.SELECT_INTENTS_BY_IDS]["count"], 3)
+        self.assertEqual(stats[db_client.INSERT_INTENT]["count"], 1)
+        self.assertGreater(stats[db_client.SELECT_INTENTS_BY_IDS]["max"], 0.0)
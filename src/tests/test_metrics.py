@@ -0,0 +1,35 @@
+# standard imports
+import unittest
+# third party imports
+
+# local imports
+from src.core_intent_matcher.metrics import LatencyHistogram
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for _ in range(90):
+            histogram.observe(0.002)
+        for _ in range(10):
+            histogram.observe(0.3)
+
+        stats = histogram.stats()
+        self.assertEqual(stats["count"], 100)
+        self.assertAlmostEqual(stats["mean"], 0.0318)
+        self.assertEqual(stats["p50"], 0.0025)
+        self.assertEqual(stats["p90"], 0.0025)
+        self.assertEqual(stats["p99"], 0.3)
+        self.assertEqual(stats["max"], 0.3)
+        self.assertEqual(stats["buckets"]["0.0025"], 90)
+        self.assertEqual(stats["buckets"]["0.5"], 10)
+
+    def test_overflow(self):
+        histogram = LatencyHistogram()
+        histogram.observe(30.0)
+
+        self.assertEqual(histogram.stats()["buckets"]["inf"], 1)
+        self.assertEqual(histogram.percentile(50), 30.0)
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().stats()["p99"], 0.0)
@@ -0,0 +1,238 @@
+# standard imports
+import csv
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+# third party imports
+import numpy as np
+from nltk.stem.porter import PorterStemmer
+
+# local imports
+from src.core_intent_matcher.model import Model, StemCache, CONFIG
+from src.core_intent_matcher.global_index import GlobalModel
+import src.core_intent_matcher.model_format as model_format
+
+class TestStemCache(unittest.TestCase):
+
+    CAPACITY = 3
+
+    def test_hits_and_misses(self):
+        cache = StemCache(PorterStemmer(), self.CAPACITY)
+
+        self.assertEqual(cache.stem("playing"), "play")
+        self.assertEqual(cache.stem("playing"), "play")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_capacity(self):
+        cache = StemCache(PorterStemmer(), self.CAPACITY)
+
+        for token in ["movies", "played", "directed", "tickets"]:
+            cache.stem(token)
+
+        self.assertEqual(len(cache.stems), self.CAPACITY)
+        self.assertNotIn("movies", cache.stems)
+
+    def test_dump_and_load(self):
+        cache = StemCache(PorterStemmer(), self.CAPACITY)
+        cache.stem("movies")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "stems.pkl")
+            cache.dump(filepath)
+            self.assertFalse(cache.changed)
+
+            loaded = StemCache(PorterStemmer(), self.CAPACITY)
+            loaded.load(filepath)
+
+        self.assertEqual(loaded.stem("movies"), "movi")
+        self.assertEqual(loaded.stats()["misses"], 0)
+
+class TestModelFormat(unittest.TestCase):
+
+    X_AND_Y = [
+        (1, ["what is the time", "do you know the time"]),
+        (2, ["what is the meaning of life"]),
+        (3, ["book me a movie ticket", "i want to see a movie"]),
+    ]
+    QUERIES = ["what time is it", "book a ticket", "meaning of life"]
+
+    def test_save_and_load(self):
+        model = Model()
+        model.prepare_data(self.X_AND_Y)
+        model.train_and_test()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.save(os.path.join(tmp_dir, "test.model"))
+            loaded = Model.load(os.path.join(tmp_dir, "test.model"))
+
+            self.assertIsNone(loaded.x_all)
+            self.assertEqual(loaded.y_all, model.y_all)
+            self.assertEqual(loaded.version, model.version)
+            for query in self.QUERIES:
+                np.testing.assert_allclose(loaded.predict(query), model.predict(query))
+
+            loaded.partial_fit([(2, ["why are we here"]), (4, ["who played the joker"])])
+            model.partial_fit([(2, ["why are we here"]), (4, ["who played the joker"])])
+            for query in self.QUERIES + ["why are we here"]:
+                np.testing.assert_allclose(loaded.predict(query), model.predict(query), rtol=1e-6)
+
+    def test_nbytes(self):
+        model = Model()
+        model.prepare_data(self.X_AND_Y)
+        model.train_and_test()
+        nbytes = model.nbytes()
+
+        self.assertGreater(nbytes, model.tfidf_matrix.data.nbytes + model.tfidf_vectorizer.counts.data.nbytes)
+        model.partial_fit([(4, ["who played the joker in the dark knight"])])
+        self.assertGreater(model.nbytes(), nbytes)
+
+    def test_read_only_load(self):
+        model = Model()
+        model.prepare_data(self.X_AND_Y)
+        model.train_and_test()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.save(os.path.join(tmp_dir, "test.model"))
+            loaded = Model.load(os.path.join(tmp_dir, "test.model"), read_only=True)
+
+            self.assertFalse(loaded.tfidf_matrix.data.flags.writeable)
+            self.assertEqual(model.mapped_nbytes(), 0)
+            self.assertGreaterEqual(loaded.mapped_nbytes(), loaded.tfidf_matrix.data.nbytes)
+            for query in self.QUERIES:
+                np.testing.assert_allclose(loaded.predict(query), model.predict(query))
+
+    def test_save_publishes_at_once(self):
+        models = []
+        for n_intents in (1, 3):
+            model = Model()
+            model.prepare_data(self.X_AND_Y[:n_intents])
+            model.train_and_test()
+            models.append(model)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dirpath = os.path.join(tmp_dir, "test.model")
+            models[0].save(dirpath)
+            done = threading.Event()
+
+            def save():
+                for i in range(50):
+                    models[i % 2].save(dirpath)
+                done.set()
+
+            saver = threading.Thread(target=save)
+            saver.start()
+            while not done.is_set():
+                loaded = Model.load(dirpath)
+                self.assertEqual(loaded.tfidf_matrix.shape[0], len(loaded.y_all))
+            saver.join()
+
+            arrays_dirs = [filename for filename in os.listdir(dirpath) if filename.startswith(model_format.ARRAYS_PREFIX)]
+            self.assertEqual(len(arrays_dirs), 1)
+
+    def test_load_format_version_1(self):
+        model = Model()
+        model.prepare_data(self.X_AND_Y)
+        model.train_and_test()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            arrays, meta = model.to_arrays()
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, name + ".npy"), array)
+            with open(os.path.join(tmp_dir, model_format.META_FILE), "w") as f:
+                json.dump({"format_version": 1, **meta}, f)
+
+            loaded = Model.load(tmp_dir)
+            self.assertEqual(loaded.y_all, model.y_all)
+            np.testing.assert_allclose(loaded.predict(self.QUERIES[0]), model.predict(self.QUERIES[0]))
+
+class TestGlobalModel(unittest.TestCase):
+
+    TIME_AND_LIFE = [(1, ["what is the time", "do you know the time"]), (2, ["what is the meaning of life"])]
+    MOVIES = [(3, ["book me a movie ticket", "i want to see a movie"]), (4, ["what time does the movie start"])]
+
+    def setUp(self):
+        self.index = GlobalModel()
+        self.index.partial_fit(self.MOVIES[:1], "movies")
+        self.index.partial_fit(self.TIME_AND_LIFE, "initial")
+        self.index.partial_fit(self.MOVIES[1:], "movies")
+
+    def test_rows_grouped_by_context(self):
+        self.assertEqual(self.index.intents("initial"), [1, 2])
+        self.assertEqual(self.index.intents("movies"), [3, 4])
+
+    def test_predict_within_context(self):
+        self.assertEqual(self.index.predict("what time is it", "initial")[0][0], 1)
+        self.assertEqual(self.index.predict("what time is it", "movies")[0][0], 4)
+        self.assertEqual({intentID for intentID, _ in self.index.predict("movie", "initial")}, {1, 2})
+
+    def test_context_view_retrain(self):
+        view = self.index.context("movies")
+        view.prepare_data([(5, ["who played the joker"])], True)
+        view.train_and_test()
+
+        self.assertEqual(view.y_all, [5])
+        self.assertEqual(self.index.intents("initial"), [1, 2])
+        self.assertEqual(view.predict("who played the joker")[0][0], 5)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.index.save(os.path.join(tmp_dir, "global.model"))
+            loaded = GlobalModel.load(os.path.join(tmp_dir, "global.model"))
+
+            self.assertEqual(loaded.contexts, self.index.contexts)
+            for context in self.index.contexts:
+                np.testing.assert_allclose(loaded.predict("what time is it", context), \
+                    self.index.predict("what time is it", context))
+
+class TestHashingFeatures(unittest.TestCase):
+    """compares the accuracy of the hashing featurizer with the
+    vocabulary featurizer on the eval set
+    """
+
+    EVAL_FILE = "eval/eval_0.csv"
+    INTENTS_FILE = "data/compiled.json"
+    EVAL_CONTEXT = "movie_trivia"
+
+    def setUp(self):
+        with open(self.INTENTS_FILE) as f:
+            topics = json.load(f)["data"]
+        self.intents = next(topic["intents"] for topic in topics if topic["context"] == self.EVAL_CONTEXT)
+        with open(self.EVAL_FILE) as f:
+            self.questions = [row[0] for row in list(csv.reader(f))[1:]]
+
+    def train(self, features:str)->Model:
+        with mock.patch.dict(CONFIG, {"features": features}):
+            model = Model()
+            model.prepare_data([(i, attr["matches"]) for i, attr in enumerate(self.intents.values())])
+            model.train_and_test()
+        return model
+
+    def test_accuracy(self):
+        vocabulary, hashing = self.train("vocabulary"), self.train("hashing")
+        names = list(self.intents)
+
+        # every intent should be retrieved by its own name
+        expected_hits = sum(intents[0][0] == i for i, intents in enumerate(vocabulary.predict_batch(names)))
+        actual_hits = sum(intents[0][0] == i for i, intents in enumerate(hashing.predict_batch(names)))
+        self.assertGreaterEqual(actual_hits, expected_hits)
+
+        # the eval questions should be matched to the same intents
+        agreements = [expected[0][0] == actual[0][0] for expected, actual in \
+            zip(vocabulary.predict_batch(self.questions), hashing.predict_batch(self.questions))]
+        self.assertGreaterEqual(sum(agreements) / len(agreements), 0.95)
+
+    def test_save_and_load(self):
+        model = self.train("hashing")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.save(os.path.join(tmp_dir, "test.model"))
+            loaded = Model.load(os.path.join(tmp_dir, "test.model"))
+
+            self.assertNotIn("vocabulary", model_format.load_arrays(os.path.join(tmp_dir, "test.model"))[0])
+            np.testing.assert_allclose(loaded.tfidf_vectorizer.idf_, model.tfidf_vectorizer.idf_)
+            for question in self.questions:
+                np.testing.assert_allclose(loaded.predict(question), model.predict(question), rtol=1e-6)
@@ -0,0 +1,72 @@
+# standard imports
+from unittest import mock
+# third party imports
+
+# local imports
+from src.core_intent_matcher.modelAPI import ModelAPI
+import src.core_intent_matcher.modelAPI as modelAPI
+from src.tests.test_model_data_man import ModelDataTestCase, make_intents
+
+class TestModelAPI(ModelDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = ModelAPI()
+        self.api.learn_intents(make_intents("weather", "time", "music"), "smalltalk")
+
+    def test_retrain_during_predict(self):
+        get_intent_by_idx = self.api.db_client.get_intent_by_idx
+
+        def retrain_then_get(intentID):
+            # the retrain commits after the model predicted, before the prediction is cached
+            self.api.learn_intents(make_intents("news"), "smalltalk")
+            return get_intent_by_idx(intentID)
+
+        with mock.patch.object(self.api.db_client, "get_intent_by_idx", side_effect=retrain_then_get):
+            self.api.predict("weather please", "smalltalk")
+        self.assertIsNone(self.api.prediction_cache.get("weather please", "smalltalk"))
+
+        prediction = self.api.predict("weather please", "smalltalk")
+        self.assertEqual(self.api.prediction_cache.get("weather please", "smalltalk"), prediction)
+
+    def test_predict_many(self):
+        self.api.learn_intents(make_intents("guitar", "piano"), "music")
+        queries = [("piano please", "music"), ("weather please", "smalltalk"), \
+            ("tell me about guitar", "music"), ("time please", "smalltalk")]
+        expected = [self.db.get_intent_ids(intent, context)[0] \
+            for intent, (_, context) in zip(["piano", "weather", "guitar", "time"], queries)]
+
+        with mock.patch.object(self.pool, "GetModel", wraps=self.pool.GetModel) as get_model:
+            predictions = self.api.predict_many(queries)
+        self.assertEqual(get_model.call_count, 2)
+        self.assertEqual([prediction.intentID for prediction in predictions], expected)
+        self.api.prediction_cache.clear()
+        for prediction, (user_input, context) in zip(predictions, queries):
+            single = self.api.predict(user_input, context)
+            self.assertEqual(prediction[:4], single[:4])
+            self.assertAlmostEqual(prediction.confidence, single.confidence)
+
+        self.assertEqual(self.api.predict_many([]), [])
+
+    def test_predict_many_cached(self):
+        self.api.predict("weather please", "smalltalk")
+        queries = [("weather please", "smalltalk"), ("time please", "smalltalk")]
+        with mock.patch.object(self.pool, "GetModel", wraps=self.pool.GetModel) as get_model:
+            predictions = self.api.predict_many(queries)
+        self.assertEqual(get_model.call_args, mock.call("smalltalk", True))
+        self.assertEqual(self.api.prediction_cache.get(*queries[1]), predictions[1])
+
+        with mock.patch.object(self.pool, "GetModel") as get_model:
+            self.assertEqual(self.api.predict_many(queries), predictions)
+        get_model.assert_not_called()
+
+    def test_refresh_when_due(self):
+        self.pool.shared = True
+        try:
+            with mock.patch.object(self.pool, "refresh", return_value=[]) as refresh:
+                with mock.patch.dict(modelAPI.CONFIG, refresh_interval=0):
+                    self.api.predict("weather please", "smalltalk")
+                self.api.predict("weather please", "smalltalk")
+        finally:
+            self.pool.shared = False
+        self.assertEqual(refresh.call_count, 1)
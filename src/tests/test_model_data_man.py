@@ -0,0 +1,132 @@
+# standard imports
+from unittest import mock
+import os
+import tempfile
+import unittest
+# third party imports
+
+# local imports
+from src.core_intent_matcher.model_data_man import ModelDataManager
+from src.core_intent_matcher.model_pool import ModelPool, ModelPoolReadOnlyError, ModelNotFoundError
+from src.core_intent_matcher.prediction_cache import PredictionCache
+from src.core_intent_matcher.eviction import make_queue
+import src.core_intent_matcher.model_data_man as model_data_man
+import src.core_intent_matcher.model_pool as model_pool
+import src.db_client as db_client
+
+def make_intents(*names:str)->dict:
+    return {name: {"matches": [f"{name} please", f"tell me about {name}"], "responses": [f"here is {name}"], \
+        "link": "initial", "type": "response"} for name in names}
+
+class ModelDataTestCase(unittest.TestCase):
+    """runs the model data manager on a temporary database and model
+    storage directory, with an empty model pool and prediction cache
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.db_config = mock.patch.dict(db_client.CONFIG, db_name=os.path.join(self.tempdir.name, "test.db"))
+        self.pool_config = mock.patch.dict(model_pool.CONFIG, storage_dir=self.tempdir.name)
+        self.db_config.start()
+        self.pool_config.start()
+
+        self.data_man = ModelDataManager()
+        self.data_man.context_links = {}
+        self.db = self.data_man.db_client
+        self.db_name, self.local = self.db.db_name, self.db.local
+        self.db.__init__()
+
+        self.pool = ModelPool()
+        self.queue, self.model_states = self.pool.queue, self.pool.model_states
+        self.pool.queue, self.pool.model_states = make_queue("lru"), {}
+        self.stores = self.pool.storing, self.pool.stored_versions, self.pool.unsaved
+        self.pool.storing, self.pool.stored_versions, self.pool.unsaved = {}, {}, {}
+        PredictionCache().__init__()
+
+    def tearDown(self):
+        self.pool.persister.flush()
+        self.pool.queue, self.pool.model_states = self.queue, self.model_states
+        self.pool.storing, self.pool.stored_versions, self.pool.unsaved = self.stores
+        self.db.close()
+        self.db.db_name, self.db.local = self.db_name, self.local
+        self.pool_config.stop()
+        self.db_config.stop()
+        self.tempdir.cleanup()
+
+class TestModelDataManager(ModelDataTestCase):
+
+    def test_remove_duplicate_intent(self):
+        self.data_man.add_intents(make_intents("weather", "time"), "smalltalk")
+        self.data_man.add_intents(make_intents("weather"), "smalltalk")
+        self.assertEqual(len(self.db.get_intent_ids("weather", "smalltalk")), 2)
+
+        self.data_man.remove_intent("weather", "smalltalk")
+        intentIDs = [intent[0] for intent in self.db.get_intents("smalltalk")]
+        with self.pool.GetModel("smalltalk") as model:
+            self.assertEqual(model.y_all, intentIDs)
+            self.assertTrue(all(intentID in intentIDs for intentID, _ in model.predict("weather please")))
+
+    def test_remove_last_intent(self):
+        self.data_man.add_intents(make_intents("weather", "time"), "smalltalk")
+        self.data_man.remove_intent("weather", "smalltalk")
+        with self.pool.GetModel("smalltalk") as model:
+            self.assertEqual(model.y_all, self.db.get_intent_ids("time", "smalltalk"))
+            version = model.version
+        self.data_man.prediction_cache.put("time please", "smalltalk", "cached", version)
+
+        self.data_man.remove_intent("time", "smalltalk")
+        with self.assertRaises(ModelNotFoundError):
+            self.pool["smalltalk"]
+        self.assertEqual(self.db.get_intents("smalltalk"), [])
+        self.assertIsNone(self.data_man.prediction_cache.get("time please", "smalltalk"))
+
+    def test_add_topics(self):
+        self.data_man.add_intents(make_intents("weather"), "smalltalk")
+        topics = [{"context": "smalltalk", "intents": make_intents("time")}, \
+            {"context": "music", "intents": make_intents("guitar", "piano")}, \
+            {"context": "sports", "intents": make_intents("football")}]
+        with mock.patch.dict(model_data_man.CONFIG, bootstrap_workers=1):
+            self.data_man.add_topics(topics)
+
+        for context in ("smalltalk", "music", "sports"):
+            with self.pool.GetModel(context) as model:
+                self.assertCountEqual(model.y_all, [intent[0] for intent in self.db.get_intents(context)])
+        with self.pool.GetModel("music") as model:
+            self.assertEqual(model.predict("piano please")[0][0], self.db.get_intent_ids("piano", "music")[0])
+        self.assertEqual(len(self.db.get_intents("smalltalk")), 2)
+
+    def test_add_intent_matches(self):
+        for incremental in (True, False):
+            context = f"smalltalk_{incremental}"
+            with self.subTest(incremental=incremental), mock.patch.dict(model_data_man.CONFIG, incremental=incremental):
+                self.data_man.add_intents(make_intents("weather", "time"), context)
+                intentID = self.db.get_intent_ids("weather", context)[0]
+                timeID = self.db.get_intent_ids("time", context)[0]
+                matches = self.db.get_intent_by_idx(intentID)[2]
+
+                # extends the matches
+                self.assertTrue(self.data_man.add_intent_matches(intentID, matches + ["is it raining"]))
+                self.assertEqual(self.db.get_intent_by_idx(intentID)[2], matches + ["is it raining"])
+                with self.pool.GetModel(context) as model:
+                    self.assertEqual(model.predict("is it raining")[0][0], intentID)
+
+                # replaces the matches
+                self.assertTrue(self.data_man.add_intent_matches(intentID, ["umbrella"]))
+                self.assertEqual(self.db.get_intent_by_idx(intentID)[2], ["umbrella"])
+                with self.pool.GetModel(context) as model:
+                    self.assertEqual(model.predict("umbrella")[0][0], intentID)
+                    self.assertEqual(model.predict("weather please")[0][0], timeID)
+
+    def test_shared_pool_skips_writes(self):
+        self.data_man.add_intents(make_intents("weather"), "smalltalk")
+        intentID = self.db.get_intent_ids("weather", "smalltalk")[0]
+        self.pool.shared = True
+        try:
+            self.assertFalse(self.data_man.add_intent_matches(intentID, ["weather please", "is it raining"]))
+            with self.assertRaises(ModelPoolReadOnlyError):
+                self.data_man.add_intents(make_intents("time"), "smalltalk")
+        finally:
+            self.pool.shared = False
+
+        self.assertEqual(self.db.get_intent_by_idx(intentID)[2], ["weather please", "tell me about weather"])
+        self.assertEqual(len(self.db.get_intents("smalltalk")), 1)
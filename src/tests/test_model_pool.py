@@ -1,18 +1,30 @@
 # standard imports
-from cgi import test
+from unittest import mock
+import os
+import random
+import tempfile
+import threading
+import time
 import unittest
 # third party imports
+import joblib
 
 # local imports
-from src.model.model_pool import ModelNotFoundError, \
-    PriorityQueue, QueueItem, ModelPool
+from src.core_intent_matcher.model import Model
+from src.core_intent_matcher.model_pool import ModelNotFoundError, ModelPool, ModelPoolReadOnlyError, ModelState
+import src.core_intent_matcher.model_pool as model_pool
+from src.core_intent_matcher.eviction import QueueItem, LRUQueue, make_queue
 
 class TempObj(object):
     pass
 
-class TestPriorityQueue(unittest.TestCase):
+class TestLRUQueue(unittest.TestCase):
 
     OBJ_AMOUNT = 100
+    POLICY = "lru"
+
+    def PriorityQueue(self, init_queue=[], capacity=None):
+        return make_queue(self.POLICY, init_queue, capacity)
 
     def test_getitem(self):
         test_key = "to_get"
@@ -21,7 +33,7 @@ class TestPriorityQueue(unittest.TestCase):
         init_queue = []
         for i in range(self.OBJ_AMOUNT):
             init_queue.append([str(i), i])
-        self.pq = PriorityQueue(init_queue=init_queue)
+        self.pq = self.PriorityQueue(init_queue=init_queue)
 
         self.pq.setitem(test_key, test_val)
 
@@ -31,7 +43,7 @@ class TestPriorityQueue(unittest.TestCase):
     def test_pop(self):
         test_key = "to_pop"
         test_val = "test_return"
-        self.pq = PriorityQueue(init_queue=[])
+        self.pq = self.PriorityQueue(init_queue=[])
 
         self.pq.setitem(test_key, test_val)
         for i in range(self.OBJ_AMOUNT):
@@ -47,7 +59,7 @@ class TestPriorityQueue(unittest.TestCase):
         test_key = "to_pop"
         test_val = "test_return"
         
-        pq = PriorityQueue(init_queue=[], capacity=self.OBJ_AMOUNT)
+        pq = self.PriorityQueue(init_queue=[], capacity=self.OBJ_AMOUNT)
         pq.setitem(test_key, test_val)
         model_popped = None
         for i in range(self.OBJ_AMOUNT):
@@ -66,7 +78,7 @@ class TestPriorityQueue(unittest.TestCase):
 
         for i in range(self.OBJ_AMOUNT):
             init_queue.append([str(i), i])
-        pq = PriorityQueue(init_queue=init_queue)
+        pq = self.PriorityQueue(init_queue=init_queue)
 
         expected_keys = [item[0] for item in init_queue]
 
@@ -79,7 +91,7 @@ class TestPriorityQueue(unittest.TestCase):
 
         for i in range(self.OBJ_AMOUNT):
             init_queue.append([str(i), i])
-        pq = PriorityQueue(init_queue=init_queue)
+        pq = self.PriorityQueue(init_queue=init_queue)
 
         pq.setitem(key_to_set, val_to_set)
 
@@ -91,13 +103,55 @@ class TestPriorityQueue(unittest.TestCase):
 
         for i in range(self.OBJ_AMOUNT):
             init_queue.append([str(i), i])
-        pq = PriorityQueue(init_queue=init_queue)
+        pq = self.PriorityQueue(init_queue=init_queue)
 
         for _ in range(self.OBJ_AMOUNT//2 - 1):
             pq.getitem(key_to_get)
 
         self.assertEqual(pq.peek_best(), QueueItem(key_to_get, int(key_to_get)))
         
+    def test_pop_key(self):
+        pq = self.PriorityQueue(init_queue=[["0", 0], ["1", 1], ["2", 2]])
+        pq.getitem("1")
+
+        self.assertEqual(pq.pop("1"), QueueItem("1", 1))
+        self.assertEqual(pq.pop("1"), QueueItem("1", None))
+        self.assertEqual(len(pq), 2)
+        self.assertNotIn("1", pq)
+        self.assertEqual(sorted(pq.keys()), ["0", "2"])
+
+class TestLFUQueue(TestLRUQueue):
+
+    POLICY = "lfu"
+
+    def test_frequency_beats_recency(self):
+        pq = self.PriorityQueue(capacity=3)
+        pq.setitem("often", 0)
+        pq.setitem("recent", 1)
+        for _ in range(3):
+            pq.getitem("often")
+        pq.setitem("new", 2)
+
+        self.assertEqual(pq.keys(), ["often", "new", "recent"])
+        self.assertEqual(pq.setitem("newer", 3), QueueItem("recent", 1))
+
+class TestSLRUQueue(TestLRUQueue):
+
+    POLICY = "slru"
+
+    def test_scan_resistance(self):
+        pq = self.PriorityQueue(capacity=5)
+        for key in ["a", "b"]:
+            pq.setitem(key, key)
+            pq.getitem(key)
+
+        # models used only once are popped before the protected ones
+        for i in range(10):
+            pq.setitem(str(i), i)
+
+        self.assertIn("a", pq)
+        self.assertIn("b", pq)
+
 class TestModelStateManager(unittest.TestCase):
 
     OBJ_AMOUNT = 100
@@ -109,8 +163,266 @@ class TestModelStateManager(unittest.TestCase):
         for i in range(self.OBJ_AMOUNT):
             init_queue.append([str(i), i])
 
-        init_pq = PriorityQueue(init_queue)
+        init_pq = LRUQueue(init_queue)
         model_manager = ModelPool(init_pq)
 
         with self.assertRaises(ModelNotFoundError):
-            model_manager[key_to_get]
\ No newline at end of file
+            model_manager[key_to_get]
+class TestConcurrentModelPool(unittest.TestCase):
+
+    MODELS = 6
+    THREADS = 16
+    TURNS = 30
+
+    def setUp(self):
+        self.storage_dir = tempfile.TemporaryDirectory()
+        self.config = mock.patch.dict(model_pool.CONFIG, storage_dir=self.storage_dir.name)
+        self.config.start()
+
+        self.pool = ModelPool()
+        self.queue, self.capacity, self.model_states = self.pool.queue, self.pool.capacity, self.pool.model_states
+        self.pool.queue, self.pool.capacity, self.pool.model_states = make_queue("lru"), 3, {}
+
+        self.contexts = [f"stress_{i}" for i in range(self.MODELS)]
+        for i, context in enumerate(self.contexts):
+            model = Model()
+            model.prepare_data([(i * 1000, [f"hello {context}", "how are you"])])
+            model.train_and_test()
+            self.pool.add_model(context, model)
+
+    def tearDown(self):
+        for context in self.contexts:
+            self.pool.pop_model(context)
+        self.pool.queue, self.pool.capacity, self.pool.model_states = self.queue, self.capacity, self.model_states
+        self.config.stop()
+        self.storage_dir.cleanup()
+
+    def test_mixed_readers_and_writers(self):
+        written = {context: [] for context in self.contexts}
+        errors = []
+
+        def work(thread):
+            rng = random.Random(thread)
+            try:
+                for turn in range(self.TURNS):
+                    context = rng.choice(self.contexts)
+                    if rng.random() < 0.2:
+                        intentID = thread * 1000 + turn + 1
+                        with self.pool.GetModel(context, write=True) as model:
+                            model.partial_fit([(intentID, [f"turn {turn} of thread {thread}"])])
+                            written[context].append(intentID)
+                    else:
+                        with self.pool.GetModel(context, rng.random() < 0.5) as model:
+                            self.assertTrue(model.predict("hello there"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.pool.flush()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.pool.queue), 3)
+        for context, intentIDs in written.items():
+            self.assertLessEqual(set(intentIDs), set(self.pool[context].y_all))
+            self.assertLessEqual(set(intentIDs), set(Model.load(self.pool.model_filename(context)).y_all))
+
+    def test_single_flight_load(self):
+        context = self.contexts[0]
+        load = Model.load
+        loads = []
+
+        def slow_load(filename, **kwargs):
+            loads.append(filename)
+            time.sleep(0.1)
+            return load(filename, **kwargs)
+
+        models = []
+        with mock.patch.object(Model, "load", side_effect=slow_load):
+            threads = [threading.Thread(target=lambda: models.append(self.pool[context])) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len(models), 8)
+        self.assertTrue(all(model is models[0] for model in models))
+
+    def test_prefetch(self):
+        used, unused = self.contexts[:2]
+        stats = self.pool.stats()
+
+        self.pool.prefetch([used, unused, "not_a_model"])
+        self.pool.prefetch_queue.join()
+        self.assertTrue(self.pool.is_cached(used))
+        self.assertTrue(self.pool.is_cached(unused))
+
+        with self.pool.GetModel(used, True) as model:
+            self.assertTrue(model.predict("hello there"))
+        with self.pool.lock:
+            self.pool.evict(unused)
+
+        self.assertEqual(self.pool.stats()["prefetches"] - stats["prefetches"], 2)
+        self.assertEqual(self.pool.stats()["prefetch_hits"] - stats["prefetch_hits"], 1)
+        self.assertEqual(self.pool.stats()["prefetch_wasted"] - stats["prefetch_wasted"], 1)
+
+    def test_failed_prefetch(self):
+        context = self.contexts[0]
+        errors = self.pool.stats()["prefetch_errors"]
+        with mock.patch.object(Model, "load", side_effect=OSError("corrupt model")):
+            with self.assertLogs(model_pool.logger, "DEBUG") as logs:
+                self.pool.prefetch([context])
+                self.pool.prefetch_queue.join()
+
+        self.assertIn("could not prefetch", logs.output[0])
+        self.assertEqual(self.pool.stats()["prefetch_errors"] - errors, 1)
+        self.assertFalse(self.pool.is_cached(context))
+        with self.pool.GetModel(context, True) as model:
+            self.assertTrue(model.predict("hello there"))
+
+    def test_lazy_registration(self):
+        cached = self.pool.stats()["models"]
+        model = Model()
+        model.prepare_data([(0, ["good evening"])])
+        model.train_and_test()
+        model.save(self.pool.model_filename("stored_only"))
+        self.contexts.append("stored_only")
+        loads = self.pool.stats()["loads"]
+
+        self.pool.register_all_stored()
+        self.assertEqual(self.pool.model_states["stored_only"], ModelState.STORED)
+        self.assertEqual(self.pool.stats()["models"], cached)
+        self.assertEqual(self.pool.stats()["loads"], loads)
+
+        self.assertEqual(self.pool["stored_only"].y_all, [0])
+        self.assertEqual(self.pool.stats()["loads"], loads + 1)
+
+    def test_stats(self):
+        context = self.contexts[0]
+        with self.pool.lock:
+            if self.pool.is_cached(context):
+                self.pool.evict(context)
+        self.pool.flush()
+        stats = self.pool.stats()
+
+        with self.pool.GetModel(context, True, write=True) as model:
+            model.partial_fit([(1, ["good morning"])])
+        self.pool[context]
+        self.pool.flush()
+
+        lookups = self.pool.stats()["lookups"]
+        self.assertEqual(lookups["stored"] - stats["lookups"]["stored"], 1)
+        self.assertEqual(sum(lookups.values()) - sum(stats["lookups"].values()), 2)
+        self.assertEqual(self.pool.stats()["loads"] - stats["loads"], 1)
+        self.assertEqual(self.pool.stats()["stores"] - stats["stores"], 1)
+        self.assertEqual(self.pool.stats()["load_latency"]["count"] - stats["load_latency"]["count"], 1)
+        self.assertEqual(self.pool.stats()["store_latency"]["count"] - stats["store_latency"]["count"], 1)
+
+    def test_shared_serving(self):
+        context = self.contexts[0]
+        self.pool.flush()
+        self.pool.shared = True
+        try:
+            with self.pool.GetModel(context, True) as model:
+                version = model.version
+            with self.assertRaises(ModelPoolReadOnlyError):
+                with self.pool.GetModel(context, write=True):
+                    pass
+
+            # another process retrains the model
+            model = Model.load(self.pool.model_filename(context))
+            model.partial_fit([(1, ["good morning"])])
+            model.save(self.pool.model_filename(context))
+
+            self.assertEqual(self.pool.refresh(), [context])
+            with self.pool.GetModel(context) as model:
+                self.assertEqual(model.version, version + 1)
+                self.assertEqual(model.predict("good morning")[0][0], 1)
+                self.assertFalse(model.tfidf_matrix.data.flags.writeable)
+            self.assertEqual(self.pool.refresh(), [])
+        finally:
+            self.pool.shared = False
+
+    def test_copy_on_write(self):
+        context = self.contexts[0]
+        with self.pool.GetModel(context) as reader:
+            with self.pool.GetModel(context, write=True) as writer:
+                writer.partial_fit([(1, ["good morning"])])
+                self.assertNotIn(1, self.pool[context].y_all)
+            self.assertNotIn(1, reader.y_all)
+        self.assertIn(1, self.pool[context].y_all)
+
+        with self.assertRaises(RuntimeError):
+            with self.pool.GetModel(context, write=True) as writer:
+                writer.partial_fit([(2, ["good night"])])
+                raise RuntimeError("retrain failed")
+        self.assertNotIn(2, self.pool[context].y_all)
+
+    def test_rollback(self):
+        context = self.contexts[0]
+        for intentID in (1, 2):
+            with self.pool.GetModel(context, write=True) as model:
+                model.partial_fit([(intentID, [f"intent number {intentID}"])])
+        version = self.pool[context].version
+
+        self.assertEqual(self.pool.versions(context), [version, version - 1, version - 2])
+        self.assertEqual(self.pool.rollback(context), version + 1)
+        self.assertEqual(self.pool[context].y_all, [0, 1])
+        self.assertEqual(self.pool.versions(context), [version + 1, version - 2])
+        self.pool.rollback(context)
+        self.assertEqual(self.pool[context].y_all, [0])
+        with self.assertRaises(ModelNotFoundError):
+            self.pool.rollback(context)
+
+        self.pool.flush()
+        self.assertEqual(Model.load(self.pool.model_filename(context)).y_all, [0])
+
+    def test_failed_store(self):
+        context = self.contexts[0]
+        self.pool.flush()
+        with self.pool.GetModel(context, write=True) as model:
+            model.partial_fit([(1, ["good morning"])])
+
+        with mock.patch.object(model_pool.model_format, "save_arrays", side_effect=OSError("disk full")), \
+            self.assertLogs("src.core_intent_matcher.persister", "ERROR"):
+            with self.pool.lock:
+                self.pool.evict(context)
+            self.pool.flush()
+        self.assertEqual(self.pool.stats()["unsaved"], 1)
+        self.assertNotIn(1, Model.load(self.pool.model_filename(context)).y_all)
+
+        # the change is served from memory, not lost, and written on the next flush
+        self.assertIn(1, self.pool[context].y_all)
+        self.pool.flush()
+        self.assertEqual(self.pool.stats()["unsaved"], 0)
+        self.assertIn(1, Model.load(self.pool.model_filename(context)).y_all)
+        self.assertFalse(self.pool[context].dirty)
+
+    def test_protected_segment_demotion(self):
+        with mock.patch.dict(model_pool.CONFIG, eviction_policy="slru", priority_queue_cap=5):
+            self.pool.queue, self.pool.capacity = self.pool.new_queue(), 5
+        self.assertEqual(self.pool.queue.protected_capacity, 4)
+
+        for context in self.contexts:
+            with self.pool.GetModel(context, True):
+                pass
+
+        # every selection promotes its model, the protected segment demotes the least recent
+        self.assertEqual(list(self.pool.queue.protected), self.contexts[2:])
+        self.assertEqual(list(self.pool.queue.items), [self.contexts[1]])
+        self.assertFalse(self.pool.is_cached(self.contexts[0]))
+
+    def test_convert_legacy_model(self):
+        legacy = Model()
+        legacy.x_all, legacy.y_all = ["good evening good night", "what time is it"], [7, 8]
+        joblib.dump(legacy, f"{self.storage_dir.name}/legacy{model_pool.LEGACY_SUFFIX}")
+        self.contexts.append("legacy")
+
+        self.pool.register_all_stored()
+        self.assertEqual(self.pool.model_states["legacy"], ModelState.STORED)
+        self.assertFalse(os.path.exists(f"{self.storage_dir.name}/legacy{model_pool.LEGACY_SUFFIX}"))
+        self.assertEqual(self.pool["legacy"].predict("time please")[0][0], 8)
@@ -0,0 +1,86 @@
+# standard imports
+import threading
+import unittest
+# third party imports
+
+# local imports
+from src.core_intent_matcher.persister import Persister
+
+class TestPersister(unittest.TestCase):
+
+    def setUp(self):
+        self.persister = Persister(threads=2, capacity=10)
+        self.written = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def blocked_write(self, key, value):
+        def write():
+            self.started.set()
+            self.release.wait()
+            self.written.append((key, value))
+        return write
+
+    def test_coalesces_pending_writes(self):
+        # the first write blocks its worker, so the next ones stay pending
+        self.persister.submit("a", self.blocked_write("a", 0))
+        self.started.wait()
+        for value in range(1, 4):
+            self.persister.submit("a", self.blocked_write("a", value))
+        self.release.set()
+        self.persister.flush()
+
+        self.assertEqual(self.written, [("a", 0), ("a", 3)])
+        self.assertEqual(self.persister.stats()["coalesced"], 2)
+        self.assertEqual(self.persister.stats()["queue_depth"], 0)
+
+    def test_wait(self):
+        self.persister.submit("a", self.blocked_write("a", 0))
+        threading.Timer(0.05, self.release.set).start()
+        self.persister.wait("a")
+
+        self.assertEqual(self.written, [("a", 0)])
+
+    def test_discard(self):
+        self.persister.submit("a", self.blocked_write("a", 0))
+        self.started.wait()
+        self.persister.submit("a", self.blocked_write("a", 1))
+        threading.Timer(0.05, self.release.set).start()
+        self.persister.discard("a")
+        self.persister.flush()
+
+        self.assertEqual(self.written, [("a", 0)])
+
+    def test_discard_wakes_waiters(self):
+        # the only worker is busy with "b", so the write of "a" stays pending
+        persister = Persister(threads=1, capacity=10)
+        self.addCleanup(self.release.set)
+        persister.submit("b", self.blocked_write("b", 0))
+        self.started.wait()
+        persister.submit("a", self.blocked_write("a", 0))
+        waiter = threading.Thread(target=persister.wait, args=("a",), daemon=True)
+        waiter.start()
+
+        persister.discard("a")
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.release.set()
+        persister.flush()
+        self.assertEqual(self.written, [("b", 0)])
+
+    def test_errors(self):
+        def failing_write():
+            raise OSError("disk full")
+        self.persister.submit("a", failing_write)
+        self.persister.flush()
+
+        self.assertEqual(self.persister.stats()["errors"], 1)
+        self.assertIn("disk full", self.persister.stats()["last_error"])
+
+    def test_synchronous(self):
+        persister = Persister(threads=0, capacity=10)
+        self.release.set()
+        persister.submit("a", self.blocked_write("a", 0))
+
+        self.assertEqual(self.written, [("a", 0)])
+        self.assertEqual(persister.stats()["writes"], 1)
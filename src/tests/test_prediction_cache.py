@@ -0,0 +1,65 @@
+# standard imports
+import unittest
+# third party imports
+
+# local imports
+from src.core_intent_matcher.prediction_cache import PredictionCache
+import src.common as common
+
+def make_prediction(intentID:int)->common.Prediction:
+    return common.Prediction(intentID, ["hi"], "self", "model", 0.9, [(intentID, 0.9)])
+
+class TestPredictionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = PredictionCache()
+        self.cache.__init__() # the cache is a singleton, so reset it between tests
+
+    def test_normalized_hit(self):
+        self.cache.put("What is  the time", "initial", make_prediction(1))
+
+        self.assertEqual(self.cache.get("what is the time ", "initial"), make_prediction(1))
+        self.assertIsNone(self.cache.get("what is the time", "popcorn"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_invalidate(self):
+        self.cache.put("hello", "initial", make_prediction(1))
+        self.cache.put("hello", "popcorn", make_prediction(2))
+        self.cache.invalidate("initial", 2)
+
+        self.assertIsNone(self.cache.get("hello", "initial"))
+        self.assertEqual(self.cache.get("hello", "popcorn"), make_prediction(2))
+
+    def test_capacity(self):
+        self.cache.capacity = 2
+        for i in range(3):
+            self.cache.put(str(i), "initial", make_prediction(i))
+
+        self.assertIsNone(self.cache.get("0", "initial"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        self.cache.ttl = -1
+        self.cache.put("hello", "initial", make_prediction(1))
+
+        self.assertIsNone(self.cache.get("hello", "initial"))
+
+    def test_put_outdated_version(self):
+        self.cache.invalidate("initial", 3)
+        self.cache.put("hello", "initial", make_prediction(1), 2)
+        self.assertIsNone(self.cache.get("hello", "initial"))
+
+        self.cache.put("hello", "initial", make_prediction(1), 3)
+        self.assertEqual(self.cache.get("hello", "initial"), make_prediction(1))
+
+        self.cache.clear(5)
+        self.cache.put("hello", "popcorn", make_prediction(2), 4)
+        self.assertIsNone(self.cache.get("hello", "popcorn"))
+
+    def test_put_after_readd(self):
+        self.cache.invalidate("initial", 4)
+        self.cache.invalidate("initial") # removed
+        self.cache.invalidate("initial", 1) # added back with a new model
+        self.cache.put("hello", "initial", make_prediction(1), 4) # late put of the removed model
+        self.assertIsNone(self.cache.get("hello", "initial"))
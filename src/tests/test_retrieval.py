@@ -0,0 +1,123 @@
+# standard imports
+import csv
+import json
+import unittest
+from unittest import mock
+# third party imports
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+# local imports
+from src.core_intent_matcher.retrieval import TopKRetriever, InvertedIndexRetriever, top_k_indices
+from src.core_intent_matcher.model import Model, CONFIG, make_retriever
+
+class TestTopKIndices(unittest.TestCase):
+
+    def test_descending_order(self):
+        scores = np.array([0.1, 0.9, 0.3, 0.7, 0.5])
+
+        self.assertEqual(top_k_indices(scores, 3).tolist(), [1, 3, 4])
+
+    def test_k_beyond_length(self):
+        scores = np.array([0.2, 0.6, 0.4])
+
+        self.assertEqual(top_k_indices(scores, 10).tolist(), [1, 2, 0])
+
+class TestTopKRetriever(unittest.TestCase):
+
+    ROWS = 200
+    COLS = 50
+    K = 5
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.matrix = sparse.random(self.ROWS, self.COLS, density=0.1, format='csr', random_state=rng)
+        self.queries = sparse.random(10, self.COLS, density=0.2, format='csr', random_state=rng)
+        self.labels = list(range(1000, 1000 + self.ROWS))
+
+    def test_matches_brute_force(self):
+        retriever = TopKRetriever(self.matrix.copy(), self.labels)
+        similarities = cosine_similarity(self.queries, self.matrix)
+
+        for query_sims, result in zip(similarities, retriever.top_k(self.queries, self.K)):
+            expected = np.sort(query_sims)[::-1][:self.K]
+            self.assertEqual(len(result), self.K)
+            np.testing.assert_allclose([sim for _, sim in result], expected)
+            for label, sim in result:
+                self.assertAlmostEqual(query_sims[label - 1000], sim)
+
+    def test_labels_are_python_ints(self):
+        retriever = TopKRetriever(self.matrix.copy(), self.labels)
+        label, sim = retriever.top_k(self.queries[0], self.K)[0][0]
+
+        self.assertIs(type(label), int)
+        self.assertIs(type(sim), float)
+
+class TestInvertedIndexRetriever(unittest.TestCase):
+
+    ROWS = 300
+    COLS = 80
+    K = 5
+    EVAL_FILE = "eval/eval_0.csv"
+    INTENTS_FILE = "data/compiled.json"
+    EVAL_CONTEXT = "movie_trivia"
+
+    def assert_same_ranking(self, expected:list, actual:list):
+        self.assertEqual(len(expected), len(actual))
+        for expected_intents, actual_intents in zip(expected, actual):
+            expected_sims = [sim for _, sim in expected_intents]
+            np.testing.assert_allclose([sim for _, sim in actual_intents], expected_sims, atol=1e-6)
+            # the labels must agree wherever the similarity is not tied
+            for (expected_label, sim), (actual_label, _) in zip(expected_intents, actual_intents):
+                if sim > 0 and expected_sims.count(sim) == 1:
+                    self.assertEqual(actual_label, expected_label)
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        matrix = sparse.random(self.ROWS, self.COLS, density=0.05, format='csr', random_state=rng)
+        queries = sparse.random(50, self.COLS, density=0.05, format='csr', random_state=rng)
+        labels = list(range(self.ROWS))
+
+        expected = TopKRetriever(matrix.copy(), labels).top_k(queries, self.K)
+        for max_score in (False, True):
+            actual = InvertedIndexRetriever(matrix.copy(), labels, max_score=max_score).top_k(queries, self.K)
+            self.assert_same_ranking(expected, actual)
+
+    def train(self, **config)->tuple:
+        with open(self.INTENTS_FILE) as f:
+            topics = json.load(f)["data"]
+        intents = next(topic["intents"] for topic in topics if topic["context"] == self.EVAL_CONTEXT)
+        with open(self.EVAL_FILE) as f:
+            questions = [row["question"] for row in csv.DictReader(f)]
+
+        with mock.patch.dict(CONFIG, config):
+            model = Model()
+            model.prepare_data([(i, attr["matches"]) for i, attr in enumerate(intents.values())])
+            model.train_and_test()
+        return model, model.tfidf_vectorizer.transform(questions)
+
+    def test_eval_questions(self):
+        model, queries = self.train()
+
+        expected = TopKRetriever(model.tfidf_matrix, model.y_all, True).top_k(queries, self.K)
+        for max_score in (False, True):
+            actual = InvertedIndexRetriever(model.tfidf_matrix, model.y_all, True, max_score).top_k(queries, self.K)
+            self.assert_same_ranking(expected, actual)
+
+    def test_hashed_model(self):
+        model, queries = self.train(features="hashing", retriever="inverted_index")
+        self.assertIsInstance(model.retriever, InvertedIndexRetriever)
+
+        expected = TopKRetriever(model.tfidf_matrix, model.y_all, True).top_k(queries, self.K)
+        for max_score in (False, True):
+            actual = InvertedIndexRetriever(model.tfidf_matrix, model.y_all, True, max_score).top_k(queries, self.K)
+            self.assert_same_ranking(expected, actual)
+
+        # models hashed with signed counts are scored by brute force
+        signed, _ = self.train(features="hashing", retriever="brute_force")
+        self.assertTrue((signed.tfidf_matrix.data < 0).any())
+        with self.assertRaises(ValueError):
+            InvertedIndexRetriever(signed.tfidf_matrix, signed.y_all, True)
+        with mock.patch.dict(CONFIG, retriever="inverted_index"):
+            self.assertNotIsInstance(make_retriever(signed.tfidf_matrix, signed.y_all, True), InvertedIndexRetriever)
@@ -0,0 +1,82 @@
+# standard imports
+import unittest
+# third party imports
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+# local imports
+from src.core_intent_matcher.tfidf import IncrementalTfidf, HashingTfidf
+
+def analyzer(doc):
+    return doc.lower().split()
+
+class TestIncrementalTfidf(unittest.TestCase):
+
+    DOCS = [
+        "what is the time",
+        "do you know the time please",
+        "what is the meaning of life",
+        "book me a movie ticket",
+        "who played the joker",
+        "who directed citizen kane",
+    ]
+    QUERIES = ["what is the time", "who played kane", "movie ticket please", "unknown words only"]
+
+    def make_tfidf(self)->IncrementalTfidf:
+        return IncrementalTfidf(analyzer)
+
+    def assert_same_similarities(self, tfidf:IncrementalTfidf, docs:list):
+        reference = TfidfVectorizer(analyzer=analyzer)
+        expected = cosine_similarity(reference.fit(docs).transform(self.QUERIES), reference.transform(docs))
+        actual = (tfidf.transform(self.QUERIES) @ tfidf.tfidf_matrix().T).toarray()
+
+        np.testing.assert_allclose(actual, expected, atol=1e-12)
+
+    def test_fit_matches_sklearn(self):
+        tfidf = self.make_tfidf()
+        tfidf.fit_transform(self.DOCS)
+
+        self.assert_same_similarities(tfidf, self.DOCS)
+
+    def test_add_rows(self):
+        tfidf = self.make_tfidf()
+        tfidf.fit_transform(self.DOCS[:2])
+        tfidf.add_rows(self.DOCS[2:])
+
+        self.assert_same_similarities(tfidf, self.DOCS)
+
+    def test_extend_rows(self):
+        tfidf = self.make_tfidf()
+        tfidf.fit_transform(self.DOCS)
+        tfidf.extend_rows([1, 4, 1], ["what hour is it", "the joker in batman", "tell me the time"])
+
+        expected_docs = list(self.DOCS)
+        expected_docs[1] += " what hour is it tell me the time"
+        expected_docs[4] += " the joker in batman"
+        self.assert_same_similarities(tfidf, expected_docs)
+
+    def test_remove_rows(self):
+        tfidf = self.make_tfidf()
+        tfidf.fit_transform(self.DOCS)
+        tfidf.remove_rows([0, 3])
+
+        self.assert_same_similarities(tfidf, [doc for i, doc in enumerate(self.DOCS) if i not in (0, 3)])
+
+class TestHashingTfidf(TestIncrementalTfidf):
+    """runs the tests of IncrementalTfidf with enough hashed features for
+    the test terms not to collide, in which case the signs cancel out in
+    every product and the similarities are exact
+    """
+
+    N_FEATURES = 2 ** 20
+
+    def make_tfidf(self)->IncrementalTfidf:
+        return HashingTfidf(analyzer, self.N_FEATURES)
+
+    def test_no_vocabulary(self):
+        tfidf = self.make_tfidf()
+        tfidf.fit_transform(self.DOCS)
+
+        self.assertEqual(tfidf.vocabulary_, {})
+        self.assertEqual(tfidf.tfidf_matrix().shape, (len(self.DOCS), self.N_FEATURES))
@@ -1,15 +1,24 @@
 import os
+import shutil
 from src.db_client import DB_Client
+import src.common as common
+
+CONFIG = common.CONFIG["model"]
 
 if __name__ == "__main__":
-    dir_list = os.listdir("models")
+    dir_list = os.listdir(CONFIG["storage_dir"])
     
     for filename in dir_list:
-        if filename[-7:] == ".joblib":
-            os.remove("models/" + filename)
+        filepath = CONFIG["storage_dir"] + "/" + filename
+        if filename.endswith(CONFIG["file_suffix"]):
+            shutil.rmtree(filepath)
+        elif filename.endswith(".joblib"): # models stored before the compact format
+            os.remove(filepath)
+        elif filename == CONFIG["stem_cache_file"]:
+            os.remove(filepath)
     
     db_client =  DB_Client()
 
-    tables = ["skills", "intents", "users", "global_vars"]
+    tables = ["skills", "intent_matches", "intent_responses", "intents", "users", "global_vars"]
     for table in tables:
         db_client.drop_table(table)
\ No newline at end of file